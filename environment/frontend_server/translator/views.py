@@ -202,6 +202,15 @@ def replay_persona_state(request, sim_code, step, persona_name):
   with open(memory + "/associative_memory/nodes.json") as json_file:  
     associative = json.load(json_file)
 
+  # The latest events that the persona remembers perceiving (see 
+  # RecentEventWindow in associative_memory.py), newest first. Older saves
+  # do not have them. 
+  a_mem_recent = []
+  if os.path.exists(memory + "/associative_memory/recent_events.json"): 
+    with open(memory + "/associative_memory/recent_events.json") as json_file:
+      recent_events = json.load(json_file)
+    a_mem_recent = recent_events.get(str(scratch["retention"]), [])
+
   a_mem_event = []
   a_mem_chat = []
   a_mem_thought = []
@@ -225,6 +234,7 @@ def replay_persona_state(request, sim_code, step, persona_name):
              "persona_name_underscore": persona_name_underscore, 
              "scratch": scratch,
              "spatial": spatial,
+             "a_mem_recent": a_mem_recent,
              "a_mem_event": a_mem_event,
              "a_mem_chat": a_mem_chat,
              "a_mem_thought": a_mem_thought}
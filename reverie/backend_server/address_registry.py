@@ -0,0 +1,239 @@
+"""
+Author: irrealis (irrealis.chomp@gmail.com)
+
+File: address_registry.py
+Description: Defines the AddressRegistry class, which interns the colon-joined
+address strings of the world (e.g., "the Ville:Hobbs Cafe:cafe:counter") and
+the special addresses of plans (e.g., "<persona> Maria Lopez") once, along
+with their parsed form. Equal addresses then share a single string object,
+so comparing them is an identity check, and their levels, markers and ids
+are looked up instead of being re-parsed on every step. AddressDict is a
+dictionary keyed on the ids of the addresses, e.g., Maze.address_tiles.
+"""
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+from collections.abc import MutableMapping
+
+
+# <address_markers> are the markers that plans put in an address instead of
+# (or in place of the last part of) a world address.
+# e.g., "<persona> Maria Lopez", "<waiting> 58 9",
+#       "the Ville:Hobbs Cafe:cafe:<random>", "<spawn_loc>bedroom-2-a"
+address_markers = ["<persona>", "<waiting>", "<random>", "<spawn_loc>"]
+# Addresses with one of the <transient_markers> are never registered, since
+# there is a different one for every tile a persona waits at. They are parsed
+# whenever they are looked up instead. 
+transient_markers = ["<waiting>"]
+
+# <address_levels> maps a level name to the number of address parts it has.
+address_levels = {"world": 1, "sector": 2, "arena": 3, "game_object": 4,
+                  "game object": 4}
+
+
+class AddressRegistry:
+  def __init__(self):
+    # <addresses> is the list of interned address strings; an address' id is
+    # its index. <address_ids> maps each address string back to its id.
+    self.addresses = []
+    self.address_ids = dict()
+    # <address_parts> holds the parsed (colon-split) tuple of each address,
+    # <address_kinds> the marker it contains ("" if none), and
+    # <address_targets> what follows the marker (e.g., the persona name of
+    # "<persona> Maria Lopez"; "" if there is none).
+    self.address_parts = []
+    self.address_kinds = []
+    self.address_targets = []
+
+
+  def parse(self, address):
+    """
+    Parses an address into its (parts, kind, target) form (see __init__).
+    """
+    kind = ""
+    for marker in address_markers:
+      if marker in address:
+        kind = marker
+        break
+    target = ""
+    if kind:
+      target = address.split(kind)[-1].strip()
+    return tuple(address.split(":")), kind, target
+
+
+  def intern(self, address):
+    """
+    Registers an address (if it is new) and returns its id.
+
+    INPUT:
+      address: An address string. e.g., "the Ville:Hobbs Cafe:cafe"
+    OUTPUT:
+      The int id of the address.
+    """
+    address_id = self.address_ids.get(address)
+    if address_id is not None:
+      return address_id
+    address_id = len(self.addresses)
+    parts, kind, target = self.parse(address)
+    self.address_ids[address] = address_id
+    self.addresses += [address]
+    self.address_parts += [parts]
+    self.address_kinds += [kind]
+    self.address_targets += [target]
+    return address_id
+
+
+  def get_id(self, address):
+    """
+    Returns the id of an address, registering it first if needed, or None
+    for a transient address. 
+    """
+    address_id = self.address_ids.get(address)
+    if address_id is not None:
+      return address_id
+    for marker in transient_markers:
+      if marker in address:
+        return None
+    return self.intern(address)
+
+
+  def intern_address(self, address):
+    """
+    Returns the shared string object of an address, registering it first if
+    needed. None, and transient addresses, are returned as they are.
+    """
+    if address is None:
+      return None
+    address_id = self.get_id(address)
+    if address_id is None:
+      return address
+    return self.addresses[address_id]
+
+
+  def get_parts(self, address):
+    address_id = self.get_id(address)
+    if address_id is None:
+      return self.parse(address)[0]
+    return self.address_parts[address_id]
+
+
+  def get_kind(self, address):
+    """
+    Returns the marker that an address contains, e.g., "<persona>", or ""
+    for a plain world address.
+    """
+    address_id = self.get_id(address)
+    if address_id is None:
+      return self.parse(address)[1]
+    return self.address_kinds[address_id]
+
+
+  def get_target(self, address):
+    """
+    Returns what follows the marker of an address.
+    e.g., "Maria Lopez" for "<persona> Maria Lopez", "58 9" for
+    "<waiting> 58 9"
+    """
+    address_id = self.get_id(address)
+    if address_id is None:
+      return self.parse(address)[2]
+    return self.address_targets[address_id]
+
+
+  def get_level(self, address, level):
+    """
+    Returns the (interned) prefix of an address at a level.
+
+    INPUT:
+      address: An address string.
+      level: world, sector, arena, or game_object
+    OUTPUT:
+      e.g., "the Ville:Hobbs Cafe:cafe" for level "arena" of
+      "the Ville:Hobbs Cafe:cafe:<random>"
+    """
+    parts = self.get_parts(address)
+    return self.intern_address(":".join(parts[:address_levels[level]]))
+
+
+class AddressDict(MutableMapping):
+  """
+  A dictionary whose keys are addresses. The values are stored by address 
+  id, so the key strings are not kept a second time, and code that already
+  has an id can look it up with get_by_id(). Iterating over it yields the 
+  interned address strings. It is pickled as its (address, value) pairs, 
+  since ids are only valid in the process that registered them. 
+  """
+  def __init__(self, items=()):
+    # <values_by_id> maps the address ids to the values.
+    self.values_by_id = dict()
+    self.update(items)
+
+
+  def __getitem__(self, address):
+    address_id = address_registry.address_ids.get(address)
+    if address_id is None or address_id not in self.values_by_id:
+      raise KeyError(address)
+    return self.values_by_id[address_id]
+
+
+  def __setitem__(self, address, value):
+    self.values_by_id[address_registry.intern(address)] = value
+
+
+  def __delitem__(self, address):
+    address_id = address_registry.address_ids.get(address)
+    if address_id is None or address_id not in self.values_by_id:
+      raise KeyError(address)
+    del self.values_by_id[address_id]
+
+
+  def __contains__(self, address):
+    return address_registry.address_ids.get(address) in self.values_by_id
+
+
+  def __iter__(self):
+    for address_id in self.values_by_id:
+      yield address_registry.addresses[address_id]
+
+
+  def __len__(self):
+    return len(self.values_by_id)
+
+
+  def __reduce__(self):
+    return (AddressDict, (list(self.items()),))
+
+
+  def get_by_id(self, address_id, default=None):
+    return self.values_by_id.get(address_id, default)
+
+
+# <address_registry> is the registry that the whole backend shares, so that
+# the addresses of the maze, of the personas' plans, and of their scratch
+# are all the same objects.
+address_registry = AddressRegistry()
+
+
+def intern_address(address):
+  return address_registry.intern_address(address)
+
+
+def get_address_id(address):
+  return address_registry.get_id(address)
+
+
+def get_address_parts(address):
+  return address_registry.get_parts(address)
+
+
+def get_address_kind(address):
+  return address_registry.get_kind(address)
+
+
+def get_address_target(address):
+  return address_registry.get_target(address)
+
+
+def get_address_level(address, level):
+  return address_registry.get_level(address, level)
@@ -15,6 +15,7 @@ import sys
 import numpy
 import math
 import shutil, errno
+import hashlib
 
 from os import listdir
 
@@ -185,6 +186,30 @@ def find_filenames(path_to_dir, suffix=".csv"):
            for filename in filenames if filename.endswith( suffix ) ]
 
 
+def hash_folder(path_to_dir, suffixes=(".csv", ".json")): 
+  """
+  Computes a content hash of all files in a directory (recursively) that end
+  with one of the provided suffixes. Both the relative file paths and their
+  contents go into the hash, so renaming or editing any file changes it. 
+  ARGS:
+    path_to_dir: Path to the directory to hash. 
+    suffixes: A tuple of file suffixes to include. 
+  RETURNS: 
+    A hex digest string. 
+  """
+  sha = hashlib.sha1()
+  for root, dirs, files in os.walk(path_to_dir): 
+    dirs.sort()
+    for filename in sorted(files): 
+      if not filename.endswith(suffixes): 
+        continue
+      curr_file = os.path.join(root, filename)
+      sha.update(os.path.relpath(curr_file, path_to_dir).encode("utf-8"))
+      with open(curr_file, "rb") as f: 
+        sha.update(f.read())
+  return sha.hexdigest()
+
+
 def average(list_of_val): 
   """
   Finds the average of the numbers in a list.
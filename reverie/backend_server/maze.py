@@ -11,17 +11,101 @@ import datetime
 import pickle
 import time
 import math
+import os
 
 from global_methods import *
 from utils import *
+from path_engine import *
+from region_graph import *
+from address_registry import *
+from maze_chunks import *
+
+# <compiled_maze_format> is bumped whenever the contents of the compiled maze
+# artifact change, so that artifacts written before that are rebuilt. 
+compiled_maze_format = 4
 
 class Maze: 
   def __init__(self, maze_name): 
-    # READING IN THE BASIC META INFORMATION ABOUT THE MAP
     self.maze_name = maze_name
+    # <matrix_loc> is the folder of the csv exports of this maze's Tiled map.
+    self.matrix_loc = f"{maze_assets_loc}/{maze_name}/matrix"
+    if not os.path.isdir(self.matrix_loc): 
+      self.matrix_loc = env_matrix
+    # <matrix_hash> is a content hash of the matrix folder. It keys the 
+    # on-disk caches that are derived from the map, so that they go stale as
+    # soon as the map is edited. 
+    self.matrix_hash = hash_folder(self.matrix_loc)
+
+    # READING IN THE MAP
+    # The map is compiled from the csv exports of the Tiled map only once. 
+    # The result is saved as a binary artifact keyed by <matrix_hash> (see
+    # save_compiled_maze), which later runs on the same map load instead.
+    # <self.event_buckets> is the spatial index of the tiles that have 
+    # events. It maps (arena address id, bucket x, bucket y) keys to the
+    # set of such tiles in that arena and in that <event_bucket_size> square
+    # of the map, so that the events around a persona can be found without
+    # walking every tile in its vision (see get_nearby_events). 
+    self.event_bucket_size = 8
+    self.event_buckets = dict()
+    # <self.subject_events> indexes the events by their subject: it maps each
+    # subject to a dictionary of the tiles it has events on and those events. 
+    # This lets us find and remove a subject's events without scanning the 
+    # events of its tiles. 
+    # e.g., self.subject_events["Isabella Rodriguez"] == 
+    #         {(72, 14): {('Isabella Rodriguez', 'is', 'sleeping', 
+    #                      'sleeping')}}
+    self.subject_events = dict()
+    # <self._collision_maze> is the legacy list form of the collision map. It
+    # is only built if something asks for self.collision_maze. 
+    self._collision_maze = None
+    # <self._tile_details> maps the tuple of the layer values of a tile to 
+    # its access_tile() dictionary without the events. There are only as 
+    # many of them as there are distinct kinds of tiles, so they are built 
+    # once and shared. <self._chunk_tile_details> maps the key of each 
+    # loaded chunk to the list of those dictionaries for its tiles, row by 
+    # row (see get_chunk_tile_details). 
+    self._tile_details = dict()
+    self._chunk_tile_details = dict()
+    if not self.load_compiled_maze(): 
+      self.compile_maze()
+      self.save_compiled_maze()
+
+    # <path_engine> is the PathEngine of this maze's collision map. It holds
+    # a compact collision grid and answers the path queries that the personas
+    # make when executing their actions. 
+    self.path_engine = PathEngine(self.tile_layers["collision"], 
+                                  collision_block_id)
+
+    # Distance fields. 
+    # <self.distance_fields> -- given a string address in 
+    # <self.address_tiles>, we return the BFS distance field of its tiles 
+    # (see PathEngine.distance_field). With it, the path from any tile to the
+    # nearest tile of an address is a plain array walk, which is how 
+    # execute() takes personas to their action addresses. The fields are 
+    # precomputed here and persisted by save_distance_fields(), so that later
+    # runs on the same map just load them. Maps that plan on the region graph
+    # are too large to keep a field per address, and do not use them. 
+    self.distance_fields = dict()
+    self.use_distance_fields = (self.maze_width * self.maze_height 
+                                < hierarchical_path_min_tiles)
+    if self.use_distance_fields: 
+      self.load_distance_fields()
+      self.precompute_distance_fields()
+    # <self.region_graph> is the portal graph between the map's sectors and
+    # arenas (see region_graph.py). It is only built when first needed. 
+    self.region_graph = None
+
+
+  def compile_maze(self): 
+    """
+    Builds the maze from the csv exports of the Tiled map in <matrix_loc>: 
+    the meta information, the tile layers (the collision map included), the
+    default game object events, and <address_tiles>. 
+    """
+    # READING IN THE BASIC META INFORMATION ABOUT THE MAP
     # Reading in the meta information about the world. If you want tp see the
     # example variables, check out the maze_meta_info.json file. 
-    meta_info = json.load(open(f"{env_matrix}/maze_meta_info.json"))
+    meta_info = json.load(open(f"{self.matrix_loc}/maze_meta_info.json"))
     # <maze_width> and <maze_height> denote the number of tiles make up the 
     # height and width of the map. 
     self.maze_width = int(meta_info["maze_width"])
@@ -45,7 +129,7 @@ class Maze:
     # Tiled export. Then we basically have the block path: 
     # World, Sector, Arena, Game Object -- again, these paths need to be 
     # unique within an instance of Reverie. 
-    blocks_folder = f"{env_matrix}/special_blocks"
+    blocks_folder = f"{self.matrix_loc}/special_blocks"
 
     _wb = blocks_folder + "/world_blocks.csv"
     wb_rows = read_file_to_list(_wb, header=False)
@@ -74,7 +158,7 @@ class Maze:
     # [SECTION 3] Reading in the matrices 
     # This is your typical two dimensional matrices. It's made up of 0s and 
     # the number that represents the color block from the blocks folder. 
-    maze_folder = f"{env_matrix}/maze"
+    maze_folder = f"{self.matrix_loc}/maze"
 
     _cm = maze_folder + "/collision_maze.csv"
     collision_maze_raw = read_file_to_list(_cm, header=False)[0]
@@ -91,118 +175,226 @@ class Maze:
     # Tiled maps. They should be in csv format. 
     # Importantly, they are "not" in a 2-d matrix format -- they are single 
     # row matrices with the length of width x height of the maze. So we need
-    # to convert here. 
+    # to convert them, which the tile layers below do. 
     # We can do this all at once since the dimension of all these matrices are
     # identical (e.g., 70 x 40).
     # example format: [['0', '0', ... '25309', '0',...], ['0',...]...]
     # 25309 is the collision bar number right now.
-    self.collision_maze = []
-    sector_maze = []
-    arena_maze = []
-    game_object_maze = []
-    spawning_location_maze = []
-    for i in range(0, len(collision_maze_raw), meta_info["maze_width"]): 
-      tw = meta_info["maze_width"]
-      self.collision_maze += [collision_maze_raw[i:i+tw]]
-      sector_maze += [sector_maze_raw[i:i+tw]]
-      arena_maze += [arena_maze_raw[i:i+tw]]
-      game_object_maze += [game_object_maze_raw[i:i+tw]]
-      spawning_location_maze += [spawning_location_maze_raw[i:i+tw]]
-
-    # Once we are done loading in the maze, we now set up self.tiles. This is
-    # a matrix accessed by row:col where each access point is a dictionary
-    # that contains all the things that are taking place in that tile. 
-    # More specifically, it contains information about its "world," "sector,"
-    # "arena," "game_object," "spawning_location," as well as whether it is a
-    # collision block, and a set of all events taking place in it. 
-    # e.g., self.tiles[32][59] = {'world': 'double studio', 
-    #            'sector': '', 'arena': '', 'game_object': '', 
-    #            'spawning_location': '', 'collision': False, 'events': set()}
-    # e.g., self.tiles[9][58] = {'world': 'double studio', 
-    #         'sector': 'double studio', 'arena': 'bedroom 2', 
-    #         'game_object': 'bed', 'spawning_location': 'bedroom-2-a', 
-    #         'collision': False,
-    #         'events': {('double studio:double studio:bedroom 2:bed',
-    #                    None, None)}} 
-    self.tiles = []
-    for i in range(self.maze_height): 
-      row = []
-      for j in range(self.maze_width):
-        tile_details = dict()
-        tile_details["world"] = wb
-        
-        tile_details["sector"] = ""
-        if sector_maze[i][j] in sb_dict: 
-          tile_details["sector"] = sb_dict[sector_maze[i][j]]
-        
-        tile_details["arena"] = ""
-        if arena_maze[i][j] in ab_dict: 
-          tile_details["arena"] = ab_dict[arena_maze[i][j]]
-        
-        tile_details["game_object"] = ""
-        if game_object_maze[i][j] in gob_dict: 
-          tile_details["game_object"] = gob_dict[game_object_maze[i][j]]
-        
-        tile_details["spawning_location"] = ""
-        if spawning_location_maze[i][j] in slb_dict: 
-          tile_details["spawning_location"] = slb_dict[spawning_location_maze[i][j]]
-        
-        tile_details["collision"] = False
-        if self.collision_maze[i][j] != "0": 
-          tile_details["collision"] = True
-
-        tile_details["events"] = set()
-        
-        row += [tile_details]
-      self.tiles += [row]
+    # Once we are done loading in the maze, we now set up the tile layers. 
+    # Every tile has a "world," "sector," "arena," "game_object," and 
+    # "spawning_location" level, and is either a collision block or not. 
+    # Rather than keeping a dictionary per tile, we intern the strings of 
+    # each level: <self.tile_strings[level]> is the list of its strings (id 0
+    # is always ""), and <self.tile_layers[level]> is an int32 array accessed
+    # by [row, col] (i.e., [y, x]) that holds the string id of every tile.
+    # <self.tile_layers["collision"]> holds the collision block id of every
+    # tile (0 if it is not a collision block). 
+    # e.g., self.tile_strings["arena"][self.tile_layers["arena"][9, 58]]
+    #         == 'bedroom 2'
+    # Use access_tile() for the old per-tile dictionary view. 
+    self.tile_levels = ["world", "sector", "arena", "game_object", 
+                        "spawning_location"]
+    shape = (self.maze_height, self.maze_width)
+    self.tile_strings = {"world": ["", wb]}
+    self.tile_string_ids = {"world": {"": 0, wb: 1}}
+    self.tile_layers = {"world": numpy.ones(shape, dtype=numpy.int32)}
+    for level, level_maze_raw, block_dict in [
+        ("sector", sector_maze_raw, sb_dict), 
+        ("arena", arena_maze_raw, ab_dict), 
+        ("game_object", game_object_maze_raw, gob_dict), 
+        ("spawning_location", spawning_location_maze_raw, slb_dict)]: 
+      strings = [""]
+      string_ids = {"": 0}
+      # <block_ids> maps each color block number of the level to the id of
+      # its string. 
+      block_ids = dict()
+      for block, string in block_dict.items(): 
+        if string not in string_ids: 
+          string_ids[string] = len(strings)
+          strings += [string]
+        block_ids[block] = string_ids[string]
+      self.tile_strings[level] = strings
+      self.tile_string_ids[level] = string_ids
+      self.tile_layers[level] = (numpy.array([block_ids.get(i, 0) 
+                                              for i in level_maze_raw], 
+                                             dtype=numpy.int32)
+                                 .reshape(shape))
+    self.tile_layers["collision"] = (numpy.array(collision_maze_raw, 
+                                                 dtype=numpy.int32)
+                                     .reshape(shape))
+
+    # Tile addresses. 
+    # <self.tile_addresses> is the list of the distinct addresses that the 
+    # tiles have at the world, sector, arena, and game object levels (id 0 is
+    # the world), interned in the shared address registry. 
+    # <self.tile_layers[f"{level}_address"]> holds the id of every tile's 
+    # address at that level, so that get_tile_path() is a lookup rather than
+    # a string join. 
+    # e.g., self.tile_addresses[self.tile_layers["arena_address"][9, 58]]
+    #         == 'double studio:double studio:bedroom 2'
+    self.tile_addresses = [intern_address(wb)]
+    tile_address_ids = {wb: 0}
+    parent_ids = numpy.zeros(shape, dtype=numpy.int32)
+    for level in ["sector", "arena", "game_object"]: 
+      # Every distinct (parent address, string) pair of the level is one 
+      # address. 
+      strings = self.tile_strings[level]
+      keys = (parent_ids.astype(numpy.int64) * len(strings) 
+              + self.tile_layers[level]).ravel()
+      unique_keys, inverse = numpy.unique(keys, return_inverse=True)
+      address_ids = []
+      for key in unique_keys: 
+        parent_id, string_id = divmod(int(key), len(strings))
+        address = f"{self.tile_addresses[parent_id]}:{strings[string_id]}"
+        if address not in tile_address_ids: 
+          tile_address_ids[address] = len(self.tile_addresses)
+          self.tile_addresses += [intern_address(address)]
+        address_ids += [tile_address_ids[address]]
+      parent_ids = (numpy.array(address_ids, dtype=numpy.int32)[inverse]
+                    .reshape(shape))
+      self.tile_layers[f"{level}_address"] = parent_ids
+
+    # <self.tile_events> is the sparse event store: it maps the (x, y) tiles 
+    # that have any events taking place in them to the set of those events. 
+    # Tiles without events are not in it. 
+    # e.g., self.tile_events[(58, 9)] == 
+    #         {('double studio:double studio:bedroom 2:bed', None, None, None)}
+    self.tile_events = dict()
     # Each game object occupies an event in the tile. We are setting up the 
     # default event value here. 
-    for i in range(self.maze_height):
-      for j in range(self.maze_width): 
-        if self.tiles[i][j]["game_object"]:
-          object_name = ":".join([self.tiles[i][j]["world"], 
-                                  self.tiles[i][j]["sector"], 
-                                  self.tiles[i][j]["arena"], 
-                                  self.tiles[i][j]["game_object"]])
-          go_event = (object_name, None, None, None)
-          self.tiles[i][j]["events"].add(go_event)
+    for y, x in zip(*numpy.nonzero(self.tile_layers["game_object"])): 
+      object_name = self.get_tile_path((x, y), "game_object")
+      go_event = (object_name, None, None, None)
+      self.add_event_from_tile(go_event, (int(x), int(y)))
 
     # Reverse tile access. 
     # <self.address_tiles> -- given a string address, we return a set of all 
     # tile coordinates belonging to that address (this is opposite of  
-    # self.tiles that give you the string address given a coordinate). This is
-    # an optimization component for finding paths for the personas' movement. 
+    # self.tile_layers that give you the string address given a coordinate). 
+    # This is an optimization component for finding paths for the personas' 
+    # movement. It is an AddressDict, keyed on the ids of the addresses in 
+    # the shared address registry. 
     # self.address_tiles['<spawn_loc>bedroom-2-a'] == {(58, 9)}
     # self.address_tiles['double studio:recreation:pool table'] 
     #   == {(29, 14), (31, 11), (30, 14), (32, 11), ...}, 
-    self.address_tiles = dict()
-    for i in range(self.maze_height):
-      for j in range(self.maze_width): 
-        addresses = []
-        if self.tiles[i][j]["sector"]: 
-          add = f'{self.tiles[i][j]["world"]}:'
-          add += f'{self.tiles[i][j]["sector"]}'
-          addresses += [add]
-        if self.tiles[i][j]["arena"]: 
-          add = f'{self.tiles[i][j]["world"]}:'
-          add += f'{self.tiles[i][j]["sector"]}:'
-          add += f'{self.tiles[i][j]["arena"]}'
-          addresses += [add]
-        if self.tiles[i][j]["game_object"]: 
-          add = f'{self.tiles[i][j]["world"]}:'
-          add += f'{self.tiles[i][j]["sector"]}:'
-          add += f'{self.tiles[i][j]["arena"]}:'
-          add += f'{self.tiles[i][j]["game_object"]}'
-          addresses += [add]
-        if self.tiles[i][j]["spawning_location"]: 
-          add = f'<spawn_loc>{self.tiles[i][j]["spawning_location"]}'
-          addresses += [add]
-
-        for add in addresses: 
-          if add in self.address_tiles: 
-            self.address_tiles[add].add((j, i))
-          else: 
-            self.address_tiles[add] = set([(j, i)])
+    self.address_tiles = AddressDict()
+    for level in ["sector", "arena", "game_object"]: 
+      for y, x in zip(*numpy.nonzero(self.tile_layers[level])): 
+        add = self.get_tile_path((x, y), level)
+        self.address_tiles.setdefault(add, set()).add((int(x), int(y)))
+    for y, x in zip(*numpy.nonzero(self.tile_layers["spawning_location"])): 
+      add = f'<spawn_loc>{self.get_tile_string((x, y), "spawning_location")}'
+      self.address_tiles.setdefault(add, set()).add((int(x), int(y)))
+
+    # Finally, the tile layers are cut into chunks (see maze_chunks.py), and
+    # <self.tile_layers> becomes the chunked view of them. 
+    layer_names = list(self.tile_layers.keys())
+    layers = numpy.stack([self.tile_layers[i] for i in layer_names])
+    self.tile_chunks = ChunkStore(ChunkStore.chunk_layers(layers, 
+                                                          maze_chunk_size), 
+                                  layer_names, 
+                                  self.maze_height, 
+                                  self.maze_width)
+    self.tile_layers = self.tile_chunks.get_layers()
+
+
+  def get_compiled_maze_files(self): 
+    """
+    Returns the (layers, index) file names of the compiled maze artifact. 
+    The chunked layers are a single .npy array so that they can be 
+    memory-mapped; everything else is pickled in the index. 
+    """
+    prefix = f"{maze_cache_loc}/{self.maze_name}-{self.matrix_hash}-maze"
+    return f"{prefix}.npy", f"{prefix}.pkl"
+
+
+  def save_compiled_maze(self): 
+    """
+    Saves the maze that compile_maze() built as a binary artifact keyed by
+    the content hash of the matrix folder. The files are written under 
+    temporary names first, so that a run that loads them at the same time 
+    never sees half of them. 
+    """
+    layers_file, index_file = self.get_compiled_maze_files()
+    create_folder_if_not_there(layers_file)
+    index = {"compiled_maze_format": compiled_maze_format, 
+             "layer_names": self.tile_chunks.layer_names, 
+             "maze_width": self.maze_width, 
+             "maze_height": self.maze_height, 
+             "sq_tile_size": self.sq_tile_size, 
+             "special_constraint": self.special_constraint, 
+             "tile_levels": self.tile_levels, 
+             "tile_strings": self.tile_strings, 
+             "tile_string_ids": self.tile_string_ids, 
+             "tile_addresses": self.tile_addresses, 
+             "tile_events": self.tile_events, 
+             "address_tiles": self.address_tiles}
+    with open(f"{layers_file}.{os.getpid()}.tmp", "wb") as outfile: 
+      numpy.save(outfile, self.tile_chunks.source)
+    with open(f"{index_file}.{os.getpid()}.tmp", "wb") as outfile: 
+      pickle.dump(index, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{layers_file}.{os.getpid()}.tmp", layers_file)
+    os.replace(f"{index_file}.{os.getpid()}.tmp", index_file)
+
+
+  def load_compiled_maze(self): 
+    """
+    Loads the compiled maze artifact for this map, if there is one. The 
+    chunks of the tile layers are memory-mapped read-only, and each is only
+    read in when first touched. Runtime changes (e.g., set_tile_collision) 
+    stay in the in-memory copies of the chunks, and never touch the 
+    artifact. 
+
+    OUTPUT: 
+      True if the artifact was loaded, False otherwise. 
+    """
+    layers_file, index_file = self.get_compiled_maze_files()
+    if (not check_if_file_exists(layers_file) 
+        or not check_if_file_exists(index_file)): 
+      return False
+    with open(index_file, "rb") as infile: 
+      index = pickle.load(infile)
+    if index.pop("compiled_maze_format", None) != compiled_maze_format: 
+      # The artifact was written by an older version of compile_maze(). 
+      return False
+    layer_names = index.pop("layer_names")
+    for key, val in index.items(): 
+      setattr(self, key, val)
+    self.tile_chunks = ChunkStore(numpy.load(layers_file, mmap_mode="r"), 
+                                  layer_names, 
+                                  self.maze_height, 
+                                  self.maze_width)
+    self.tile_layers = self.tile_chunks.get_layers()
+
+    # The addresses are interned again, so that they are shared with the 
+    # rest of the backend. 
+    self.tile_addresses = [intern_address(i) for i in self.tile_addresses]
+    self.address_tiles = AddressDict(self.address_tiles.items())
+    for curr_events in self.tile_events.values(): 
+      for event in list(curr_events): 
+        curr_events.remove(event)
+        curr_events.add((intern_address(event[0]),) + event[1:])
+    for tile, curr_events in self.tile_events.items(): 
+      self.index_event_tile(tile)
+      for event in curr_events: 
+        (self.subject_events.setdefault(event[0], dict())
+                            .setdefault(tile, set()).add(event))
+    return True
+
+
+  @property
+  def collision_maze(self): 
+    """
+    The collision map in its legacy form, as the path_finder functions take
+    it: a row-major list of rows of strings, accessed [y][x], with the 
+    collision block id of every tile ("0" if it is not a collision block).
+    The backend itself reads the collision tile layer instead, so this list
+    is only built (from the layer) the first time it is asked for. 
+    """
+    if self._collision_maze is None: 
+      self._collision_maze = [[str(i) for i in row] 
+                              for row in self.tile_layers["collision"].tolist()]
+    return self._collision_maze
 
 
   def turn_coordinate_to_tile(self, px_coordinate): 
@@ -225,8 +417,10 @@ class Maze:
 
   def access_tile(self, tile): 
     """
-    Returns the tiles details dictionary that is stored in self.tiles of the 
-    designated x, y location. 
+    Returns the tile details dictionary of the designated x, y location. The
+    dictionary is a view built from the tile layers; its "events" set is the
+    live set of the tile's events if it has any, and an empty set otherwise.
+    Events should be changed through add_event_from_tile() and friends. 
 
     INPUT
       tile: The tile coordinate of our interest in (x, y) form.
@@ -234,16 +428,47 @@ class Maze:
       The tile detail dictionary for the designated tile. 
     EXAMPLE OUTPUT
       Given (58, 9), 
-      self.tiles[9][58] = {'world': 'double studio', 
-            'sector': 'double studio', 'arena': 'bedroom 2', 
-            'game_object': 'bed', 'spawning_location': 'bedroom-2-a', 
-            'collision': False,
-            'events': {('double studio:double studio:bedroom 2:bed',
-                       None, None)}} 
+      {'world': 'double studio', 
+       'sector': 'double studio', 'arena': 'bedroom 2', 
+       'game_object': 'bed', 'spawning_location': 'bedroom-2-a', 
+       'collision': False,
+       'events': {('double studio:double studio:bedroom 2:bed',
+                  None, None)}} 
     """
     x = tile[0]
     y = tile[1]
-    return self.tiles[y][x]
+    c = self.tile_chunks.chunk_size
+    chunk_details = self._chunk_tile_details.get((y // c, x // c))
+    if chunk_details is None: 
+      chunk_details = self.get_chunk_tile_details(y // c, x // c)
+    tile_details = dict(chunk_details[(y % c) * c + x % c])
+    tile_details["events"] = self.tile_events.get((x, y), set())
+    return tile_details
+
+
+  def get_chunk_tile_details(self, chunk_y, chunk_x): 
+    """
+    Returns the access_tile() dictionaries (without the events) of all the 
+    tiles of a chunk, row by row, building the list from the chunk first if
+    needed. The list is dropped when the chunk is evicted or changed. 
+    """
+    key = (chunk_y, chunk_x)
+    if key not in self._chunk_tile_details: 
+      chunk = self.tile_chunks.get_chunk(chunk_y, chunk_x)
+      layer_index = self.tile_chunks.layer_index
+      chunk_details = []
+      for values in map(tuple, chunk.reshape(len(chunk), -1).T.tolist()): 
+        tile_details = self._tile_details.get(values)
+        if tile_details is None: 
+          tile_details = dict()
+          for level in self.tile_levels: 
+            string_id = values[layer_index[level]]
+            tile_details[level] = self.tile_strings[level][string_id]
+          tile_details["collision"] = bool(values[layer_index["collision"]])
+          self._tile_details[values] = tile_details
+        chunk_details += [tile_details]
+      self._chunk_tile_details[key] = chunk_details
+    return self._chunk_tile_details[key]
 
 
   def get_tile_path(self, tile, level): 
@@ -262,44 +487,39 @@ class Maze:
     """
     x = tile[0]
     y = tile[1]
-    tile = self.tiles[y][x]
-
-    path = f"{tile['world']}"
     if level == "world": 
-      return path
-    else: 
-      path += f":{tile['sector']}"
-    
-    if level == "sector": 
-      return path
-    else: 
-      path += f":{tile['arena']}"
+      return self.tile_addresses[0]
+    elif level == "sector": 
+      return self.tile_addresses[self.tile_layers["sector_address"][y, x]]
+    elif level == "arena": 
+      return self.tile_addresses[self.tile_layers["arena_address"][y, x]]
+    return self.tile_addresses[self.tile_layers["game_object_address"][y, x]]
 
-    if level == "arena": 
-      return path
-    else: 
-      path += f":{tile['game_object']}"
 
-    return path
+  def get_tile_string(self, tile, level): 
+    """
+    Returns the string of one level of a tile, e.g., its arena. 
 
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      level: One of self.tile_levels. 
+    OUTPUT
+      The string of that level ("" if the tile has none). 
+    EXAMPLE OUTPUT
+      Given tile=(58, 9), and level=arena, "bedroom 2"
+    """
+    return self.tile_strings[level][self.tile_layers[level][tile[1], tile[0]]]
 
-  def get_nearby_tiles(self, tile, vision_r): 
+
+  def get_nearby_bounds(self, tile, vision_r): 
     """
-    Given the current tile and vision_r, return a list of tiles that are 
-    within the radius. Note that this implementation looks at a square 
-    boundary when determining what is within the radius. 
-    i.e., for vision_r, returns x's. 
-    x x x x x 
-    x x x x x
-    x x P x x 
-    x x x x x
-    x x x x x
+    Returns the bounds of the square window around <tile> that 
+    get_nearby_tiles() covers, as (left_end, right_end, top_end, bottom_end)
+    with the right and bottom ends exclusive. 
 
     INPUT: 
       tile: The tile coordinate of our interest in (x, y) form.
       vision_r: The radius of the persona's vision. 
-    OUTPUT: 
-      nearby_tiles: a list of tiles that are within the radius. 
     """
     left_end = 0
     if tile[0] - vision_r > left_end: 
@@ -317,6 +537,29 @@ class Maze:
     if tile[1] - vision_r > top_end: 
       top_end = tile[1] - vision_r 
 
+    return left_end, right_end, top_end, bottom_end
+
+
+  def get_nearby_tiles(self, tile, vision_r): 
+    """
+    Given the current tile and vision_r, return a list of tiles that are 
+    within the radius. Note that this implementation looks at a square 
+    boundary when determining what is within the radius. 
+    i.e., for vision_r, returns x's. 
+    x x x x x 
+    x x x x x
+    x x P x x 
+    x x x x x
+    x x x x x
+
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      vision_r: The radius of the persona's vision. 
+    OUTPUT: 
+      nearby_tiles: a list of tiles that are within the radius. 
+    """
+    left_end, right_end, top_end, bottom_end = self.get_nearby_bounds(
+                                                 tile, vision_r)
     nearby_tiles = []
     for i in range(left_end, right_end): 
       for j in range(top_end, bottom_end): 
@@ -324,6 +567,46 @@ class Maze:
     return nearby_tiles
 
 
+  def get_nearby_layer(self, tile, vision_r, level): 
+    """
+    Returns the slice of a tile layer that covers the same window as 
+    get_nearby_tiles(). 
+
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      vision_r: The radius of the persona's vision. 
+      level: One of self.tile_levels, or "collision". 
+    OUTPUT: 
+      An int32 array accessed by [y - top_end, x - left_end]. It is a copy,
+      assembled from the chunks that the window overlaps. 
+    """
+    left_end, right_end, top_end, bottom_end = self.get_nearby_bounds(
+                                                 tile, vision_r)
+    return self.tile_layers[level][top_end:bottom_end, left_end:right_end]
+
+
+  def evict_tile_chunks(self, tiles, radius=maze_chunk_keep_r):
+    """
+    Evicts the loaded chunks of the tile layers that are not near any of
+    <tiles>. They are read in again from the artifact if they are touched
+    later. Chunks with runtime changes (e.g., from set_tile_collision) are
+    kept.
+
+    INPUT:
+      tiles: A list of tile coordinates in (x, y) form, e.g., the personas'
+             current tiles.
+      radius: Chunks within this many tiles of <tiles> are kept.
+    OUTPUT:
+      The number of chunks evicted.
+    """
+    keep = self.tile_chunks.get_chunks_near(tiles, radius)
+    evicted = self.tile_chunks.evict(keep)
+    for key in list(self._chunk_tile_details): 
+      if key not in self.tile_chunks.chunks: 
+        del self._chunk_tile_details[key]
+    return evicted
+
+
   def add_event_from_tile(self, curr_event, tile): 
     """
     Add an event triple to a tile.  
@@ -336,7 +619,13 @@ class Maze:
     OUPUT: 
       None
     """
-    self.tiles[tile[1]][tile[0]]["events"].add(curr_event)
+    tile = (tile[0], tile[1])
+    if tile not in self.tile_events: 
+      self.tile_events[tile] = set()
+      self.index_event_tile(tile)
+    self.tile_events[tile].add(curr_event)
+    (self.subject_events.setdefault(curr_event[0], dict())
+                        .setdefault(tile, set()).add(curr_event))
 
 
   def remove_event_from_tile(self, curr_event, tile):
@@ -351,19 +640,38 @@ class Maze:
     OUPUT: 
       None
     """
-    curr_tile_ev_cp = self.tiles[tile[1]][tile[0]]["events"].copy()
-    for event in curr_tile_ev_cp: 
-      if event == curr_event:  
-        self.tiles[tile[1]][tile[0]]["events"].remove(event)
+    tile = (tile[0], tile[1])
+    curr_events = self.tile_events.get(tile)
+    if curr_events is None or curr_event not in curr_events: 
+      return
+    curr_events.remove(curr_event)
+    if not curr_events: 
+      del self.tile_events[tile]
+      self.unindex_event_tile(tile)
+
+    subject_tiles = self.subject_events[curr_event[0]]
+    subject_tiles[tile].remove(curr_event)
+    if not subject_tiles[tile]: 
+      del subject_tiles[tile]
+      if not subject_tiles: 
+        del self.subject_events[curr_event[0]]
 
 
   def turn_event_from_tile_idle(self, curr_event, tile):
-    curr_tile_ev_cp = self.tiles[tile[1]][tile[0]]["events"].copy()
-    for event in curr_tile_ev_cp: 
-      if event == curr_event:  
-        self.tiles[tile[1]][tile[0]]["events"].remove(event)
-        new_event = (event[0], None, None, None)
-        self.tiles[tile[1]][tile[0]]["events"].add(new_event)
+    """
+    Turns an event on a tile into its blank (idle) form, e.g., once a 
+    persona is done using an object. 
+
+    INPUT: 
+      curr_event: Current event triple. 
+      tile: The tile coordinate of our interest in (x, y) form.
+    OUPUT: 
+      None
+    """
+    if curr_event not in self.tile_events.get((tile[0], tile[1]), ()): 
+      return
+    self.remove_event_from_tile(curr_event, tile)
+    self.add_event_from_tile((curr_event[0], None, None, None), tile)
 
 
   def remove_subject_events_from_tile(self, subject, tile):
@@ -376,41 +684,254 @@ class Maze:
     OUPUT: 
       None
     """
-    curr_tile_ev_cp = self.tiles[tile[1]][tile[0]]["events"].copy()
-    for event in curr_tile_ev_cp: 
-      if event[0] == subject:  
-        self.tiles[tile[1]][tile[0]]["events"].remove(event)
+    subject_tiles = self.subject_events.get(subject)
+    if not subject_tiles: 
+      return
+    for event in list(subject_tiles.get((tile[0], tile[1]), ())): 
+      self.remove_event_from_tile(event, tile)
 
 
+  def get_subject_tiles(self, subject): 
+    """
+    Returns the tiles that a subject has events on. 
 
+    INPUT: 
+      subject: "Isabella Rodriguez"
+    OUPUT: 
+      A list of (x, y) tiles. 
+    """
+    return list(self.subject_events.get(subject, ()))
 
 
+  def get_event_bucket(self, tile): 
+    """
+    Returns the key of the <self.event_buckets> bucket that a tile belongs 
+    to. 
+    """
+    x = tile[0]
+    y = tile[1]
+    return (int(self.tile_layers["arena_address"][y, x]), 
+            x // self.event_bucket_size, 
+            y // self.event_bucket_size)
 
 
+  def index_event_tile(self, tile): 
+    self.event_buckets.setdefault(self.get_event_bucket(tile), 
+                                  set()).add((tile[0], tile[1]))
 
 
+  def unindex_event_tile(self, tile): 
+    key = self.get_event_bucket(tile)
+    self.event_buckets[key].discard((tile[0], tile[1]))
+    if not self.event_buckets[key]: 
+      del self.event_buckets[key]
 
 
+  def get_nearby_events(self, tile, vision_r, top_k=None): 
+    """
+    Returns the events that take place within the get_nearby_tiles() window
+    around <tile> and in the same arena as <tile>, closest first. Only the 
+    index buckets that overlap the window are visited, so the cost scales 
+    with the number of events around rather than with the vision area. 
 
+    An event that takes place on several tiles is listed once, at the 
+    distance of the first of its tiles in get_nearby_tiles() order; events
+    that are equally far keep that order too. 
 
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      vision_r: The radius of the persona's vision. 
+      top_k: Optional number of the closest events to return. 
+    OUTPUT: 
+      A list of event tuples. 
+        e.g., [('double studio:double studio:bedroom 2:bed', None, None, 
+                None), ...]
+    """
+    left_end, right_end, top_end, bottom_end = self.get_nearby_bounds(
+                                                 tile, vision_r)
+    arena, _, _ = self.get_event_bucket(tile)
+    size = self.event_bucket_size
+    event_tiles = []
+    for bucket_x in range(left_end // size, (right_end - 1) // size + 1): 
+      for bucket_y in range(top_end // size, (bottom_end - 1) // size + 1): 
+        for i in self.event_buckets.get((arena, bucket_x, bucket_y), ()): 
+          if left_end <= i[0] < right_end and top_end <= i[1] < bottom_end: 
+            event_tiles += [i]
+    event_tiles.sort()
+
+    events_set = set()
+    events_list = []
+    for i in event_tiles: 
+      dist = math.dist([i[0], i[1]], [tile[0], tile[1]])
+      for event in self.tile_events[i]: 
+        if event not in events_set: 
+          events_list += [[dist, event]]
+          events_set.add(event)
+    events_list = sorted(events_list, key=lambda i: i[0])
+    return [event for dist, event in events_list[:top_k]]
+
+
+  def set_tile_collision(self, tile, collision): 
+    """
+    Turns a tile into a collision block (or back into a walkable tile) while
+    the simulation is running, e.g., for a door that closes. Personas' 
+    planned paths are repaired on their next step (see execute.py). 
+
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      collision: True if the tile should become a collision block. 
+    OUPUT: 
+      None
+    """
+    x = tile[0]
+    y = tile[1]
+    if self._collision_maze is not None: 
+      if collision: 
+        self._collision_maze[y][x] = collision_block_id
+      else: 
+        self._collision_maze[y][x] = "0"
+    if collision: 
+      self.tile_layers["collision"][y, x] = int(collision_block_id)
+    else: 
+      self.tile_layers["collision"][y, x] = 0
+    c = self.tile_chunks.chunk_size
+    self._chunk_tile_details.pop((y // c, x // c), None)
+    if self.path_engine.set_collision(tile, collision): 
+      # Distance fields were computed on the old collision map. 
+      self.distance_fields = dict()
 
 
+  def get_distance_field(self, address): 
+    """
+    Returns the distance field of a string address, computing it on first
+    use. 
 
+    INPUT: 
+      address: A key of self.address_tiles. 
+        e.g., "the Ville:Hobbs Cafe:cafe:cafe customer seating"
+    OUTPUT: 
+      A flat numpy array with the number of steps from each tile to the 
+      nearest tile of the address (-1 if it cannot be reached). 
+    """
+    if address not in self.distance_fields: 
+      self.distance_fields[address] = (self.path_engine
+                                 .distance_field(self.address_tiles[address]))
+    return self.distance_fields[address]
 
 
+  def get_path_to_address(self, tile, address): 
+    """
+    Returns the shortest path from a tile to the nearest tile of an address
+    by following the address' distance field. 
 
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      address: A key of self.address_tiles. 
+    OUTPUT: 
+      A list of (x, y) tiles that starts at <tile> and ends at the nearest
+      tile of the address, or [] if none of its tiles can be reached. 
+    """
+    field = self.get_distance_field(address)
+    return self.path_engine.path_from_field(field, tile)
 
 
+  def precompute_distance_fields(self, addresses=None): 
+    """
+    Computes the distance fields of all (or the given) addresses that are not
+    computed yet, and saves them to the on-disk cache if there were any. 
 
+    INPUT: 
+      addresses: Optional list of addresses. Defaults to every address in 
+                 self.address_tiles. 
+    OUPUT: 
+      None
+    """
+    if addresses is None: 
+      addresses = list(self.address_tiles.keys())
+    addresses = [i for i in addresses if i not in self.distance_fields]
+    for address in addresses: 
+      self.get_distance_field(address)
+    if addresses: 
+      self.save_distance_fields()
 
 
+  def get_distance_fields_file(self): 
+    return (f"{maze_cache_loc}/{self.maze_name}-{self.matrix_hash}"
+            + "-distance_fields.npz")
 
 
+  def save_distance_fields(self): 
+    """
+    Saves all distance fields computed so far to the on-disk cache, which is
+    keyed by the content hash of the matrix folder. 
+    """
+    if not self.distance_fields or self.path_engine.version: 
+      # Only fields of the unmodified map may be cached under its hash. 
+      return
+    outfile = self.get_distance_fields_file()
+    create_folder_if_not_there(outfile)
+    addresses = list(self.distance_fields.keys())
+    numpy.savez_compressed(outfile, 
+                           addresses=numpy.array(addresses), 
+                           fields=numpy.stack([self.distance_fields[i] 
+                                               for i in addresses]))
+
+
+  def load_distance_fields(self): 
+    """
+    Loads the cached distance fields for this map, if any. 
+    """
+    curr_file = self.get_distance_fields_file()
+    if not check_if_file_exists(curr_file): 
+      return
+    with numpy.load(curr_file, allow_pickle=False) as data: 
+      for address, field in zip(data["addresses"], data["fields"]): 
+        if str(address) in self.address_tiles: 
+          self.distance_fields[str(address)] = field
 
 
+  def get_region_graph(self): 
+    """
+    Returns the region graph of the map, building it on first use. Every 
+    tile's region label is its sector and arena, so the regions are the 
+    arenas (and the parts of sectors and of the world outside any arena). 
+    """
+    if self.region_graph is None: 
+      self.region_graph = RegionGraph(self.path_engine, 
+                                      self.tile_layers["arena_address"])
+    return self.region_graph
 
 
+  def find_nearest_path(self, tile, target_tiles): 
+    """
+    Finds the path from a tile to the nearest of <target_tiles>. Small maps
+    like the_ville are searched tile by tile for exact shortest paths; maps 
+    with at least <hierarchical_path_min_tiles> tiles plan the trip on the
+    region graph, and get near-shortest paths much faster. 
 
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      target_tiles: A list of (x, y) target tiles. 
+    OUTPUT: 
+      A (target_tile, path) pair, like PathEngine.find_nearest_path. 
+    """
+    if self.maze_width * self.maze_height >= hierarchical_path_min_tiles: 
+      return self.get_region_graph().find_nearest_path(tile, target_tiles)
+    return self.path_engine.find_nearest_path(tile, target_tiles)
 
 
+  def find_nearest_paths(self, requests, pool=None): 
+    """
+    Batch version of find_nearest_path() for all the path requests of a 
+    step (see PathEngine.find_nearest_paths). 
 
+    INPUT: 
+      requests: A list of (tile, target_tiles) pairs. 
+      pool: Optional PathPool for self.path_engine. 
+    OUTPUT: 
+      A list with the (target_tile, path) pair of each request, in order. 
+    """
+    if self.maze_width * self.maze_height >= hierarchical_path_min_tiles: 
+      return [self.find_nearest_path(tile, target_tiles) 
+              for tile, target_tiles in requests]
+    return self.path_engine.find_nearest_paths(requests, pool)
@@ -0,0 +1,232 @@
+"""
+Author: irrealis (irrealis.chomp@gmail.com)
+
+File: maze_chunks.py
+Description: Defines the ChunkStore class, which keeps the tile layers of a
+maze as fixed-size square chunks. The chunks are read lazily from an array
+that is usually memory-mapped from the compiled maze artifact, the first
+time something (e.g., a persona's vision) touches them, and can be evicted
+again once no persona is nearby. ChunkedLayer gives one layer of the store
+the [y, x] indexing of a numpy array, so that the Maze code that reads the
+layers does not need to know about chunks.
+"""
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import numpy
+
+
+class ChunkStore:
+  def __init__(self, source, layer_names, height, width):
+    """
+    INPUT:
+      source: An int32 array of shape (chunk rows, chunk cols, layers,
+              chunk size, chunk size), as made by chunk_layers(). Each chunk
+              is one contiguous block of it, so reading a chunk from a
+              memory-mapped source only pages in that block.
+      layer_names: The names of the layers, in the order of <source>.
+      height, width: The size of the maze in tiles.
+    """
+    self.source = source
+    self.layer_names = list(layer_names)
+    self.layer_index = dict((name, i) for i, name in enumerate(layer_names))
+    self.height = height
+    self.width = width
+    self.chunk_size = source.shape[-1]
+    # <chunks> maps the (chunk row, chunk col) of each loaded chunk to its
+    # in-memory copy. <dirty_chunks> are the loaded chunks that were written
+    # to at runtime (e.g., by set_tile_collision); they are never evicted,
+    # since their changes only live in memory.
+    self.chunks = dict()
+    self.dirty_chunks = set()
+    self.chunk_loads = 0
+    self.chunk_evictions = 0
+    # <_last_key> and <_last_chunk> are the chunk that was read last. Reads
+    # of one tile tend to come in runs on the same chunk (e.g., everything
+    # around a persona), so checking it first skips the dictionary lookup.
+    self._last_key = None
+    self._last_chunk = None
+
+
+  @staticmethod
+  def chunk_layers(layers, chunk_size):
+    """
+    Cuts full tile layers into chunks.
+
+    INPUT:
+      layers: An int32 array of shape (layers, height, width).
+      chunk_size: The side of a chunk in tiles.
+    OUTPUT:
+      The (chunk rows, chunk cols, layers, chunk size, chunk size) array
+      that ChunkStore reads from. The last chunks are padded with 0s.
+    """
+    n, height, width = layers.shape
+    rows = -(-height // chunk_size)
+    cols = -(-width // chunk_size)
+    padded = numpy.zeros((n, rows * chunk_size, cols * chunk_size),
+                         dtype=numpy.int32)
+    padded[:, :height, :width] = layers
+    return numpy.ascontiguousarray(
+             padded.reshape(n, rows, chunk_size, cols, chunk_size)
+                   .transpose(1, 3, 0, 2, 4))
+
+
+  def get_chunk(self, chunk_y, chunk_x):
+    """
+    Returns the (layers, chunk size, chunk size) array of a chunk, loading
+    it from <source> first if needed.
+    """
+    chunk = self.chunks.get((chunk_y, chunk_x))
+    if chunk is None:
+      chunk = numpy.array(self.source[chunk_y, chunk_x])
+      self.chunks[(chunk_y, chunk_x)] = chunk
+      self.chunk_loads += 1
+    return chunk
+
+
+  def get_value(self, layer, y, x):
+    c = self.chunk_size
+    key = (y // c, x // c)
+    if key == self._last_key:
+      chunk = self._last_chunk
+    else:
+      chunk = self.chunks.get(key)
+      if chunk is None:
+        chunk = self.get_chunk(y // c, x // c)
+      self._last_key = key
+      self._last_chunk = chunk
+    return chunk.item(layer, y % c, x % c)
+
+
+  def set_value(self, layer, y, x, value):
+    c = self.chunk_size
+    self.get_chunk(y // c, x // c)[layer, y % c, x % c] = value
+    self.dirty_chunks.add((y // c, x // c))
+
+
+  def get_window(self, layer, top, bottom, left, right, load=True):
+    """
+    Returns a copy of the [top:bottom, left:right] window of a layer, which
+    is assembled from the chunks that it overlaps. If <load> is False, the
+    chunks that are not loaded yet are read straight from <source> and are
+    not kept, e.g., when a whole layer is read once.
+    """
+    c = self.chunk_size
+    out = numpy.zeros((max(0, bottom - top), max(0, right - left)),
+                      dtype=numpy.int32)
+    for chunk_y in range(top // c, (bottom - 1) // c + 1 if bottom > top
+                         else top // c):
+      y0 = max(top, chunk_y * c)
+      y1 = min(bottom, (chunk_y + 1) * c)
+      for chunk_x in range(left // c, (right - 1) // c + 1 if right > left
+                           else left // c):
+        x0 = max(left, chunk_x * c)
+        x1 = min(right, (chunk_x + 1) * c)
+        chunk = self.chunks.get((chunk_y, chunk_x))
+        if chunk is None:
+          if load:
+            chunk = self.get_chunk(chunk_y, chunk_x)
+          else:
+            chunk = self.source[chunk_y, chunk_x]
+        out[y0 - top:y1 - top, x0 - left:x1 - left] = (
+          chunk[layer, y0 - chunk_y * c:y1 - chunk_y * c,
+                x0 - chunk_x * c:x1 - chunk_x * c])
+    return out
+
+
+  def get_chunks_near(self, tiles, radius):
+    """
+    Returns the set of (chunk row, chunk col) keys of the chunks that are
+    within <radius> tiles of any of <tiles> (in (x, y) form).
+    """
+    c = self.chunk_size
+    keys = set()
+    for x, y in tiles:
+      for chunk_y in range(max(0, y - radius) // c,
+                           min(self.height - 1, y + radius) // c + 1):
+        for chunk_x in range(max(0, x - radius) // c,
+                             min(self.width - 1, x + radius) // c + 1):
+          keys.add((chunk_y, chunk_x))
+    return keys
+
+
+  def evict(self, keep):
+    """
+    Drops the loaded chunks that are not in <keep> (a set of chunk keys) and
+    have no runtime changes.
+
+    OUTPUT:
+      The number of chunks evicted.
+    """
+    evicted = [key for key in self.chunks
+               if key not in keep and key not in self.dirty_chunks]
+    for key in evicted:
+      del self.chunks[key]
+    if self._last_key in evicted:
+      self._last_key = None
+      self._last_chunk = None
+    self.chunk_evictions += len(evicted)
+    return len(evicted)
+
+
+  def get_layers(self):
+    """
+    Returns a dictionary that maps each layer name to its ChunkedLayer.
+    """
+    return dict((name, ChunkedLayer(self, name)) for name in self.layer_names)
+
+
+class ChunkedLayer:
+  """
+  One layer of a ChunkStore, indexed like a 2D numpy array:
+  layer[y, x] reads (or writes) one tile, layer[top:bottom, left:right]
+  returns a copy of a window, and numpy.asarray(layer) or layer.tolist()
+  assemble the whole layer. Assembling the whole layer reads the chunks that
+  are not loaded straight from the source, without loading them.
+  """
+  def __init__(self, store, name):
+    self.store = store
+    self.name = name
+    self.layer = store.layer_index[name]
+    self.shape = (store.height, store.width)
+    self.dtype = numpy.dtype(numpy.int32)
+
+
+  def __getitem__(self, key):
+    y, x = key
+    if type(y) is int and type(x) is int:
+      return self.store.get_value(self.layer, y, x)
+    if isinstance(y, slice) or isinstance(x, slice):
+      rows = range(*(y if isinstance(y, slice) else slice(y, y + 1))
+                   .indices(self.shape[0]))
+      cols = range(*(x if isinstance(x, slice) else slice(x, x + 1))
+                   .indices(self.shape[1]))
+      if rows.step != 1 or cols.step != 1:
+        return numpy.asarray(self)[key]
+      window = self.store.get_window(self.layer, rows.start,
+                                     max(rows.start, rows.stop),
+                                     cols.start, max(cols.start, cols.stop))
+      if not isinstance(y, slice):
+        return window[0]
+      if not isinstance(x, slice):
+        return window[:, 0]
+      return window
+    return self.store.get_value(self.layer, y, x)
+
+
+  def __setitem__(self, key, value):
+    y, x = key
+    self.store.set_value(self.layer, y, x, value)
+
+
+  def __array__(self, dtype=None, copy=None):
+    array = self.store.get_window(self.layer, 0, self.shape[0],
+                                  0, self.shape[1], load=False)
+    if dtype is not None:
+      array = array.astype(dtype)
+    return array
+
+
+  def tolist(self):
+    return numpy.asarray(self).tolist()
@@ -0,0 +1,846 @@
+"""
+Author: irrealis (irrealis.chomp@gmail.com)
+
+File: path_engine.py
+Description: Defines the PathEngine class, a reusable grid path finder that
+is built once per collision maze and answers shortest path queries with a
+queue-based BFS instead of rescanning the whole grid per step.
+"""
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import heapq
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+
+class PathEngine:
+  def __init__(self, collision_maze, collision_block_char, 
+               path_cache_size=1024):
+    """
+    Builds the compact collision grid for <collision_maze>.
+
+    INPUT:
+      collision_maze: A list of rows (row-major, i.e., accessed [y][x]) whose
+                      values mark collision blocks, like 
+                      Maze.collision_maze; or a 2D int array (or anything 
+                      numpy.asarray() takes, e.g., the "collision" tile 
+                      layer of a Maze) of the collision block ids.
+      collision_block_char: The value that marks a collision block.
+                            e.g., "32125"
+      path_cache_size: The number of find_path() results to keep in the LRU
+                       path cache. 0 turns the cache off.
+    """
+    self.collision_block_char = collision_block_char
+    if hasattr(collision_maze, "__array__"):
+      collision = (numpy.asarray(collision_maze) 
+                   == int(collision_block_char))
+    else:
+      collision = (numpy.array(collision_maze, dtype=object)
+                   == collision_block_char).astype(bool)
+    self.height, self.width = collision.shape if collision.ndim == 2 else (0, 0)
+
+    # <_passable> is the grid flattened into a bytearray that is 1 for every
+    # passable tile and 0 for every collision block. It is much cheaper to 
+    # index from the Python search loops than a numpy array.
+    self._passable = bytearray((~collision).astype(numpy.uint8)
+                                           .ravel().tobytes())
+
+    # <version> counts the changes made to the collision grid at runtime (e.g.,
+    # a door closing), and <collision_changes> lists the flat index of every
+    # changed tile in order. Incremental planners use them to catch up on
+    # what changed since they last ran.
+    self.version = 0
+    self.collision_changes = []
+
+    # <_path_cache> maps (start, end, version) keys to the paths find_path()
+    # returned, least recently used first. Personas walk the same routes 
+    # every day, so most queries are repeats. <_path_cache_goals> maps each
+    # (end, version) pair to the cached keys that lead there, so that a query
+    # whose start lies on a cached path can reuse the rest of that path. 
+    self.path_cache_size = path_cache_size
+    self._path_cache = OrderedDict()
+    self._path_cache_goals = dict()
+    self.path_cache_hits = 0
+    self.path_cache_subpath_hits = 0
+    self.path_cache_misses = 0
+
+
+  def __getstate__(self):
+    # Copies sent to PathPool workers start with an empty path cache. 
+    state = self.__dict__.copy()
+    state["_path_cache"] = OrderedDict()
+    state["_path_cache_goals"] = dict()
+    state.pop("_source", None)
+    return state
+
+
+  def to_index(self, tile):
+    """
+    Turns an (x, y) tile coordinate into a flat index into the grid.
+    """
+    return tile[1] * self.width + tile[0]
+
+
+  def to_tile(self, index):
+    """
+    Turns a flat grid index back into an (x, y) tile coordinate.
+    """
+    return (index % self.width, index // self.width)
+
+
+  def in_bounds(self, tile):
+    return 0 <= tile[0] < self.width and 0 <= tile[1] < self.height
+
+
+  def is_passable(self, tile):
+    return self.in_bounds(tile) and bool(self._passable[self.to_index(tile)])
+
+
+  def set_collision(self, tile, blocked):
+    """
+    Turns a tile into a collision block (or back into a passable tile) at
+    runtime.
+
+    INPUT:
+      tile: The (x, y) tile to change.
+      blocked: True if the tile should become a collision block.
+    OUTPUT:
+      True if the tile changed, False if it already was in that state.
+    """
+    index = self.to_index(tile)
+    if self._passable[index] == (0 if blocked else 1):
+      return False
+    self._passable[index] = 0 if blocked else 1
+    self.version += 1
+    self.collision_changes += [index]
+    # Cached paths are keyed on the version, so none of them can be hit 
+    # anymore. 
+    self.clear_path_cache()
+    return True
+
+
+  def neighbors(self, index):
+    """
+    Returns the flat indices of the in-bound neighbors of <index>, in the
+    order the legacy wavefront used when backtracking: up, left, down, right.
+    Passability is not checked here.
+    """
+    width = self.width
+    x = index % width
+    ret = []
+    if index >= width:
+      ret += [index - width]
+    if x > 0:
+      ret += [index - 1]
+    if index + width < width * self.height:
+      ret += [index + width]
+    if x < width - 1:
+      ret += [index + 1]
+    return ret
+
+
+  def bfs(self, sources, targets=None):
+    """
+    Runs a breadth-first search from one or more source tiles and returns the
+    flat distance list (-1 for tiles that were not reached).
+
+    Sources are always expanded, even if they are collision blocks (a persona
+    might be standing on one); every other tile must be passable.
+
+    INPUT:
+      sources: An iterable of (x, y) source tiles.
+      targets: Optional iterable of (x, y) tiles. If given, the search stops
+               once the level of the nearest target is fully labeled. At that
+               point every tile at most as far as that target is labeled, 
+               which is all that backtracking (or picking among equally near
+               targets) needs.
+    OUTPUT:
+      dist: A list of length width*height with the step distance of each tile
+            from the nearest source.
+    """
+    width = self.width
+    size = width * self.height
+    passable = self._passable
+    dist = [-1] * size
+    queue = deque()
+    for tile in sources:
+      if not self.in_bounds(tile):
+        continue
+      index = self.to_index(tile)
+      if dist[index] == -1:
+        dist[index] = 0
+        queue.append(index)
+
+    stop = None
+    if targets is not None:
+      stop = set(self.to_index(i) for i in targets if self.in_bounds(i))
+      if any(dist[i] == 0 for i in stop):
+        return dist
+
+    limit = None
+    while queue:
+      curr = queue.popleft()
+      if limit is not None and dist[curr] >= limit:
+        break
+      d = dist[curr] + 1
+      x = curr % width
+      for nxt in (curr - width if curr >= width else -1,
+                  curr - 1 if x > 0 else -1,
+                  curr + width if curr + width < size else -1,
+                  curr + 1 if x < width - 1 else -1):
+        if nxt < 0 or dist[nxt] != -1 or not passable[nxt]:
+          continue
+        dist[nxt] = d
+        if limit is None and stop is not None and nxt in stop:
+          limit = d
+        queue.append(nxt)
+    return dist
+
+
+  def backtrack(self, dist, end):
+    """
+    Walks back from <end> to the distance-0 source, always stepping to the
+    first neighbor (up, left, down, right) that is one step closer. This is
+    the same tie-breaking rule as path_finder_v2, so paths are identical.
+
+    INPUT:
+      dist: A distance list returned by bfs().
+      end: The (x, y) tile to walk back from.
+    OUTPUT:
+      A list of (x, y) tiles from the source to <end>, or [] if <end> was
+      not reached.
+    """
+    if not self.in_bounds(end):
+      return []
+    curr = self.to_index(end)
+    k = dist[curr]
+    if k < 0:
+      return []
+    the_path = [curr]
+    while k > 0:
+      for nxt in self.neighbors(curr):
+        if dist[nxt] == k - 1:
+          curr = nxt
+          break
+      the_path += [curr]
+      k -= 1
+    the_path.reverse()
+    return [self.to_tile(i) for i in the_path]
+
+
+  def find_path(self, start, end):
+    """
+    Finds the shortest path from <start> to <end> with BFS. Results are kept
+    in the LRU path cache until the collision grid changes. A query whose 
+    <start> lies on a cached path to <end> reuses the rest of that path; it
+    is just as short, but may tie-break differently from a fresh search.
+
+    INPUT:
+      start: The (x, y) tile to start from.
+      end: The (x, y) tile to go to.
+    OUTPUT:
+      A list of (x, y) tiles that includes both <start> and <end>, or [] if
+      <end> cannot be reached.
+      e.g., [(0, 1), (1, 1), (1, 2), (1, 3), (1, 4)...]
+    """
+    start, end = tuple(start), tuple(end)
+    if self.path_cache_size <= 0:
+      return self.backtrack(self.bfs([start], [end]), end)
+
+    the_path = self._get_cached_path(start, end)
+    if the_path is not None:
+      return the_path
+    the_path = self.backtrack(self.bfs([start], [end]), end)
+    self._cache_path((start, end, self.version), the_path)
+    return list(the_path)
+
+
+  def _get_cached_path(self, start, goal_key):
+    """
+    Looks up the path from <start> in the path cache. <goal_key> is the end
+    tile for find_path(), or the frozenset of the goal tiles for 
+    find_nearest_path(). 
+
+    OUTPUT:
+      A copy of the cached path, or None if there is none.
+    """
+    key = (start, goal_key, self.version)
+    entry = self._path_cache.get(key)
+    if entry is not None:
+      self._path_cache.move_to_end(key)
+      self.path_cache_hits += 1
+      return list(entry[0])
+
+    # Any part of a shortest path is itself a shortest path, so if <start> 
+    # lies on a cached path to the goal(s), the rest of that path will do. 
+    # The same holds for a path to the nearest of several goals: no goal can
+    # be nearer to a tile on that path than the one it ends at. 
+    for cached_key in self._path_cache_goals.get((goal_key, self.version), 
+                                                 ()):
+      cached_path, positions = self._path_cache[cached_key]
+      if start in positions:
+        self._path_cache.move_to_end(cached_key)
+        self.path_cache_subpath_hits += 1
+        return cached_path[positions[start]:]
+
+    self.path_cache_misses += 1
+    return None
+
+
+  def _cache_path(self, key, the_path):
+    """
+    Adds a path to the path cache, evicting the least recently used entries
+    if the cache is full. 
+    """
+    positions = dict((tile, i) for i, tile in enumerate(the_path))
+    self._path_cache[key] = (the_path, positions)
+    goal_key = key[1:]
+    self._path_cache_goals.setdefault(goal_key, dict())[key] = None
+    while len(self._path_cache) > self.path_cache_size:
+      old_key, _ = self._path_cache.popitem(last=False)
+      old_goal_key = old_key[1:]
+      del self._path_cache_goals[old_goal_key][old_key]
+      if not self._path_cache_goals[old_goal_key]:
+        del self._path_cache_goals[old_goal_key]
+
+
+  def clear_path_cache(self):
+    self._path_cache.clear()
+    self._path_cache_goals.clear()
+
+
+  def path_cache_stats(self):
+    """
+    Returns the path cache counters, e.g., for logging or metrics. 
+
+    OUTPUT:
+      A dictionary with the number of cached paths, the cache size, and the 
+      hit, sub-path hit, and miss counts.
+    """
+    lookups = (self.path_cache_hits + self.path_cache_subpath_hits 
+               + self.path_cache_misses)
+    return {"size": len(self._path_cache),
+            "max_size": self.path_cache_size,
+            "hits": self.path_cache_hits,
+            "subpath_hits": self.path_cache_subpath_hits,
+            "misses": self.path_cache_misses,
+            "hit_rate": ((lookups - self.path_cache_misses) / lookups 
+                         if lookups else 0.0)}
+
+
+  def find_nearest_path(self, start, goals):
+    """
+    Finds the nearest of several goal tiles and the shortest path to it with
+    a single BFS, instead of one search per goal. Among equally near goals,
+    the first one in <goals> wins, just like the loop in execute() that this
+    replaces. Results go through the path cache, keyed on the set of goals,
+    so a repeated query may get a cached path to another equally near goal.
+
+    INPUT:
+      start: The (x, y) tile to start from.
+      goals: A list of (x, y) goal tiles.
+    OUTPUT:
+      A (goal, path) pair, where <goal> is the element of <goals> that was 
+      picked and <path> runs from <start> to it. (None, []) if none of the 
+      goals can be reached.
+    """
+    start = tuple(start)
+    goals = [tuple(i) for i in goals]
+    if self.path_cache_size <= 0:
+      return self._find_nearest_path(start, goals)
+
+    goal_key = frozenset(goals)
+    the_path = self._get_cached_path(start, goal_key)
+    if the_path is None:
+      goal, the_path = self._find_nearest_path(start, goals)
+      self._cache_path((start, goal_key, self.version), the_path)
+      the_path = list(the_path)
+    return (the_path[-1] if the_path else None), the_path
+
+
+  def _find_nearest_path(self, start, goals):
+    """
+    The search behind find_nearest_path(), without the path cache. 
+    """
+    dist = self.bfs([start], goals)
+    closest_goal = None
+    closest_dist = None
+    for goal in goals:
+      if not self.in_bounds(goal):
+        continue
+      d = dist[self.to_index(goal)]
+      if d >= 0 and (closest_dist is None or d < closest_dist):
+        closest_goal = goal
+        closest_dist = d
+    if closest_goal is None:
+      return None, []
+    return closest_goal, self.backtrack(dist, closest_goal)
+
+
+  def find_nearest_paths(self, requests, pool=None):
+    """
+    Batch version of find_nearest_path() for all the path requests of a
+    step. Requests that are in the path cache are answered from it. The 
+    others that share the same goal set share one search: a single BFS from
+    the goals labels every tile, and each start just follows it downhill. 
+    The groups are independent, so they can also be fanned out to a 
+    PathPool. The paths found are added to the path cache.
+
+    Among equally near goals, a shared search may pick a different goal (or
+    a different path of the same length) than find_nearest_path(). 
+
+    INPUT:
+      requests: A list of (start, goals) pairs, where <start> is an (x, y)
+                tile and <goals> a list of (x, y) goal tiles.
+      pool: Optional PathPool for this engine.
+    OUTPUT:
+      A list with the (goal, path) pair of each request, in order, just like
+      find_nearest_path() returns them.
+    """
+    ret = [None] * len(requests)
+    groups = dict()
+    for i, (start, goals) in enumerate(requests):
+      start = tuple(start)
+      goals = tuple(sorted(set(tuple(j) for j in goals)))
+      if self.path_cache_size > 0:
+        the_path = self._get_cached_path(start, frozenset(goals))
+        if the_path is not None:
+          ret[i] = (the_path[-1] if the_path else None), the_path
+          continue
+      groups.setdefault(goals, []).append(i)
+    tasks = [(goals, [tuple(requests[i][0]) for i in indices])
+             for goals, indices in groups.items()]
+
+    if pool is not None and len(tasks) > 1:
+      group_results = pool.map(tasks)
+    else:
+      group_results = [self._plan_group(goals, starts) 
+                       for goals, starts in tasks]
+
+    for (goals, starts), indices, results in zip(tasks, groups.values(), 
+                                                 group_results):
+      for start, i, (goal, the_path) in zip(starts, indices, results):
+        if self.path_cache_size > 0:
+          self._cache_path((start, frozenset(goals), self.version), the_path)
+        ret[i] = goal, list(the_path)
+    return ret
+
+
+  def _plan_group(self, goals, starts):
+    """
+    Resolves the requests of one goal set for find_nearest_paths().
+    """
+    if len(starts) == 1:
+      return [self._find_nearest_path(starts[0], list(goals))]
+    dist = self.bfs([i for i in goals if self.is_passable(i)])
+    results = []
+    for start in starts:
+      the_path = self.path_from_field(dist, start)
+      if the_path:
+        results += [(the_path[-1], the_path)]
+      else:
+        results += [(None, [])]
+    return results
+
+
+  def find_meeting_point(self, start, end):
+    """
+    Finds the tile where a persona at <start> should go to meet a persona at
+    <end>: the midpoint of the shortest path between them. Only one search
+    is run. The midpoint is picked on the path that is backtracked from
+    <start>'s BFS, which is the same tile (and path) that execute() used to
+    find with three separate path_finder calls.
+
+    INPUT:
+      start: The (x, y) tile of the persona that is moving.
+      end: The (x, y) tile of the persona to meet.
+    OUTPUT:
+      A (meeting_tile, path) pair, where <path> runs from <start> to 
+      <meeting_tile>. If the personas are at most one step apart, the 
+      meeting tile is <start>. If <end> cannot be reached, the meeting tile
+      is <end> and the path is [].
+    """
+    the_path = self.find_path(start, end)
+    if not the_path:
+      return (end[0], end[1]), []
+    if len(the_path) <= 2:
+      return the_path[0], the_path[:1]
+    mid = int(len(the_path)/2)
+    return the_path[mid], the_path[:mid+1]
+
+
+  def distance_field(self, targets):
+    """
+    Computes the BFS distance field of a set of target tiles, i.e., for every
+    tile, the number of steps to the nearest target. Only passable targets
+    are used as seeds, since the legacy path_finder can never step onto a
+    collision block either.
+
+    INPUT:
+      targets: An iterable of (x, y) tiles (e.g., maze.address_tiles[...]).
+    OUTPUT:
+      A flat numpy int array of length width*height; -1 marks tiles from
+      which none of the targets can be reached.
+    """
+    seeds = [i for i in targets if self.is_passable(i)]
+    dtype = numpy.int16 if self.width * self.height < 2**15 else numpy.int32
+    return numpy.array(self.bfs(seeds), dtype=dtype)
+
+
+  def path_from_field(self, field, start):
+    """
+    Follows a distance field downhill from <start> to the nearest target.
+    Each step is the next hop toward the target set, so no search is needed.
+    <start> may be a collision block (a persona can stand on one), in which
+    case the first step goes to its closest labeled neighbor.
+
+    INPUT:
+      field: A distance field returned by distance_field().
+      start: The (x, y) tile to start from.
+    OUTPUT:
+      A list of (x, y) tiles from <start> to the nearest target, or [] if no
+      target can be reached.
+    """
+    if not self.in_bounds(start):
+      return []
+    curr = self.to_index(start)
+    k = int(field[curr])
+    the_path = [curr]
+    if k < 0:
+      if self._passable[curr]:
+        return []
+      best = None
+      for nxt in self.neighbors(curr):
+        if field[nxt] >= 0 and (best is None or field[nxt] < field[best]):
+          best = nxt
+      if best is None:
+        return []
+      curr = best
+      k = int(field[curr])
+      the_path += [curr]
+    while k > 0:
+      for nxt in self.neighbors(curr):
+        if field[nxt] == k - 1:
+          curr = nxt
+          break
+      the_path += [curr]
+      k -= 1
+    return [self.to_tile(i) for i in the_path]
+
+
+class IncrementalPlanner:
+  """
+  A D* Lite style planner that keeps a shortest path between a start and a
+  goal tile up to date as the start moves, the goal moves, or collision
+  blocks change, instead of searching from scratch every time.
+
+  The search tree is rooted at the goal and seeded with one BFS that stops as
+  soon as the start is reached; the tiles just past that frontier are left
+  in the D* Lite queue. From there:
+    - The start moving (the persona walking, or even stepping off the path)
+      only shifts the heuristic (the <km> term of D* Lite), and the next path
+      is read straight off the tree.
+    - A collision change re-expands only the tiles whose distance to the
+      goal it changed, and only as far as the start needs.
+    - A goal that moves onto the current path just trims the path. Any other
+      goal move re-seeds the tree, which costs one bounded BFS, the same as a
+      fresh search.
+
+  Paths are always shortest paths, but where several exist the one picked
+  may differ from PathEngine.find_path().
+  """
+  def __init__(self, engine, start, goal):
+    """
+    INPUT:
+      engine: The PathEngine whose collision grid we plan on.
+      start: The (x, y) tile the persona is on.
+      goal: The (x, y) tile the persona is heading to.
+    """
+    self.engine = engine
+    self.start = (start[0], start[1])
+    self.goal = (goal[0], goal[1])
+    self._s_start = engine.to_index(self.start)
+    self._s_goal = engine.to_index(self.goal)
+    # <_path> is the last path we returned, as flat indices. <_root> is the
+    # flat index of the goal that the search tree is currently rooted at.
+    self._path = []
+    self._seed()
+
+
+  def move_start(self, tile):
+    """
+    Tells the planner that the persona is now on <tile>.
+    """
+    s_new = self.engine.to_index(tile)
+    if s_new == self._s_start:
+      return
+    self.km += self._h(self._s_start, s_new)
+    self._s_start = s_new
+    self.start = (tile[0], tile[1])
+    # The start may be a collision block that the seed never labeled.
+    self._update_vertex(s_new)
+
+
+  def move_goal(self, tile):
+    """
+    Tells the planner that the goal is now <tile>.
+    """
+    self._s_goal = self.engine.to_index(tile)
+    self.goal = (tile[0], tile[1])
+
+
+  def find_path(self):
+    """
+    Repairs the search for any collision changes and moves since the last
+    call, and returns the current shortest path.
+
+    OUTPUT:
+      A list of (x, y) tiles from the start to the goal, or [] if the goal
+      cannot be reached.
+    """
+    engine = self.engine
+    changes = engine.collision_changes[self._change_count:]
+    self._change_count = len(engine.collision_changes)
+
+    if self._s_goal != self._root:
+      # Any part of a shortest path is itself a shortest path, so if both the
+      # start and the new goal are on the last path (in that order), we can
+      # simply trim it.
+      path = self._path
+      if (not changes and self._s_start in path and self._s_goal in path
+          and path.index(self._s_start) <= path.index(self._s_goal)):
+        self._path = path[path.index(self._s_start):
+                          path.index(self._s_goal)+1]
+        return [engine.to_tile(i) for i in self._path]
+      self._seed()
+    else:
+      for index in changes:
+        self._update_vertex(index)
+        for u in engine.neighbors(index):
+          self._update_vertex(u)
+      self._compute_shortest_path()
+
+    self._path = self._extract_path()
+    return [engine.to_tile(i) for i in self._path]
+
+
+  def _seed(self):
+    """
+    (Re)builds the search tree for the current goal with a BFS from the goal
+    that stops once the start is labeled. This leaves a consistent D* Lite
+    state: every labeled tile has its exact distance to the goal, and the
+    unlabeled tiles bordering the BFS frontier are queued.
+    """
+    engine = self.engine
+    inf = float("inf")
+    size = engine.width * engine.height
+    self._change_count = len(engine.collision_changes)
+    self._root = self._s_goal
+    self.km = 0
+    self.g = [inf] * size
+    self.rhs = [inf] * size
+    # <_open> maps each queued tile to its current key. Heap entries whose
+    # key no longer matches are stale and skipped.
+    self._open = dict()
+    self._heap = []
+
+    goal = self._s_goal
+    if not engine._passable[goal]:
+      # Nothing may step onto a collision block, so only the goal itself has
+      # a distance.
+      self.g[goal] = self.rhs[goal] = 0
+    else:
+      # Going from a tile to the goal only ever steps onto passable tiles,
+      # the same tiles a BFS from the goal may enter, so BFS distances from
+      # the goal are exact distances to the goal.
+      dist = engine.bfs([self.goal], [self.start])
+      limit = dist[self._s_start]
+      for i, d in enumerate(dist):
+        if d >= 0:
+          self.g[i] = self.rhs[i] = d
+      if limit >= 0:
+        # The BFS stopped early; tiles at the last level were not expanded.
+        for i, d in enumerate(dist):
+          if d == limit:
+            for u in engine.neighbors(i):
+              if dist[u] < 0:
+                self._update_vertex(u)
+    self._update_vertex(self._s_start)
+    self._compute_shortest_path()
+
+
+  def _extract_path(self):
+    engine = self.engine
+    passable = engine._passable
+    inf = float("inf")
+    g = self.g
+    s = self._s_start
+    if g[s] == inf:
+      return []
+    the_path = [s]
+    max_len = engine.width * engine.height
+    while s != self._s_goal:
+      best = None
+      best_cost = inf
+      for v in engine.neighbors(s):
+        if passable[v] and g[v] + 1 < best_cost:
+          best = v
+          best_cost = g[v] + 1
+      if best is None or len(the_path) > max_len:
+        return []
+      s = best
+      the_path += [s]
+    return the_path
+
+
+  def _h(self, a, b):
+    width = self.engine.width
+    return abs(a % width - b % width) + abs(a // width - b // width)
+
+
+  def _key(self, u):
+    m = min(self.g[u], self.rhs[u])
+    return (m + self._h(self._s_start, u) + self.km, m)
+
+
+  def _push(self, u):
+    k = self._key(u)
+    self._open[u] = k
+    heapq.heappush(self._heap, (k, u))
+
+
+  def _top(self):
+    while self._heap:
+      k, u = self._heap[0]
+      if self._open.get(u) == k:
+        return k, u
+      heapq.heappop(self._heap)
+    return None
+
+
+  def _update_vertex(self, u):
+    if u != self._root:
+      passable = self.engine._passable
+      g = self.g
+      rhs = float("inf")
+      for v in self.engine.neighbors(u):
+        if passable[v] and g[v] + 1 < rhs:
+          rhs = g[v] + 1
+      self.rhs[u] = rhs
+    self._open.pop(u, None)
+    if self.g[u] != self.rhs[u]:
+      self._push(u)
+
+
+  def _compute_shortest_path(self):
+    s = self._s_start
+    while True:
+      top = self._top()
+      if top is None:
+        break
+      k_old, u = top
+      if not k_old < self._key(s) and self.rhs[s] == self.g[s]:
+        break
+      k_new = self._key(u)
+      if k_old < k_new:
+        self._push(u)
+        continue
+      heapq.heappop(self._heap)
+      del self._open[u]
+      if self.g[u] > self.rhs[u]:
+        self.g[u] = self.rhs[u]
+        for p in self.engine.neighbors(u):
+          self._update_vertex(p)
+      else:
+        self.g[u] = float("inf")
+        self._update_vertex(u)
+        for p in self.engine.neighbors(u):
+          self._update_vertex(p)
+
+
+# <_pool_engine> is the copy of the PathEngine that a PathPool worker process
+# plans on. It is set once per worker by _init_pool_worker().
+_pool_engine = None
+
+
+def _init_pool_worker(engine):
+  global _pool_engine
+  _pool_engine = engine
+
+
+def _plan_pool_group(task):
+  goals, starts = task
+  return _pool_engine._plan_group(goals, starts)
+
+
+class PathPool:
+  """
+  A pool of worker processes that each hold a copy of a PathEngine, for
+  fanning out PathEngine.find_nearest_paths() batches. The workers are
+  restarted whenever the engine's collision grid changes, so that they
+  never plan on a stale map.
+  """
+  def __init__(self, engine, processes):
+    """
+    INPUT:
+      engine: The PathEngine to plan on.
+      processes: The number of worker processes.
+    """
+    self.engine = engine
+    self.processes = processes
+    self._executor = None
+    self._version = None
+
+
+  def map(self, tasks):
+    """
+    Runs PathEngine._plan_group() on every (goals, starts) task in the 
+    workers, and returns the results in order.
+    """
+    if self._executor is None or self._version != self.engine.version:
+      self.close()
+      self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                           initializer=_init_pool_worker,
+                                           initargs=(self.engine,))
+      self._version = self.engine.version
+    return list(self._executor.map(_plan_pool_group, tasks))
+
+
+  def close(self):
+    if self._executor is not None:
+      self._executor.shutdown()
+      self._executor = None
+
+
+# <_path_engines> caches the PathEngine of each collision maze that the legacy
+# path_finder functions, which only hand us the raw maze, are called on. It 
+# only holds weak references, so an engine is dropped as soon as nothing else
+# uses it (a Maze keeps its own engine in Maze.path_engine). Each engine keeps
+# its maze list in <_source>, so that the id() in its key cannot be recycled
+# while the entry is alive. 
+_path_engines = weakref.WeakValueDictionary()
+
+
+def get_path_engine(collision_maze, collision_block_char):
+  """
+  Returns the shared PathEngine for <collision_maze>, building it if no live
+  one exists.
+
+  INPUT:
+    collision_maze: A row-major list of rows (e.g., Maze.collision_maze).
+    collision_block_char: The value that marks a collision block.
+  OUTPUT:
+    The PathEngine instance for this maze.
+  """
+  key = (id(collision_maze), collision_block_char)
+  engine = _path_engines.get(key)
+  if engine is None or engine._source is not collision_maze:
+    engine = PathEngine(collision_maze, collision_block_char)
+    engine._source = collision_maze
+    _path_engines[key] = engine
+  return engine
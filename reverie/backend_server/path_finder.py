@@ -7,6 +7,8 @@ Some of the functions are defunct.
 """
 import numpy as np
 
+from path_engine import *
+
 def print_maze(maze):
   for row in maze:
     for item in row:
@@ -162,17 +164,16 @@ def path_finder_v2(a, start, end, collision_block_char, verbose=False):
 
 
 def path_finder(maze, start, end, collision_block_char, verbose=False):
-  # EMERGENCY PATCH
-  start = (start[1], start[0])
-  end = (end[1], end[0])
-  # END EMERGENCY PATCH
-
-  path = path_finder_v2(maze, start, end, collision_block_char, verbose)
-
-  new_path = []
-  for i in path: 
-    new_path += [(i[1], i[0])]
-  path = new_path
+  # The search itself is delegated to the PathEngine that is shared by every
+  # call on this maze; path_finder_v2 is kept above as the reference 
+  # implementation. Both start and end are (x, y) tiles. 
+  engine = get_path_engine(maze, collision_block_char)
+  path = engine.find_path(start, end)
+
+  if not path: 
+    # An unreachable end tile keeps the old behavior of returning just the
+    # end tile, so callers that drop the first element stay where they are.
+    path = [(end[0], end[1])]
   
   return path
 
@@ -17,6 +17,7 @@ from persona.memory_structures.associative_memory import *
 from persona.memory_structures.scratch import *
 from persona.cognitive_modules.retrieve import *
 from persona.prompt_template.run_gpt_prompt import *
+from poignancy_cache import *
 
 def generate_agent_chat_summarize_ideas(init_persona, 
                                         target_persona, 
@@ -231,19 +232,27 @@ def generate_poig_score(persona, event_type, description):
     return 1
 
   if event_type == "event" or event_type == "thought": 
-    return run_gpt_prompt_event_poignancy(persona, description)[0]
+    return get_cached_poignancy(persona, "event", description, 
+             lambda i: run_gpt_prompt_event_poignancy(persona, i)[0])
   elif event_type == "chat": 
-    return run_gpt_prompt_chat_poignancy(persona, 
-                           persona.scratch.act_description)[0]
+    return get_cached_poignancy(persona, "chat", 
+             persona.scratch.act_description, 
+             lambda i: run_gpt_prompt_chat_poignancy(persona, i)[0])
 
 
 def load_history_via_whisper(personas, whispers):
+  # The inner thoughts of all whispers are generated first, so that they can
+  # be embedded in one batch. 
+  thoughts = []
   for count, row in enumerate(whispers): 
+    thought = generate_inner_thought(personas[row[0]], row[1])
+    request_embedding(thought)
+    thoughts += [thought]
+
+  for row, thought in zip(whispers, thoughts): 
     persona = personas[row[0]]
     whisper = row[1]
 
-    thought = generate_inner_thought(persona, whisper)
-
     created = persona.scratch.curr_time
     expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
     s, p, o = generate_action_event_triple(thought, persona)
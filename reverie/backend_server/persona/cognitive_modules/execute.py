@@ -10,9 +10,167 @@ sys.path.append('../../')
 
 from global_methods import *
 from path_finder import *
+from path_engine import *
+from address_registry import *
 from utils import *
 
-def execute(persona, maze, personas, plan): 
+def repair_planned_path(persona, maze, personas, plan): 
+  """
+  Keeps a <planned_path> that was set on an earlier step up to date. For 
+  <persona> plans, we re-target the midpoint between the two personas 
+  whenever the other persona has moved since the path was planned. For all
+  other plans, we only repair the path if the collision map has changed 
+  since it was planned. Both go through the persona's <IncrementalPlanner>.
+  Repairs for collision changes only re-expand the tiles the change 
+  affected; a goal that moved off the path costs about as much as a fresh
+  search, which is why we skip re-targeting while the other persona stays
+  put. 
+
+  INPUT:
+    persona: Current <Persona> instance.  
+    maze: An instance of current <Maze>.
+    personas: A dictionary of all personas in the world. 
+    plan: This is a string address of the action we need to execute. 
+  OUTPUT: 
+    None
+  """
+  scratch = persona.scratch
+  engine = maze.path_engine
+  retarget = get_address_kind(plan) == "<persona>"
+  if retarget: 
+    goal = personas[get_address_target(plan)].scratch.curr_tile
+    goal = (goal[0], goal[1])
+    if (goal == scratch.planned_path_goal 
+        and scratch.planned_path_version == engine.version): 
+      # The other persona has not moved since we planned, so our path still
+      # leads to the midpoint between us. 
+      return
+  elif (scratch.planned_path 
+        and scratch.planned_path_version != engine.version): 
+    goal = scratch.planned_path[-1]
+  else: 
+    return
+
+  if not scratch.path_planner: 
+    scratch.path_planner = IncrementalPlanner(engine, scratch.curr_tile, goal)
+  else: 
+    scratch.path_planner.move_start(scratch.curr_tile)
+    scratch.path_planner.move_goal(goal)
+  path = scratch.path_planner.find_path()
+
+  if retarget: 
+    # Just like when the path is first set, we head to the midpoint of the
+    # path between us, and stay put once we are at most one step apart. 
+    if len(path) <= 2: 
+      path = path[:1]
+    else: 
+      path = path[:int(len(path)/2)+1]
+    scratch.planned_path_goal = goal
+
+  scratch.planned_path = path[1:]
+  scratch.planned_path_version = engine.version
+
+
+def is_tile_occupied(maze, personas, tile): 
+  """
+  Returns True if any of the personas has an event on <tile>, i.e., is 
+  standing there. 
+  """
+  for i in maze.tile_events.get((tile[0], tile[1]), ()): 
+    if i[0] in personas: 
+      return True
+  return False
+
+
+def get_path_targets(persona, maze, personas, plan): 
+  """
+  Picks the tiles that the persona may go to in order to execute a plan for
+  which no path has been set yet. 
+
+  INPUT:
+    persona: Current <Persona> instance.  
+    maze: An instance of current <Maze>.
+    personas: A dictionary of all personas in the world. 
+    plan: This is a string address of the action we need to execute. 
+  OUTPUT: 
+    A (target_tiles, path) pair. <path> is None unless picking the target 
+    tile already gave us the path to it (as for <persona> plans, and for 
+    address plans that follow the address' distance field). 
+  """
+  # <target_tiles> is a list of tile coordinates where the persona may go 
+  # to execute the current action. The goal is to pick one of them.
+  target_tiles = None
+  # <path> is set early when finding the target tile already gave us the
+  # path to it. 
+  path = None
+
+  # The kind of a plan (its marker, if any) is looked up in the address 
+  # registry instead of being searched for in the string. 
+  plan_kind = get_address_kind(plan)
+  if plan_kind == "<persona>": 
+    # Executing persona-persona interaction.
+    target_p_tile = personas[get_address_target(plan)].scratch.curr_tile
+    # We head to the midpoint of the shortest path between the two 
+    # personas. A single search gives us both that tile and our path to it.
+    meeting_tile, path = maze.path_engine.find_meeting_point(
+                           persona.scratch.curr_tile, target_p_tile)
+    target_tiles = [meeting_tile]
+
+  elif plan_kind == "<waiting>": 
+    # Executing interaction where the persona has decided to wait before 
+    # executing their action.
+    x = int(plan.split()[1])
+    y = int(plan.split()[2])
+    target_tiles = [[x, y]]
+
+  elif plan_kind == "<random>": 
+    # Executing a random location action.
+    plan = ":".join(get_address_parts(plan)[:-1])
+    target_tiles = maze.address_tiles[plan]
+    target_tiles = random.sample(list(target_tiles), 1)
+
+  else: 
+    # This is our default execution. We simply take the persona to the
+    # location where the current action is taking place. 
+    # Retrieve the target addresses. Again, plan is an action address in its
+    # string form. <maze.address_tiles> takes its id and returns candidate 
+    # coordinates. 
+    target_tiles = maze.address_tiles.get_by_id(get_address_id(plan))
+    if target_tiles is None: 
+      maze.address_tiles["Johnson Park:park:park garden"] #ERRORRRRRRR
+
+    # Following the address' distance field gives us the path to its 
+    # nearest tile without a search. We take it unless another persona is 
+    # already on that tile, in which case we pick among a few of the 
+    # address' tiles below. 
+    if maze.use_distance_fields: 
+      field_path = maze.get_path_to_address(persona.scratch.curr_tile, plan)
+      if (field_path 
+          and not is_tile_occupied(maze, personas, field_path[-1])): 
+        return [field_path[-1]], field_path
+
+  # There are sometimes more than one tile returned from this (e.g., a tabe
+  # may stretch many coordinates). So, we sample a few here. And from that 
+  # random sample, we will take the closest ones. 
+  if len(target_tiles) < 4: 
+    target_tiles = random.sample(list(target_tiles), len(target_tiles))
+  else:
+    target_tiles = random.sample(list(target_tiles), 4)
+  # If possible, we want personas to occupy different tiles when they are 
+  # headed to the same location on the maze. It is ok if they end up on the 
+  # same time, but we try to lower that probability. 
+  # We take care of that overlap here.  
+  new_target_tiles = []
+  for i in target_tiles: 
+    if not is_tile_occupied(maze, personas, i): 
+      new_target_tiles += [i]
+  if len(new_target_tiles) == 0: 
+    new_target_tiles = target_tiles
+  target_tiles = new_target_tiles
+  return target_tiles, path
+
+
+def execute(persona, maze, personas, plan, path=None): 
   """
   Given a plan (action's string address), we execute the plan (actually 
   outputs the tile coordinate path and the next coordinate for the 
@@ -28,129 +186,66 @@ def execute(persona, maze, personas, plan):
        indexing (e.g., [-1]) because the latter address elements may not be 
        present in some cases. 
        e.g., "dolores double studio:double studio:bedroom 1:bed"
+    path: Optional path from the persona's curr_tile, found beforehand by 
+          execute_all(). It is only used if no path is set yet. 
     
   OUTPUT: 
     execution
   """
-  if "<random>" in plan and persona.scratch.planned_path == []: 
+  if (get_address_kind(plan) == "<random>" 
+      and persona.scratch.planned_path == []): 
     persona.scratch.act_path_set = False
 
   # <act_path_set> is set to True if the path is set for the current action. 
   # It is False otherwise, and means we need to construct a new path. 
   if not persona.scratch.act_path_set: 
-    # <target_tiles> is a list of tile coordinates where the persona may go 
-    # to execute the current action. The goal is to pick one of them.
-    target_tiles = None
-
-    print ('aldhfoaf/????')
-    print (plan)
-
-    if "<persona>" in plan: 
-      # Executing persona-persona interaction.
-      target_p_tile = (personas[plan.split("<persona>")[-1].strip()]
-                       .scratch.curr_tile)
-      potential_path = path_finder(maze.collision_maze, 
-                                   persona.scratch.curr_tile, 
-                                   target_p_tile, 
-                                   collision_block_id)
-      if len(potential_path) <= 2: 
-        target_tiles = [potential_path[0]]
-      else: 
-        potential_1 = path_finder(maze.collision_maze, 
-                                persona.scratch.curr_tile, 
-                                potential_path[int(len(potential_path)/2)], 
-                                collision_block_id)
-        potential_2 = path_finder(maze.collision_maze, 
-                                persona.scratch.curr_tile, 
-                                potential_path[int(len(potential_path)/2)+1], 
-                                collision_block_id)
-        if len(potential_1) <= len(potential_2): 
-          target_tiles = [potential_path[int(len(potential_path)/2)]]
-        else: 
-          target_tiles = [potential_path[int(len(potential_path)/2+1)]]
-    
-    elif "<waiting>" in plan: 
-      # Executing interaction where the persona has decided to wait before 
-      # executing their action.
-      x = int(plan.split()[1])
-      y = int(plan.split()[2])
-      target_tiles = [[x, y]]
-
-    elif "<random>" in plan: 
-      # Executing a random location action.
-      plan = ":".join(plan.split(":")[:-1])
-      target_tiles = maze.address_tiles[plan]
-      target_tiles = random.sample(list(target_tiles), 1)
+    # <path> is only given when it was already found in a batch along with
+    # the other personas' paths (see execute_all). 
+    if path is None: 
+      target_tiles, path = get_path_targets(persona, maze, personas, plan)
 
-    else: 
-      # This is our default execution. We simply take the persona to the
-      # location where the current action is taking place. 
-      # Retrieve the target addresses. Again, plan is an action address in its
-      # string form. <maze.address_tiles> takes this and returns candidate 
-      # coordinates. 
-      if plan not in maze.address_tiles: 
-        maze.address_tiles["Johnson Park:park:park garden"] #ERRORRRRRRR
-      else: 
-        target_tiles = maze.address_tiles[plan]
-
-    # There are sometimes more than one tile returned from this (e.g., a tabe
-    # may stretch many coordinates). So, we sample a few here. And from that 
-    # random sample, we will take the closest ones. 
-    if len(target_tiles) < 4: 
-      target_tiles = random.sample(list(target_tiles), len(target_tiles))
-    else:
-      target_tiles = random.sample(list(target_tiles), 4)
-    # If possible, we want personas to occupy different tiles when they are 
-    # headed to the same location on the maze. It is ok if they end up on the 
-    # same time, but we try to lower that probability. 
-    # We take care of that overlap here.  
-    persona_name_set = set(personas.keys())
-    new_target_tiles = []
-    for i in target_tiles: 
-      curr_event_set = maze.access_tile(i)["events"]
-      pass_curr_tile = False
-      for j in curr_event_set: 
-        if j[0] in persona_name_set: 
-          pass_curr_tile = True
-      if not pass_curr_tile: 
-        new_target_tiles += [i]
-    if len(new_target_tiles) == 0: 
-      new_target_tiles = target_tiles
-    target_tiles = new_target_tiles
-
-    # Now that we've identified the target tile, we find the shortest path to
-    # one of the target tiles. 
-    curr_tile = persona.scratch.curr_tile
-    collision_maze = maze.collision_maze
-    closest_target_tile = None
-    path = None
-    for i in target_tiles: 
-      # path_finder takes a collision_mze and the curr_tile coordinate as 
-      # an input, and returns a list of coordinate tuples that becomes the
-      # path. 
+      # Now that we've identified the target tile, we find the shortest path to
+      # one of the target tiles. 
+      # find_nearest_path runs a single search from our curr_tile that stops as
+      # soon as the nearest of the target tiles is reached (on large maps, it 
+      # plans on the region graph instead), and returns a list of coordinate 
+      # tuples that becomes the path. 
       # e.g., [(0, 1), (1, 1), (1, 2), (1, 3), (1, 4)...]
-      curr_path = path_finder(maze.collision_maze, 
-                              curr_tile, 
-                              i, 
-                              collision_block_id)
-      if not closest_target_tile: 
-        closest_target_tile = i
-        path = curr_path
-      elif len(curr_path) < len(path): 
-        closest_target_tile = i
-        path = curr_path
+      if path is None: 
+        curr_tile = persona.scratch.curr_tile
+        closest_target_tile, path = maze.find_nearest_path(curr_tile, 
+                                                           target_tiles)
 
     # Actually setting the <planned_path> and <act_path_set>. We cut the 
     # first element in the planned_path because it includes the curr_tile. 
+    # If none of the target tiles can be reached, <path> is empty and we stay
+    # where we are. 
     persona.scratch.planned_path = path[1:]
     persona.scratch.act_path_set = True
+    persona.scratch.path_planner = None
+    persona.scratch.planned_path_version = maze.path_engine.version
+    persona.scratch.planned_path_goal = None
+    if get_address_kind(plan) == "<persona>": 
+      target_p_tile = personas[get_address_target(plan)].scratch.curr_tile
+      persona.scratch.planned_path_goal = (target_p_tile[0], target_p_tile[1])
+
+  else: 
+    # The path was set on an earlier step. We repair it in case the persona
+    # we are walking to has moved, or the collision map has changed. 
+    repair_planned_path(persona, maze, personas, plan)
   
   # Setting up the next immediate step. We stay at our curr_tile if there is
   # no <planned_path> left, but otherwise, we go to the next tile in the path.
+  # If a step lasts long enough to walk several tiles, we go that many tiles
+  # down the path instead, and keep the tiles we walked in <step_path>. 
+  tiles_per_step = max(1, int(persona.scratch.sec_per_step / sec_per_tile))
   ret = persona.scratch.curr_tile
+  persona.scratch.step_path = []
   if persona.scratch.planned_path: 
-    ret = persona.scratch.planned_path[0]
-    persona.scratch.planned_path = persona.scratch.planned_path[1:]
+    persona.scratch.step_path = persona.scratch.planned_path[:tiles_per_step]
+    persona.scratch.planned_path = (persona.scratch
+                                    .planned_path[tiles_per_step:])
+    ret = persona.scratch.step_path[-1]
 
   description = f"{persona.scratch.act_description}"
   description += f" @ {persona.scratch.act_address}"
@@ -159,16 +254,46 @@ def execute(persona, maze, personas, plan):
   return execution
 
 
+def execute_all(maze, personas, plans, pool=None): 
+  """
+  Executes the plans of all personas in a step. Unlike calling execute() for
+  each persona in turn, the new paths that the personas need are all found 
+  together in one batch (see Maze.find_nearest_paths), so personas that head
+  to the same place share one search. 
 
+  INPUT:
+    maze: An instance of current <Maze>.
+    personas: A dictionary of all personas in the world. 
+    plans: A dictionary that maps the names of the personas to execute to
+           their plans. 
+    pool: Optional PathPool for maze.path_engine. 
+  OUTPUT: 
+    A dictionary that maps the names in <plans> to their executions. 
+  """
+  names = []
+  requests = []
+  paths = dict()
+  for persona_name, plan in plans.items(): 
+    persona = personas[persona_name]
+    if (get_address_kind(plan) == "<random>" 
+        and persona.scratch.planned_path == []): 
+      persona.scratch.act_path_set = False
+    if persona.scratch.act_path_set: 
+      continue
+    target_tiles, path = get_path_targets(persona, maze, personas, plan)
+    if path is None: 
+      names += [persona_name]
+      requests += [(persona.scratch.curr_tile, target_tiles)]
+    else: 
+      paths[persona_name] = path
 
+  for persona_name, (_, path) in zip(names, 
+                                     maze.find_nearest_paths(requests, pool)): 
+    paths[persona_name] = path
 
-
-
-
-
-
-
-
-
-
+  executions = dict()
+  for persona_name, plan in plans.items(): 
+    executions[persona_name] = execute(personas[persona_name], maze, personas,
+                                       plan, paths.get(persona_name))
+  return executions
 
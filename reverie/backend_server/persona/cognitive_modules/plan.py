@@ -12,6 +12,7 @@ import time
 sys.path.append('../../')
 
 from global_methods import *
+from address_registry import *
 from persona.prompt_template.run_gpt_prompt import *
 from persona.cognitive_modules.retrieve import *
 from persona.cognitive_modules.converse import *
@@ -730,7 +731,7 @@ def _should_react(persona, retrieved, personas):
     if init_persona.scratch.curr_time.hour == 23: 
       return False
 
-    if "<waiting>" in target_persona.scratch.act_address: 
+    if get_address_kind(target_persona.scratch.act_address) == "<waiting>": 
       return False
 
     if (target_persona.scratch.chatting_with 
@@ -788,7 +789,7 @@ def _should_react(persona, retrieved, personas):
   # If the persona is chatting right now, default to no reaction 
   if persona.scratch.chatting_with: 
     return False
-  if "<waiting>" in persona.scratch.act_address: 
+  if get_address_kind(persona.scratch.act_address) == "<waiting>": 
     return False
 
   # Recall that retrieved takes the following form: 
@@ -15,6 +15,7 @@ from numpy.linalg import norm
 
 from global_methods import *
 from persona.prompt_template.run_gpt_prompt import *
+from poignancy_cache import *
 from persona.prompt_template.gpt_structure import *
 from persona.cognitive_modules.retrieve import *
 
@@ -77,10 +78,12 @@ def generate_poig_score(persona, event_type, description):
     return 1
 
   if event_type == "event" or event_type == "thought": 
-    return run_gpt_prompt_event_poignancy(persona, description)[0]
+    return get_cached_poignancy(persona, "event", description, 
+             lambda i: run_gpt_prompt_event_poignancy(persona, i)[0])
   elif event_type == "chat": 
-    return run_gpt_prompt_chat_poignancy(persona, 
-                           persona.scratch.act_description)[0]
+    return get_cached_poignancy(persona, "chat", 
+             persona.scratch.act_description, 
+             lambda i: run_gpt_prompt_chat_poignancy(persona, i)[0])
 
 
 
@@ -119,6 +122,9 @@ def run_reflect(persona):
     for xxx in xx: print (xxx)
 
     thoughts = generate_insights_and_evidence(persona, nodes, 5)
+    # The thoughts are embedded together on the first get_embedding() call.
+    for thought in thoughts: 
+      request_embedding(thought)
     for thought, evidence in thoughts.items(): 
       created = persona.scratch.curr_time
       expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
@@ -189,7 +195,12 @@ def reflect(persona):
   # print (persona.scratch.name, "al;sdhfjlsad", persona.scratch.chatting_end_time)
   if persona.scratch.chatting_end_time: 
     # print("DEBUG", persona.scratch.curr_time + datetime.timedelta(0,10))
-    if persona.scratch.curr_time + datetime.timedelta(0,10) == persona.scratch.chatting_end_time: 
+    # We wrap up the chat on its last step, i.e., when it ends before the 
+    # next step. 
+    next_step_time = (persona.scratch.curr_time 
+                      + datetime.timedelta(seconds=persona.scratch.sec_per_step))
+    if (persona.scratch.curr_time < persona.scratch.chatting_end_time 
+        <= next_step_time): 
       # print ("KABOOOOOMMMMMMM")
       all_utt = ""
       if persona.scratch.chat: 
@@ -216,6 +227,14 @@ def reflect(persona):
       planning_thought = generate_planning_thought_on_convo(persona, all_utt)
       planning_thought = f"For {persona.scratch.name}'s planning: {planning_thought}"
 
+      memo_thought = generate_memo_on_convo(persona, all_utt)
+      memo_thought = f"{persona.scratch.name} {memo_thought}"
+
+      # Both thoughts are embedded together on the first get_embedding() 
+      # call. 
+      request_embedding(planning_thought)
+      request_embedding(memo_thought)
+
       created = persona.scratch.curr_time
       expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
       s, p, o = generate_action_event_triple(planning_thought, persona)
@@ -229,9 +248,6 @@ def reflect(persona):
 
 
 
-      memo_thought = generate_memo_on_convo(persona, all_utt)
-      memo_thought = f"{persona.scratch.name} {memo_thought}"
-
       created = persona.scratch.curr_time
       expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
       s, p, o = generate_action_event_triple(memo_thought, persona)
@@ -5,10 +5,13 @@ File: retrieve.py
 Description: This defines the "Retrieve" module for generative agents. 
 """
 import sys
+import time
 sys.path.append('../../')
 
+import retrieval_trace
 from global_methods import *
 from persona.prompt_template.gpt_structure import *
+from persona.memory_structures.node_matrix import top_highest_x_indices
 
 from numpy import dot
 from numpy.linalg import norm
@@ -227,50 +230,85 @@ def new_retrieve(persona, focal_points, n_count=30, weights=None):
     gw = weights
   # <retrieved> is the main dictionary that we are returning
   retrieved = dict() 
-  for focal_pt in focal_points: 
-    # Getting all nodes from the agent's memory (both thoughts and events) and
-    # sorting them by the datetime of creation.
-    # You could also imagine getting the raw conversation, but for now. 
-    nodes = [[i.last_accessed, i]
-              for i in persona.a_mem.seq_event + persona.a_mem.seq_thought
-              if "idle" not in i.embedding_key]
-    nodes = sorted(nodes, key=lambda x: x[0])
-    nodes = [i for created, i in nodes]
-
-    # Calculating the component dictionaries and normalizing them.
-    recency_out = extract_recency(persona, nodes)
-    recency_out = normalize_dict_floats(recency_out, 0, 1)
-    importance_out = extract_importance(persona, nodes)
-    importance_out = normalize_dict_floats(importance_out, 0, 1)  
-    relevance_out = extract_relevance(persona, nodes, focal_pt)
-    relevance_out = normalize_dict_floats(relevance_out, 0, 1)
-
-    master_out = dict()
-    for key in recency_out.keys(): 
-      master_out[key] = (persona.scratch.recency_w*recency_out[key]*gw[0] 
-                     + persona.scratch.relevance_w*relevance_out[key]*gw[1] 
-                     + persona.scratch.importance_w*importance_out[key]*gw[2])
-
-    master_out = top_highest_x_values(master_out, len(master_out.keys()))
-    for key, val in master_out.items(): 
-      print (persona.a_mem.id_to_node[key].embedding_key, val)
-      print (persona.scratch.recency_w*recency_out[key]*1, 
-             persona.scratch.relevance_w*relevance_out[key]*1, 
-             persona.scratch.importance_w*importance_out[key]*1)
+  if not focal_points: 
+    return retrieved
+
+  # <sink> is the retrieval trace sink, if tracing is on (see 
+  # retrieval_trace.py). Nothing is timed or recorded otherwise. 
+  sink = retrieval_trace.retrieval_trace_sink
+  if sink is not None: 
+    trace = {"persona": persona.scratch.name, 
+             "curr_time": str(persona.scratch.curr_time), 
+             "n_count": n_count, 
+             "weights": list(gw), 
+             "timings": {"embed": 0.0, "score": 0.0, "rank": 0.0}, 
+             "focal_points": []}
+    start = time.perf_counter()
+
+  # Scoring all nodes from the agent's memory (both thoughts and events). 
+  # The focal points that are not in the query embedding cache are embedded
+  # together, and their relevance scores are computed with one matrix 
+  # product. Recency and importance do not depend on the focal point, so 
+  # they are shared. 
+  # You could also imagine getting the raw conversation, but for now. 
+  focal_embeddings = get_query_embeddings(focal_points)
+  if sink is not None: 
+    trace["timings"]["embed"] = time.perf_counter() - start
+    start = time.perf_counter()
+  recency_out, importance, relevance_outs = (
+    persona.a_mem.get_retrieval_scores(
+      focal_embeddings, persona.scratch.recency_decay, focal_points))
+  nodes = persona.a_mem.node_matrix.nodes
+  if sink is not None: 
+    trace["timings"]["score"] = time.perf_counter() - start
+    trace["n_nodes"] = len(nodes)
+
+  for count, focal_pt in enumerate(focal_points): 
+    if sink is not None: 
+      start = time.perf_counter()
+    # <rows> are the node matrix rows sorted by the datetime of their last 
+    # access. It is redone for every focal point, as retrieving changes the
+    # access times. The component arrays are aligned with it. 
+    rows = persona.a_mem.node_matrix.get_access_order()
+    relevance_out = relevance_outs[count][rows]
+    importance_out = importance[rows]
+
+    master_out = (persona.scratch.recency_w*recency_out*gw[0] 
+                  + persona.scratch.relevance_w*relevance_out*gw[1] 
+                  + persona.scratch.importance_w*importance_out*gw[2])
 
     # Extracting the highest x values.
-    # <master_out> has the key of node.id and value of float. Once we get the 
-    # highest x values, we want to translate the node.id into nodes and return
-    # the list of nodes.
-    master_out = top_highest_x_values(master_out, n_count)
-    master_nodes = [persona.a_mem.id_to_node[key] 
-                    for key in list(master_out.keys())]
-
-    for n in master_nodes: 
-      n.last_accessed = persona.scratch.curr_time
+    # <master_out> is aligned with <rows>. Once we get the indices of the 
+    # highest x values, we translate them into nodes and return the list of
+    # nodes.
+    top = top_highest_x_indices(master_out, n_count)
+    master_nodes = [nodes[rows[i]] for i in top]
+
+    persona.a_mem.set_last_accessed(master_nodes, persona.scratch.curr_time)
       
     retrieved[focal_pt] = master_nodes
 
+    if sink is not None: 
+      trace["timings"]["rank"] += time.perf_counter() - start
+      # The score breakdown has the components weighted by the persona's 
+      # weights, but not by <gw>. 
+      trace["focal_points"] += [{
+        "focal_pt": focal_pt, 
+        "n_candidates": persona.a_mem.last_candidate_counts[count], 
+        "top": [{"node_id": nodes[rows[i]].node_id, 
+                 "embedding_key": nodes[rows[i]].embedding_key, 
+                 "score": float(master_out[i]), 
+                 "recency": float(persona.scratch.recency_w
+                                  * recency_out[i]), 
+                 "relevance": float(persona.scratch.relevance_w
+                                    * relevance_out[i]), 
+                 "importance": float(persona.scratch.importance_w
+                                     * importance_out[i])} 
+                for i in top]}]
+
+  if sink is not None: 
+    sink.write(trace)
+
   return retrieved
 
 
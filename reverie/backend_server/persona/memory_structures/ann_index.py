@@ -0,0 +1,178 @@
+"""
+Author: irrealis (irrealis.chomp@gmail.com)
+
+File: ann_index.py
+Description: Defines approximate nearest neighbor indexes over the embedding
+rows of a NodeMatrix. With one, new_retrieve() only scores the relevance of
+the nodes that the index shortlists for a focal point, instead of all nodes
+of a persona's memory (see AssociativeMemory.get_retrieval_scores).
+
+IVFIndex is an inverted file index in pure numpy: the embeddings are split
+into clusters by spherical k-means, and a search only looks at the clusters
+whose centroids are the closest to the query. HNSWIndex wraps hnswlib, if it
+is installed. Both are updated as embeddings are added, and have the same
+set() and search() methods.
+"""
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import numpy as np
+
+try:
+  import hnswlib
+except ImportError:
+  hnswlib = None
+
+
+def normalize_rows(vectors):
+  norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+  norms[norms == 0] = 1
+  return vectors / norms
+
+
+class IVFIndex:
+  """
+  The clusters are trained once there are <train_min> embeddings, and are
+  retrained whenever the number of embeddings has doubled since; in
+  between, new embeddings are added to the cluster of their closest
+  centroid. Until it is trained, a search returns all rows.
+  """
+  def __init__(self, train_min=1024, n_probe=8, kmeans_iters=10, seed=0):
+    self.train_min = train_min
+    self.n_probe = n_probe
+    self.kmeans_iters = kmeans_iters
+    self.rng = np.random.default_rng(seed)
+
+    self.count = 0
+    self.trained_count = 0
+    # <centroids> are the unit length centroids of the clusters, and
+    # <lists> the lists of the rows in each cluster. <assignments> maps the
+    # rows to their clusters.
+    self.centroids = None
+    self.lists = []
+    self.assignments = dict()
+
+
+  def set(self, row, embedding, embeddings):
+    """
+    Adds or updates the embedding of <row>.
+
+    INPUT:
+      row: The embedding row in the NodeMatrix.
+      embedding: The (new) embedding of <row>.
+      embeddings: All embeddings of the NodeMatrix (<row> included), which
+                  are used when the clusters are (re)trained.
+    """
+    self.count = max(self.count, row + 1)
+    if self.count >= max(self.train_min, 2 * self.trained_count):
+      self.train(embeddings[:self.count])
+      return
+    if self.centroids is None:
+      return
+
+    if row in self.assignments:
+      self.lists[self.assignments[row]].remove(row)
+    cluster = int(np.argmax(self.centroids @ normalize_rows(embedding)))
+    self.lists[cluster] += [row]
+    self.assignments[row] = cluster
+
+
+  def train(self, embeddings):
+    n_lists = max(1, int(np.sqrt(len(embeddings))))
+    vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+
+    # The centroids are trained on a sample, which is plenty to place them.
+    sample_size = min(len(vectors), 64 * n_lists)
+    sample = vectors[self.rng.choice(len(vectors), sample_size,
+                                     replace=False)]
+    centroids = sample[self.rng.choice(sample_size, n_lists, replace=False)]
+    for i in range(self.kmeans_iters):
+      clusters = np.argmax(sample @ centroids.T, axis=1)
+      for cluster in range(n_lists):
+        members = sample[clusters == cluster]
+        if len(members) == 0:
+          # Empty clusters restart at a random sample.
+          centroids[cluster] = sample[self.rng.integers(sample_size)]
+        else:
+          centroids[cluster] = members.sum(axis=0)
+      centroids = normalize_rows(centroids)
+
+    self.centroids = centroids
+    self.lists = [[] for i in range(n_lists)]
+    self.assignments = dict()
+    # Assigning in blocks keeps the similarity matrix small.
+    for start in range(0, len(vectors), 4096):
+      block = vectors[start:start + 4096] @ centroids.T
+      for row, cluster in enumerate(np.argmax(block, axis=1), start):
+        self.lists[cluster] += [row]
+        self.assignments[row] = int(cluster)
+    self.trained_count = len(vectors)
+    log.debug(f"Trained IVF index: {len(vectors)} rows, {n_lists} lists")
+
+
+  def search(self, query, n):
+    """
+    Returns the rows in the clusters closest to <query>: at least the
+    <n_probe> closest clusters, and more until there are <n> rows.
+    """
+    if self.centroids is None:
+      return np.arange(self.count)
+    sims = self.centroids @ normalize_rows(np.asarray(query,
+                                                      dtype=np.float32))
+    rows = []
+    for count, cluster in enumerate(np.argsort(-sims)):
+      if count >= self.n_probe and len(rows) >= n:
+        break
+      rows += self.lists[cluster]
+    return np.array(rows, dtype=np.int64)
+
+
+class HNSWIndex:
+  """
+  A hierarchical navigable small world graph index, from hnswlib. Rows are
+  used as the hnswlib labels, so updating the embedding of a row replaces
+  its element.
+  """
+  def __init__(self, M=16, ef_construction=200, ef_search=100):
+    if hnswlib is None:
+      raise ImportError("The hnsw retrieval index needs hnswlib "
+                        "(pip install hnswlib).")
+    self.M = M
+    self.ef_construction = ef_construction
+    self.ef_search = ef_search
+    self.count = 0
+    self.index = None
+
+
+  def set(self, row, embedding, embeddings):
+    embedding = np.asarray(embedding, dtype=np.float32)
+    if self.index is None:
+      self.index = hnswlib.Index(space="cosine", dim=len(embedding))
+      self.index.init_index(max_elements=1024,
+                            ef_construction=self.ef_construction, M=self.M)
+    if row >= self.index.get_max_elements():
+      self.index.resize_index(2 * self.index.get_max_elements())
+    self.index.add_items(embedding[None], [row])
+    self.count = max(self.count, row + 1)
+
+
+  def search(self, query, n):
+    k = min(n, self.index.get_current_count())
+    self.index.set_ef(max(k, self.ef_search))
+    labels, distances = self.index.knn_query(
+      np.asarray(query, dtype=np.float32)[None], k=k)
+    return labels[0].astype(np.int64)
+
+
+def make_ann_index(kind):
+  """
+  Returns a new index of the given kind: None (no index), "ivf", or "hnsw".
+  """
+  if kind is None:
+    return None
+  if kind == "ivf":
+    return IVFIndex()
+  if kind == "hnsw":
+    return HNSWIndex()
+  raise ValueError(f"Unknown retrieval index: {kind}")
@@ -7,13 +7,24 @@ Description: Defines the core long-term memory module for generative agents.
 Note (May 1, 2023) -- this class is the Memory Stream module in the generative
 agents paper. 
 """
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
 import sys
 sys.path.append('../../')
 
 import json
 import datetime
+from collections import deque
+
+import numpy as np
 
 from global_methods import *
+from utils import *
+from persona.memory_structures.node_matrix import (
+  NodeMatrix, normalize_floats, top_highest_x_indices)
+from persona.memory_structures.ann_index import make_ann_index
 
 
 class ConceptNode: 
@@ -47,6 +58,48 @@ class ConceptNode:
     return (self.subject, self.predicate, self.object)
 
 
+class RecentEventWindow: 
+  """
+  The (s, p, o) summaries of the last <size> events of an associative 
+  memory, newest first. A counter of the summaries in the window makes
+  membership checks O(1), and adding an event only pushes the oldest one 
+  out, instead of rebuilding the window from the event sequence. 
+  """
+  def __init__(self, size): 
+    self.size = size
+    self.summaries = deque()
+    self.counts = dict()
+
+
+  def add(self, summary): 
+    self.summaries.appendleft(summary)
+    self.counts[summary] = self.counts.get(summary, 0) + 1
+    if len(self.summaries) > self.size: 
+      old = self.summaries.pop()
+      self.counts[old] -= 1
+      if self.counts[old] == 0: 
+        del self.counts[old]
+
+
+  def __contains__(self, summary): 
+    return summary in self.counts
+
+
+  def __len__(self): 
+    return len(self.summaries)
+
+
+  def to_list(self): 
+    return [list(i) for i in self.summaries]
+
+
+  def copy(self): 
+    window = RecentEventWindow(self.size)
+    window.summaries = deque(self.summaries)
+    window.counts = dict(self.counts)
+    return window
+
+
 class AssociativeMemory: 
   def __init__(self, f_saved): 
     self.id_to_node = dict()
@@ -54,6 +107,11 @@ class AssociativeMemory:
     self.seq_event = []
     self.seq_thought = []
     self.seq_chat = []
+    # <recent_event_windows> maps a retention (a number of events) to the
+    # RecentEventWindow of the latest events of that size. The windows are 
+    # made on first use (see get_recent_event_window) and are kept up to 
+    # date by add_event(). 
+    self.recent_event_windows = dict()
 
     self.kw_to_event = dict()
     self.kw_to_thought = dict()
@@ -62,6 +120,19 @@ class AssociativeMemory:
     self.kw_strength_event = dict()
     self.kw_strength_thought = dict()
 
+    # <node_matrix> keeps the non-idle events and thoughts (the nodes that
+    # new_retrieve() scores) in row-aligned arrays. 
+    self.node_matrix = NodeMatrix(
+      ann_index=make_ann_index(retrieval_ann_index))
+    # <retrieval_stats> counts, over all focal points retrieved for, the 
+    # nodes that were scored for relevance (the candidates) out of all 
+    # nodes, and how many retrievals scanned all nodes. 
+    self.retrieval_stats = {"retrievals": 0, "full_scans": 0, 
+                            "candidates": 0, "nodes": 0}
+    # <last_candidate_counts> are the candidate counts of the focal points 
+    # of the latest get_retrieval_scores() call. 
+    self.last_candidate_counts = []
+
     self.embeddings = json.load(open(f_saved + "/embeddings.json"))
 
     nodes_load = json.load(open(f_saved + "/nodes.json"))
@@ -149,6 +220,14 @@ class AssociativeMemory:
     with open(out_json+"/embeddings.json", "w") as outfile:
       json.dump(self.embeddings, outfile)
 
+    # The recent event windows are only saved for the frontend's persona 
+    # state view; they are rebuilt from the events on load. 
+    r = dict()
+    for size, window in self.recent_event_windows.items(): 
+      r[size] = window.to_list()
+    with open(out_json+"/recent_events.json", "w") as outfile:
+      json.dump(r, outfile)
+
 
   def add_event(self, created, expiration, s, p, o, 
                       description, keywords, poignancy, 
@@ -175,6 +254,8 @@ class AssociativeMemory:
 
     # Creating various dictionary cache for fast access. 
     self.seq_event[0:0] = [node]
+    for window in self.recent_event_windows.values(): 
+      window.add(node.spo_summary())
     keywords = [i.lower() for i in keywords]
     for kw in keywords: 
       if kw in self.kw_to_event: 
@@ -192,6 +273,8 @@ class AssociativeMemory:
           self.kw_strength_event[kw] = 1
 
     self.embeddings[embedding_pair[0]] = embedding_pair[1]
+    if "idle" not in node.embedding_key: 
+      self.node_matrix.add(node, embedding_pair[1])
 
     return node
 
@@ -236,6 +319,8 @@ class AssociativeMemory:
           self.kw_strength_thought[kw] = 1
 
     self.embeddings[embedding_pair[0]] = embedding_pair[1]
+    if "idle" not in node.embedding_key: 
+      self.node_matrix.add(node, embedding_pair[1])
 
     return node
 
@@ -267,15 +352,182 @@ class AssociativeMemory:
     self.id_to_node[node_id] = node 
 
     self.embeddings[embedding_pair[0]] = embedding_pair[1]
+    self.node_matrix.update_embedding(embedding_pair[0], embedding_pair[1])
         
     return node
 
 
+  def get_recent_event_window(self, retention): 
+    """
+    Returns the RecentEventWindow of the latest <retention> events. It stays
+    up to date as events are added, so callers can keep it around. 
+    e.g., ("the Ville:Hobbs Cafe:cafe:cafe customer seating", "is", "idle")
+            in a_mem.get_recent_event_window(5)
+    """
+    if retention not in self.recent_event_windows: 
+      window = RecentEventWindow(retention)
+      for e_node in reversed(self.seq_event[:retention]): 
+        window.add(e_node.spo_summary())
+      self.recent_event_windows[retention] = window
+    return self.recent_event_windows[retention]
+
+
   def get_summarized_latest_events(self, retention): 
-    ret_set = set()
-    for e_node in self.seq_event[:retention]: 
-      ret_set.add(e_node.spo_summary())
-    return ret_set
+    return set(self.get_recent_event_window(retention).counts)
+
+
+  def get_focal_keywords(self, focal_pt, max_words=8): 
+    """
+    Returns the event and thought keywords that occur in <focal_pt>, i.e., 
+    that are one of its runs of up to <max_words> words. 
+    e.g., "Isabella Rodriguez is planning a Valentine's Day party." gives
+          {"isabella rodriguez", "is", "planning", "party", ...}
+    """
+    words = [i.strip(".,;:!?\"()") for i in focal_pt.lower().split()]
+    keywords = set()
+    for start in range(len(words)): 
+      for end in range(start + 1, min(start + max_words, len(words)) + 1): 
+        kw = " ".join(words[start:end])
+        if kw in self.kw_to_event or kw in self.kw_to_thought: 
+          keywords.add(kw)
+    return keywords
+
+
+  def get_keyword_candidate_rows(self, focal_pt): 
+    """
+    Returns the node_matrix rows of the events and thoughts that share a 
+    keyword with <focal_pt>. Keywords of more than 
+    <hybrid_retrieval_max_kw_nodes> nodes (e.g., "is") are skipped, as they
+    do not narrow the search down. 
+    """
+    rows = set()
+    for kw in self.get_focal_keywords(focal_pt): 
+      nodes = self.kw_to_event.get(kw, []) + self.kw_to_thought.get(kw, [])
+      if len(nodes) > hybrid_retrieval_max_kw_nodes: 
+        continue
+      for node in nodes: 
+        if node.node_id in self.node_matrix.node_rows: 
+          rows.add(self.node_matrix.node_rows[node.node_id])
+    return np.array(sorted(rows), dtype=np.int64)
+
+
+  def get_relevance_candidates(self, focal_embedding, focal_pt, prior_rows): 
+    """
+    Returns the node_matrix rows whose relevance to a focal point is scored,
+    or None if all of them are. 
+
+    With <hybrid_retrieval>, the candidates are the nodes that share a 
+    keyword with <focal_pt> and the <hybrid_retrieval_recent> latest ones; 
+    if there are fewer than <hybrid_retrieval_min_candidates>, all nodes 
+    are scored. With an ANN index, the candidates are the nodes that it 
+    shortlists for <focal_embedding>, and <prior_rows>. 
+    """
+    n = len(self.node_matrix)
+    rows = []
+    if hybrid_retrieval and focal_pt is not None: 
+      keyword_rows = self.get_keyword_candidate_rows(focal_pt)
+      recent_rows = np.arange(max(0, n - hybrid_retrieval_recent), n)
+      rows += [keyword_rows, recent_rows]
+      log.debug(f"{focal_pt=}: {len(keyword_rows)} keyword and "
+                f"{len(recent_rows)} recent candidates of {n} nodes")
+    if prior_rows is not None: 
+      rows += [self.node_matrix.get_candidate_rows(focal_embedding, 
+                                                   retrieval_ann_candidates),
+               prior_rows]
+    if not rows: 
+      return None
+    rows = np.unique(np.concatenate(rows))
+    if hybrid_retrieval and len(rows) < hybrid_retrieval_min_candidates: 
+      return None
+    return rows
+
+
+  def get_retrieval_scores(self, focal_embeddings, recency_decay, 
+                           focal_points=None): 
+    """
+    Computes the normalized recency, importance and relevance scores of all
+    non-idle events and thoughts for new_retrieve(). Only relevance depends
+    on the focal points, so the others are shared by all of them. 
+
+    INPUT: 
+      focal_embeddings: The list of the embeddings of the focal points. 
+      recency_decay: The persona's recency decay (scratch.recency_decay). 
+      focal_points: The list of the focal points, whose keywords pick the
+                    candidates with <hybrid_retrieval>. 
+    OUTPUT: 
+      recency: The recency scores by position in the order of last access
+               (see node_matrix.get_access_order()), oldest first. 
+      importance: The importance scores of the node_matrix rows. 
+      relevance: An F x N array of the relevance scores of the node_matrix
+                 rows, one row per focal point. 
+      All scores are normalized to [0, 1]. With <hybrid_retrieval> or an 
+      ANN index (see <retrieval_ann_index>), only the candidates (see 
+      get_relevance_candidates()) get relevance scores; the other nodes 
+      count as the least relevant (0). 
+    """
+    n = len(self.node_matrix)
+    self.last_candidate_counts = [0] * len(focal_embeddings)
+    if n == 0: 
+      return np.zeros(0), np.zeros(0), np.zeros((len(focal_embeddings), 0))
+
+    # The first node in the order gets the decay to the first power, and so
+    # on, like extract_recency() does. 
+    recency = normalize_floats(
+      recency_decay ** np.arange(1, n + 1, dtype=np.float64), 0, 1)
+    importance = normalize_floats(self.node_matrix.poignancy[:n], 0, 1)
+
+    # With an ANN index, the nodes whose recency or importance alone could 
+    # rank them high are candidates for all focal points. 
+    prior_rows = None
+    if (self.node_matrix.ann_index is not None 
+        and n >= retrieval_ann_min_nodes): 
+      prior_rows = np.union1d(
+        self.node_matrix.get_access_order()[:retrieval_ann_candidates], 
+        top_highest_x_indices(importance, retrieval_ann_candidates))
+
+    relevance = np.zeros((len(focal_embeddings), n))
+    full_scans = []
+    for count, focal_embedding in enumerate(focal_embeddings): 
+      focal_pt = focal_points[count] if focal_points else None
+      rows = self.get_relevance_candidates(focal_embedding, focal_pt, 
+                                           prior_rows)
+      self.retrieval_stats["retrievals"] += 1
+      self.retrieval_stats["nodes"] += n
+      if rows is None: 
+        full_scans += [count]
+        self.retrieval_stats["full_scans"] += 1
+        self.retrieval_stats["candidates"] += n
+        self.last_candidate_counts[count] = n
+        continue
+      self.retrieval_stats["candidates"] += len(rows)
+      self.last_candidate_counts[count] = len(rows)
+      relevance[count][rows] = normalize_floats(
+        self.node_matrix.get_relevance([focal_embedding], rows)[0], 0, 1)
+
+    # The focal points that need all nodes scored still share one matrix 
+    # product. 
+    if full_scans: 
+      full_relevance = self.node_matrix.get_relevance(
+        [focal_embeddings[i] for i in full_scans])
+      for count, scores in zip(full_scans, full_relevance): 
+        relevance[count] = normalize_floats(scores, 0, 1)
+    return recency, importance, relevance
+
+
+  def get_retrieval_stats(self): 
+    stats = dict(self.retrieval_stats)
+    retrievals = stats["retrievals"]
+    stats["mean_candidates"] = (stats["candidates"] / retrievals 
+                                if retrievals else 0.0)
+    stats["candidate_fraction"] = (stats["candidates"] / stats["nodes"]
+                                   if stats["nodes"] else 0.0)
+    return stats
+
+
+  def set_last_accessed(self, nodes, time): 
+    for node in nodes: 
+      node.last_accessed = time
+    self.node_matrix.set_last_accessed(nodes, time)
 
 
   def get_str_seq_events(self): 
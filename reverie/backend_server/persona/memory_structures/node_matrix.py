@@ -0,0 +1,191 @@
+"""
+Author: irrealis (irrealis.chomp@gmail.com)
+
+File: node_matrix.py
+Description: Defines the NodeMatrix class, which keeps the retrievable nodes
+of an associative memory (its non-idle events and thoughts) in row-aligned
+numpy arrays, so that new_retrieve() can score all of them with array math
+instead of building dictionaries of per-node scores.
+"""
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import numpy as np
+
+
+class NodeMatrix:
+  """
+  Row <i> of the node arrays belongs to <nodes>[i]. The embeddings are kept
+  once per embedding key, as float32 rows of <embeddings> with their norms
+  precomputed, and <node_embedding_rows> maps the node rows to them. All
+  arrays grow by doubling, so adding a node is amortized O(1). If an
+  <ann_index> (see ann_index.py) is given, it is kept up to date with the
+  embedding rows.
+  """
+  def __init__(self, capacity=64, ann_index=None):
+    self.nodes = []
+    self.node_rows = dict()
+    self.node_embedding_rows = np.zeros(capacity, dtype=np.int64)
+    self.node_counts = np.zeros(capacity, dtype=np.int64)
+    self.is_thought = np.zeros(capacity, dtype=bool)
+    self.poignancy = np.zeros(capacity, dtype=np.float64)
+    self.last_accessed = np.zeros(capacity, dtype="datetime64[us]")
+
+    # <embedding_rows> maps the embedding keys to their rows in
+    # <embeddings>, which is allocated once the dimension is known.
+    self.embedding_rows = dict()
+    self.embeddings = None
+    self.embedding_norms = np.zeros(capacity, dtype=np.float64)
+    self.ann_index = ann_index
+
+
+  def __len__(self):
+    return len(self.nodes)
+
+
+  def _grow_nodes(self):
+    capacity = 2 * len(self.node_counts)
+    for name in ["node_embedding_rows", "node_counts", "is_thought",
+                 "poignancy", "last_accessed"]:
+      old = getattr(self, name)
+      new = np.zeros(capacity, dtype=old.dtype)
+      new[:len(old)] = old
+      setattr(self, name, new)
+
+
+  def _grow_embeddings(self):
+    capacity = 2 * len(self.embedding_norms)
+    embeddings = np.zeros((capacity, self.embeddings.shape[1]),
+                          dtype=np.float32)
+    embeddings[:len(self.embeddings)] = self.embeddings
+    self.embeddings = embeddings
+    norms = np.zeros(capacity, dtype=np.float64)
+    norms[:len(self.embedding_norms)] = self.embedding_norms
+    self.embedding_norms = norms
+
+
+  def set_embedding(self, key, embedding):
+    """
+    Sets the embedding of <key>, adding a row for it if it is new, and
+    returns its row. Like AssociativeMemory.embeddings, the latest
+    embedding of a key is used by all nodes that share it.
+    """
+    embedding = np.asarray(embedding, dtype=np.float64)
+    if self.embeddings is None:
+      self.embeddings = np.zeros((len(self.embedding_norms), len(embedding)),
+                                 dtype=np.float32)
+    row = self.embedding_rows.get(key)
+    if row is None:
+      row = len(self.embedding_rows)
+      if row == len(self.embedding_norms):
+        self._grow_embeddings()
+      self.embedding_rows[key] = row
+    self.embeddings[row] = embedding
+    self.embedding_norms[row] = np.linalg.norm(embedding)
+    if self.ann_index is not None:
+      self.ann_index.set(row, self.embeddings[row], self.embeddings)
+    return row
+
+
+  def update_embedding(self, key, embedding):
+    """
+    Updates the embedding of <key> if any node uses it.
+    """
+    if key in self.embedding_rows:
+      self.set_embedding(key, embedding)
+
+
+  def add(self, node, embedding):
+    row = len(self.nodes)
+    if row == len(self.node_counts):
+      self._grow_nodes()
+    self.nodes += [node]
+    self.node_rows[node.node_id] = row
+    self.node_embedding_rows[row] = self.set_embedding(node.embedding_key,
+                                                       embedding)
+    self.node_counts[row] = node.node_count
+    self.is_thought[row] = node.type == "thought"
+    self.poignancy[row] = node.poignancy
+    self.last_accessed[row] = np.datetime64(node.last_accessed, "us")
+    return row
+
+
+  def set_last_accessed(self, nodes, time):
+    rows = [self.node_rows[i.node_id] for i in nodes
+            if i.node_id in self.node_rows]
+    self.last_accessed[rows] = np.datetime64(time, "us")
+
+
+  def get_access_order(self):
+    """
+    Returns the node rows sorted by last access, oldest first. Ties are
+    broken the way a stable sort of seq_event + seq_thought would break
+    them: events before thoughts, newer nodes first.
+    """
+    n = len(self.nodes)
+    return np.lexsort((-self.node_counts[:n], self.is_thought[:n],
+                       self.last_accessed[:n]))
+
+
+  def get_relevance(self, focal_embeddings, rows=None):
+    """
+    Returns the cosine similarities of each of <focal_embeddings> and the
+    embeddings of the nodes in <rows> (all nodes by default), as an F x N
+    array aligned with <rows>. They are computed with one matrix product for
+    all focal points.
+    """
+    focal_embeddings = np.asarray(focal_embeddings, dtype=np.float64)
+    if rows is None:
+      n = len(self.embedding_rows)
+      dots = self.embeddings[:n] @ focal_embeddings.astype(np.float32).T
+      embedding_rows = self.node_embedding_rows[:len(self.nodes)]
+      dots = dots[embedding_rows]
+    else:
+      embedding_rows = self.node_embedding_rows[rows]
+      dots = (self.embeddings[embedding_rows]
+              @ focal_embeddings.astype(np.float32).T)
+    return (dots.T.astype(np.float64)
+            / (self.embedding_norms[embedding_rows]
+               * np.linalg.norm(focal_embeddings, axis=1)[:, None]))
+
+
+  def get_candidate_rows(self, focal_embedding, n):
+    """
+    Returns the rows of the nodes whose embeddings <ann_index> shortlists
+    as (about) the <n> closest to <focal_embedding>.
+    """
+    embedding_rows = self.ann_index.search(focal_embedding, n)
+    return np.flatnonzero(np.isin(self.node_embedding_rows[:len(self.nodes)],
+                                  embedding_rows))
+
+
+def normalize_floats(values, target_min, target_max):
+  """
+  Array version of retrieve.normalize_dict_floats(): scales <values> to
+  [target_min, target_max], keeping their relative proportions.
+  """
+  min_val = values.min()
+  max_val = values.max()
+  range_val = max_val - min_val
+
+  if range_val == 0:
+    return np.full(len(values), (target_max - target_min)/2)
+  return ((values - min_val) * (target_max - target_min)
+          / range_val + target_min)
+
+
+def top_highest_x_indices(values, x):
+  """
+  Array version of retrieve.top_highest_x_values(): returns the indices of
+  the <x> highest <values>, highest first. Ties keep their index order, as
+  the stable sort in top_highest_x_values() does. Only the top <x> are
+  sorted, after an argpartition() that finds them.
+  """
+  if x <= 0:
+    return np.zeros(0, dtype=np.int64)
+  if x >= len(values):
+    return np.argsort(-values, kind="stable")
+  threshold = values[np.argpartition(-values, x - 1)[:x]].min()
+  candidates = np.flatnonzero(values >= threshold)
+  return candidates[np.argsort(-values[candidates], kind="stable")][:x]
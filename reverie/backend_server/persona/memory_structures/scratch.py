@@ -10,6 +10,7 @@ import sys
 sys.path.append('../../')
 
 from global_methods import *
+from address_registry import *
 
 class Scratch: 
   def __init__(self, f_saved): 
@@ -157,6 +158,22 @@ class Scratch:
     # destination tile. 
     # e.g., [(50, 10), (49, 10), (48, 10), ...]
     self.planned_path = []
+    # <path_planner> is the IncrementalPlanner that repairs <planned_path>
+    # when its target persona moves or the collision map changes, 
+    # <planned_path_version> is the collision map version that 
+    # <planned_path> was planned on, and <planned_path_goal> is the tile of 
+    # the target persona when it was planned (for <persona> plans). None of
+    # them are saved; the planner is rebuilt on demand. 
+    self.path_planner = None
+    self.planned_path_version = 0
+    self.planned_path_goal = None
+    # <step_path> lists the tiles the persona walked during the last step, 
+    # ending at its new tile. It has more than one tile when a step is long
+    # enough to walk several (see <sec_per_tile> in utils.py). 
+    self.step_path = []
+    # <sec_per_step> is the number of game seconds that each step moves 
+    # forward. It is not saved; ReverieServer sets it from its own meta.
+    self.sec_per_step = 10
 
     if check_if_file_exists(f_saved): 
       # If we have a bootstrap file, load that here. 
@@ -204,7 +221,7 @@ class Scratch:
       self.f_daily_schedule = scratch_load["f_daily_schedule"]
       self.f_daily_schedule_hourly_org = scratch_load["f_daily_schedule_hourly_org"]
 
-      self.act_address = scratch_load["act_address"]
+      self.act_address = intern_address(scratch_load["act_address"])
       if scratch_load["act_start_time"]: 
         self.act_start_time = datetime.datetime.strptime(
                                               scratch_load["act_start_time"],
@@ -495,7 +512,9 @@ class Scratch:
                      act_obj_pronunciatio, 
                      act_obj_event, 
                      act_start_time=None): 
-    self.act_address = action_address
+    # The address is interned, so that it is the same object as the maze's 
+    # and the other personas' copies of it. 
+    self.act_address = intern_address(action_address)
     self.act_duration = action_duration
     self.act_description = action_description
     self.act_pronunciatio = action_pronunciatio
@@ -532,11 +551,12 @@ class Scratch:
 
   def act_check_finished(self): 
     """
-    Checks whether the self.Action instance has finished.  
+    Checks whether the self.Action instance has finished. The action has 
+    finished once the current time reaches (or, with coarse steps, has 
+    passed) its start time + its duration. 
 
     INPUT
-      curr_datetime: Current time. If current time is later than the action's
-                     start time + its duration, then the action has finished. 
+      None
     OUTPUT 
       Boolean [True]: Action has finished.
       Boolean [False]: Action has not finished and is still ongoing.
@@ -553,7 +573,7 @@ class Scratch:
         x = (x + datetime.timedelta(minutes=1))
       end_time = (x + datetime.timedelta(minutes=self.act_duration))
 
-    if end_time.strftime("%H:%M:%S") == self.curr_time.strftime("%H:%M:%S"): 
+    if self.curr_time >= end_time: 
       return True
     return False
 
@@ -18,6 +18,19 @@ class MemoryTree:
     if check_if_file_exists(f_saved): 
       self.tree = json.load(open(f_saved))
 
+    # The following are only kept in memory, to make learning the tiles that
+    # the persona sees cheap (see learn_nearby_tiles). 
+    # <learned_addresses> is the set of the game object level addresses 
+    # (see Maze.get_tile_path) that are already in the tree, and 
+    # <learned_window> is the (left_end, right_end, top_end, bottom_end) 
+    # bounds of the last vision window that was learned. 
+    self.learned_addresses = set()
+    self.learned_window = None
+    # <arena_game_objects> mirrors the game object list of each (world, 
+    # sector, arena) in the tree as a set, for O(1) membership checks. The
+    # lists themselves stay, so that the saved json does not change. 
+    self.arena_game_objects = dict()
+
 
   def print_tree(self): 
     def _print_tree(tree, depth):
@@ -41,6 +54,69 @@ class MemoryTree:
 
 
 
+  def learn_tile(self, world, sector, arena, game_object): 
+    """
+    Adds the place of a tile to the tree. 
+
+    INPUT
+      world, sector, arena, game_object: The strings of the tile's levels 
+                                         ("" if it has none). 
+    OUTPUT 
+      None
+    """
+    if world: 
+      if (world not in self.tree): 
+        self.tree[world] = {}
+    if sector: 
+      if (sector not in self.tree[world]): 
+        self.tree[world][sector] = {}
+    if arena: 
+      if (arena not in self.tree[world][sector]): 
+        self.tree[world][sector][arena] = []
+    if game_object: 
+      game_objects = self.arena_game_objects.get((world, sector, arena))
+      if game_objects is None: 
+        game_objects = set(self.tree[world][sector][arena])
+        self.arena_game_objects[(world, sector, arena)] = game_objects
+      if (game_object not in game_objects): 
+        game_objects.add(game_object)
+        self.tree[world][sector][arena] += [game_object]
+
+
+  def learn_nearby_tiles(self, maze, curr_tile, vision_r): 
+    """
+    Adds the places of the tiles that the persona sees from <curr_tile> to 
+    the tree. Only the tiles that were not in the last window that we 
+    learned are looked at, and of those, only the ones whose address is not
+    in the tree yet. The tree ends up the same as if every tile of the 
+    window was added with learn_tile(), in the order of 
+    Maze.get_nearby_tiles(). 
+
+    INPUT
+      maze: An instance of <Maze>. 
+      curr_tile: The persona's current tile in (x, y) form. 
+      vision_r: The radius of the persona's vision. 
+    OUTPUT 
+      None
+    """
+    window = maze.get_nearby_bounds(curr_tile, vision_r)
+    left_end, right_end, top_end, bottom_end = window
+    prev = self.learned_window
+    for x in range(left_end, right_end): 
+      for y in range(top_end, bottom_end): 
+        if prev and prev[0] <= x < prev[1] and prev[2] <= y < prev[3]: 
+          continue
+        address = maze.get_tile_path((x, y), "game_object")
+        if address in self.learned_addresses: 
+          continue
+        self.learned_addresses.add(address)
+        self.learn_tile(maze.get_tile_string((x, y), "world"), 
+                        maze.get_tile_string((x, y), "sector"), 
+                        maze.get_tile_string((x, y), "arena"), 
+                        maze.get_tile_string((x, y), "game_object"))
+    self.learned_window = window
+
+
   def get_str_accessible_sectors(self, curr_world): 
     """
     Returns a summary string of all the arenas that the persona can access 
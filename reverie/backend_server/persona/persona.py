@@ -182,24 +182,16 @@ class Persona:
     reflect(self)
 
 
-  def move(self, maze, personas, curr_tile, curr_time):
+  def think(self, maze, personas, curr_tile, curr_time):
     """
-    This is the main cognitive function where our main sequence is called. 
+    Runs the main cognitive sequence up to (but not including) execution, 
+    and returns the persona's plan. move() is think() followed by execute().
 
     INPUT: 
-      maze: The Maze class of the current world. 
-      personas: A dictionary that contains all persona names as keys, and the 
-                Persona instance as values. 
-      curr_tile: A tuple that designates the persona's current tile location 
-                 in (row, col) form. e.g., (58, 39)
-      curr_time: datetime instance that indicates the game's current time. 
+      Same as move().
     OUTPUT: 
-      execution: A triple set that contains the following components: 
-        <next_tile> is a x,y coordinate. e.g., (58, 9)
-        <pronunciatio> is an emoji.
-        <description> is a string description of the movement. e.g., 
-        writing her next novel (editing her novel) 
-        @ double studio:double studio:common room:sofa
+      plan: The target action address of the persona  
+            (persona.scratch.act_address).
     """
     # Updating persona's scratch memory with <curr_tile>. 
     self.scratch.curr_tile = curr_tile
@@ -221,6 +213,29 @@ class Persona:
     retrieved = self.retrieve(perceived)
     plan = self.plan(maze, personas, new_day, retrieved)
     self.reflect()
+    return plan
+
+
+  def move(self, maze, personas, curr_tile, curr_time):
+    """
+    This is the main cognitive function where our main sequence is called. 
+
+    INPUT: 
+      maze: The Maze class of the current world. 
+      personas: A dictionary that contains all persona names as keys, and the 
+                Persona instance as values. 
+      curr_tile: A tuple that designates the persona's current tile location 
+                 in (row, col) form. e.g., (58, 39)
+      curr_time: datetime instance that indicates the game's current time. 
+    OUTPUT: 
+      execution: A triple set that contains the following components: 
+        <next_tile> is a x,y coordinate. e.g., (58, 9)
+        <pronunciatio> is an emoji.
+        <description> is a string description of the movement. e.g., 
+        writing her next novel (editing her novel) 
+        @ double studio:double studio:common room:sofa
+    """
+    plan = self.think(maze, personas, curr_tile, curr_time)
 
     # <execution> is a triple set that contains the following components: 
     # <next_tile> is a x,y coordinate. e.g., (58, 9)
@@ -13,6 +13,61 @@ log.setLevel(logging.DEBUG)
 class Embeddings:
   def embed_query(text):
     raise NotImplementedError
+  def embed_documents(self, texts):
+    return [self.embed_query(text) for text in texts]
+
+
+class EmbeddingCollector:
+  """
+  Gathers the texts that need embeddings during a simulation step, across
+  all personas, so that they can be embedded together. Texts are requested
+  with request(), and resolve() embeds all pending ones (deduped, per model)
+  with one batch call. get() returns an embedding, resolving whatever is
+  pending first if the text has not been embedded yet. The embeddings are
+  kept until clear() is called at the start of the next step.
+  """
+  def __init__(self, embed_documents):
+    """
+    INPUT:
+      embed_documents: A function that takes a list of texts and a model
+                       name, and returns the list of their embeddings.
+    """
+    self.embed_documents = embed_documents
+    # <pending> maps each model to the (ordered) dict of its texts that are
+    # yet to be embedded. <embeddings> maps (model, text) pairs to their
+    # embeddings.
+    self.pending = dict()
+    self.embeddings = dict()
+    self.batch_calls = 0
+    self.texts_embedded = 0
+
+
+  def request(self, text, model):
+    if (model, text) not in self.embeddings:
+      self.pending.setdefault(model, dict())[text] = None
+
+
+  def resolve(self):
+    for model, texts in self.pending.items():
+      texts = list(texts)
+      log.debug(f'embedding {len(texts)} texts in one batch')
+      for text, embedding in zip(texts, self.embed_documents(texts, model)):
+        self.embeddings[(model, text)] = embedding
+      self.batch_calls += 1
+      self.texts_embedded += len(texts)
+    self.pending = dict()
+
+
+  def get(self, text, model):
+    if (model, text) not in self.embeddings:
+      self.request(text, model)
+      self.resolve()
+    return self.embeddings[(model, text)]
+
+
+  def clear(self):
+    self.pending = dict()
+    self.embeddings = dict()
 
 
 try:
@@ -31,5 +86,14 @@ try:
           self.exception_handler(e)
         else:
           raise e
+    def embed_documents(self, texts):
+      log.debug(f'{len(texts)=}')
+      try:
+        return self.model.embed_documents(texts)
+      except Exception as e:
+        if self.exception_handler:
+          self.exception_handler(e)
+        else:
+          raise e
 except:
   pass
@@ -15,8 +15,9 @@ import openai.error
 import time 
 
 from utils import *
+from query_embedding_cache import get_cached_query_embeddings
 from .language_model import LangChainModel
-from .embeddings import LangChainEmbeddings
+from .embeddings import LangChainEmbeddings, EmbeddingCollector
 
 from langchain.chat_models import ChatOpenAI
 from langchain.embeddings import OpenAIEmbeddings
@@ -333,13 +334,55 @@ def safe_generate_response(prompt,
   return fail_safe_response
 
 
-def get_embedding(text, model="text-embedding-ada-002"):
+def clean_embedding_text(text): 
   text = text.replace("\n", " ")
   if not text: 
     text = "this is blank"
+  return text
+
+
+def get_embeddings(texts, model="text-embedding-ada-002"): 
+  """
+  Embeds a list of texts with a single request. 
+  """
+  texts = [clean_embedding_text(i) for i in texts]
+  return (LangChainEmbeddings(OpenAIEmbeddings(model=model))
+          .embed_documents(texts))
+
+
+# <embedding_collector> batches the embedding requests of a simulation step 
+# (see EmbeddingCollector in embeddings.py). 
+embedding_collector = EmbeddingCollector(get_embeddings)
+
+
+def request_embedding(text, model="text-embedding-ada-002"): 
+  """
+  Marks <text> as needing an embedding, so that it is embedded along with 
+  the other requested texts on the next get_embedding() or 
+  embedding_collector.resolve() call. 
+  """
+  embedding_collector.request(clean_embedding_text(text), model)
+
+
+def get_embedding(text, model="text-embedding-ada-002"):
   #return openai.Embedding.create(
   #        input=[text], model=model)['data'][0]['embedding']
-  return LangChainEmbeddings(OpenAIEmbeddings(model=model)).embed_query(text)
+  return embedding_collector.get(clean_embedding_text(text), model)
+
+
+def get_query_embeddings(texts, model="text-embedding-ada-002"): 
+  """
+  Returns the embeddings of retrieval queries (e.g., focal points) from the
+  query embedding cache. Only the texts that are not cached yet are 
+  embedded, together with the other requested texts. 
+  """
+  def embed(missing): 
+    for text in missing: 
+      embedding_collector.request(text, model)
+    return [embedding_collector.get(text, model) for text in missing]
+
+  return get_cached_query_embeddings(
+    [clean_embedding_text(i) for i in texts], model, embed)
 
 
 if __name__ == '__main__':
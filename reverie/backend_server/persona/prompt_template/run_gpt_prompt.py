@@ -9,6 +9,7 @@ import re
 import datetime
 import sys
 import ast
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append('../../')
 
@@ -1920,6 +1921,88 @@ def run_gpt_prompt_event_poignancy(persona, event_description, test_input=None,
   # return output, [output, prompt, gpt_param, prompt_input, fail_safe]
 
 
+def run_gpt_prompt_event_poignancy_batch(items, verbose=False): 
+  """
+  Scores the poignancy of many events at once. The events of each persona 
+  are put in multi-item prompts of up to <poignancy_batch_size> events, and 
+  up to <poignancy_batch_workers> of the prompts run concurrently. If the 
+  response to a prompt cannot be parsed, its events fall back to one 
+  run_gpt_prompt_event_poignancy() call each. 
+
+  INPUT: 
+    items: A list of (persona, event description) pairs. 
+  OUTPUT: 
+    A list of the int poignancy scores of <items>, in the same order. 
+  """
+  def create_prompt_input(persona, event_descriptions): 
+    numbered = ""
+    for count, i in enumerate(event_descriptions): 
+      numbered += f"{count + 1}. {i}\n"
+    prompt_input = [persona.scratch.name,
+                    persona.scratch.get_str_iss(),
+                    persona.scratch.name,
+                    numbered]
+    return prompt_input
+
+  def score_batch(persona, event_descriptions): 
+    def __chat_func_clean_up(gpt_response, prompt=""): 
+      if isinstance(gpt_response, str): 
+        gpt_response = ast.literal_eval(gpt_response.strip())
+      gpt_response = [int(i) for i in gpt_response]
+      if len(gpt_response) != len(event_descriptions): 
+        raise ValueError("wrong number of poignancy scores")
+      return gpt_response
+
+    def __chat_func_validate(gpt_response, prompt=""): 
+      try: 
+        __chat_func_clean_up(gpt_response, prompt)
+        return True
+      except:
+        return False 
+
+    prompt_template = f"{backend_server_loc}/persona/prompt_template/v3_ChatGPT/poignancy_event_batch_v1.txt"
+    prompt_input = create_prompt_input(persona, event_descriptions)
+    prompt = generate_prompt(prompt_input, prompt_template)
+    example_output = str([5] * len(event_descriptions))
+    special_instruction = ("The output should ONLY contain a list of "
+                           f"{len(event_descriptions)} integer values on the "
+                           "scale of 1 to 10, one per event.")
+    output = ChatGPT_safe_generate_response(prompt, example_output, 
+                                            special_instruction, 3, False,
+                                            __chat_func_validate, 
+                                            __chat_func_clean_up, verbose)
+    if output == False: 
+      # The multi-item response could not be parsed; we ask for the events 
+      # one at a time instead. 
+      output = [run_gpt_prompt_event_poignancy(persona, i)[0] 
+                for i in event_descriptions]
+    return output
+
+  # The same event description of the same persona is only scored once. 
+  # <batches> are the (persona, descriptions) of the prompts to run. 
+  by_persona = dict()
+  for persona, description in items: 
+    descriptions = by_persona.setdefault(persona.name, (persona, []))[1]
+    if description not in descriptions: 
+      descriptions += [description]
+  batches = []
+  for persona, descriptions in by_persona.values(): 
+    for i in range(0, len(descriptions), utils.poignancy_batch_size): 
+      batches += [(persona, descriptions[i:i+utils.poignancy_batch_size])]
+
+  scores = dict()
+  if len(batches) == 1: 
+    results = [score_batch(*batches[0])]
+  else: 
+    with ThreadPoolExecutor(utils.poignancy_batch_workers) as executor: 
+      results = list(executor.map(lambda i: score_batch(*i), batches))
+  for (persona, descriptions), output in zip(batches, results): 
+    for description, score in zip(descriptions, output): 
+      scores[(persona.name, description)] = score
+  return [scores[(persona.name, description)] 
+          for persona, description in items]
+
+
 def run_gpt_prompt_thought_poignancy(persona, event_description, test_input=None, verbose=False): 
   def create_prompt_input(persona, event_description, test_input=None): 
     prompt_input = [persona.scratch.name,
@@ -0,0 +1,216 @@
+"""
+Author: irrealis (irrealis.chomp@gmail.com)
+
+File: poignancy_cache.py
+Description: Defines the PoignancyCache class, a size-bounded LRU memo of the
+poignancy scores that the personas give to events, thoughts and chats. The
+same descriptions (e.g., "bed is being used") come up over and over during a
+run, and a persona with the same identity stable set always rates them the
+same, so their scores are only asked for once. The cache is saved with the
+simulation, and can be shared by all forks of the same base simulation.
+"""
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from global_methods import *
+from utils import *
+
+
+class PoignancyCache:
+  def __init__(self, max_size=poignancy_cache_size):
+    # <entries> maps the keys (see make_key) to the scores, least recently
+    # used first.
+    self.max_size = max_size
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+
+  @staticmethod
+  def make_key(event_type, iss, description):
+    """
+    Returns the cache key of a description rated by a persona.
+
+    INPUT:
+      event_type: "event", "thought", or "chat"; they use different prompts.
+      iss: The persona's identity stable set (scratch.get_str_iss()).
+      description: The description that is rated. Case and whitespace do not
+                   matter.
+    OUTPUT:
+      A string key, e.g., "event:5f1c...:bed is being used"
+    """
+    iss_hash = hashlib.sha1(iss.encode("utf-8")).hexdigest()
+    normalized = " ".join(description.lower().split())
+    return f"{event_type}:{iss_hash}:{normalized}"
+
+
+  def get(self, key):
+    """
+    Returns the cached score of <key>, or None if there is none.
+    """
+    score = self.entries.get(key)
+    if score is None:
+      self.misses += 1
+      return None
+    self.entries.move_to_end(key)
+    self.hits += 1
+    return score
+
+
+  def __contains__(self, key):
+    # Checking for a key does not count as a hit or a miss. 
+    return key in self.entries
+
+
+  def put(self, key, score):
+    self.entries[key] = score
+    self.entries.move_to_end(key)
+    while len(self.entries) > self.max_size:
+      self.entries.popitem(last=False)
+
+
+  def stats(self):
+    total = self.hits + self.misses
+    return {"size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0}
+
+
+  def load(self, cache_file):
+    """
+    Adds the entries saved in <cache_file> (if it exists) to the cache. The
+    entries that are already in the cache count as more recently used.
+    """
+    if not check_if_file_exists(cache_file):
+      return
+    with open(cache_file) as infile:
+      saved = json.load(infile)
+    entries = OrderedDict(saved)
+    entries.update(self.entries)
+    self.entries = entries
+    while len(self.entries) > self.max_size:
+      self.entries.popitem(last=False)
+
+
+  def save(self, cache_file):
+    """
+    Saves the cache to <cache_file>. What is already in the file (e.g., from
+    another fork that shares it) is merged in first, so that saving never
+    drops the scores that others added.
+    """
+    create_folder_if_not_there(cache_file)
+    self.load(cache_file)
+    with open(f"{cache_file}.{os.getpid()}.tmp", "w") as outfile:
+      json.dump(list(self.entries.items()), outfile)
+    os.replace(f"{cache_file}.{os.getpid()}.tmp", cache_file)
+
+
+# <poignancy_cache> is the cache that all personas of the simulation share.
+poignancy_cache = PoignancyCache()
+
+
+def get_base_sim_code(sim_code):
+  """
+  Follows the fork_sim_code links of the simulations' meta.json files back
+  to the simulation that <sim_code> was first forked from.
+  e.g., "base_the_ville_isabella_maria_klaus"
+  """
+  seen = set([sim_code])
+  while True:
+    meta_file = f"{fs_storage}/{sim_code}/reverie/meta.json"
+    if not check_if_file_exists(meta_file):
+      return sim_code
+    with open(meta_file) as infile:
+      fork_sim_code = json.load(infile).get("fork_sim_code")
+    if (not fork_sim_code or fork_sim_code in seen
+        or not os.path.isdir(f"{fs_storage}/{fork_sim_code}")):
+      return sim_code
+    seen.add(fork_sim_code)
+    sim_code = fork_sim_code
+
+
+def get_poignancy_cache_file(sim_code):
+  """
+  Returns the file that the poignancy cache of a simulation is kept in. If
+  <share_poignancy_cache> is set, all forks of the same base simulation use
+  one file. Otherwise, it lives in the simulation's own folder (and so is
+  copied into its forks).
+  """
+  if share_poignancy_cache:
+    return f"{poignancy_cache_loc}/{get_base_sim_code(sim_code)}.json"
+  return f"{fs_storage}/{sim_code}/reverie/poignancy_cache.json"
+
+
+def get_cached_poignancies(persona, event_type, descriptions, score_func):
+  """
+  Returns the poignancy scores of <descriptions>, only calling <score_func>
+  for the ones that are not in the cache yet.
+
+  INPUT:
+    persona: The <Persona> who rates the descriptions.
+    event_type: "event", "thought", or "chat".
+    descriptions: A list of description strings.
+    score_func: A function that takes a list of descriptions and returns
+                their scores.
+  OUTPUT:
+    The list of the scores of <descriptions>.
+  """
+  iss = persona.scratch.get_str_iss()
+  keys = [PoignancyCache.make_key(event_type, iss, i) for i in descriptions]
+  scores = [poignancy_cache.get(i) for i in keys]
+  missing = [i for i, score in enumerate(scores) if score is None]
+  if missing:
+    new_scores = score_func([descriptions[i] for i in missing])
+    for i, score in zip(missing, new_scores):
+      scores[i] = score
+      if score is not None:
+        poignancy_cache.put(keys[i], score)
+  return scores
+
+
+def prefetch_poignancies(event_type, items, score_func):
+  """
+  Scores the descriptions of <items> that are not in the cache yet with one
+  <score_func> call, and adds their scores to the cache, so that the 
+  get_cached_poignancies() calls that follow find them there. This lets the
+  descriptions of several personas be scored together.
+
+  INPUT:
+    event_type: "event", "thought", or "chat".
+    items: A list of (persona, description) pairs.
+    score_func: A function that takes a list of (persona, description) 
+                pairs and returns their scores.
+  OUTPUT:
+    The number of descriptions that were scored.
+  """
+  keys = []
+  to_score = []
+  for persona, description in items:
+    key = PoignancyCache.make_key(event_type, persona.scratch.get_str_iss(),
+                                  description)
+    if key in poignancy_cache or key in keys:
+      continue
+    keys += [key]
+    to_score += [(persona, description)]
+  if to_score:
+    for key, score in zip(keys, score_func(to_score)):
+      if score is not None:
+        poignancy_cache.put(key, score)
+  return len(to_score)
+
+
+def get_cached_poignancy(persona, event_type, description, score_func):
+  """
+  Single description version of get_cached_poignancies(); <score_func>
+  takes one description and returns its score.
+  """
+  return get_cached_poignancies(persona, event_type, [description],
+                                lambda i: [score_func(i[0])])[0]
@@ -0,0 +1,136 @@
+"""
+Author: irrealis (irrealis.chomp@gmail.com)
+
+File: query_embedding_cache.py
+Description: Defines the QueryEmbeddingCache class, a size-bounded LRU cache
+of the embeddings of retrieval queries (the focal points of new_retrieve).
+The same focal points come up over and over (e.g., a persona's name on every
+turn of a chat, or "Important recent events for X's life." every day), so
+they are only embedded once. The cache is saved to one file that all
+simulations share, as the embeddings only depend on the model and the text.
+"""
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import io
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from global_methods import *
+from utils import *
+
+
+class QueryEmbeddingCache:
+  def __init__(self, max_size=query_embedding_cache_size):
+    # <entries> maps (model, text) pairs to float32 embedding arrays, least
+    # recently used first.
+    self.max_size = max_size
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+
+  def get(self, key):
+    """
+    Returns the cached embedding of <key>, a (model, text) pair, or None if
+    there is none.
+    """
+    embedding = self.entries.get(key)
+    if embedding is None:
+      self.misses += 1
+      return None
+    self.entries.move_to_end(key)
+    self.hits += 1
+    return embedding
+
+
+  def put(self, key, embedding):
+    self.entries[key] = np.asarray(embedding, dtype=np.float32)
+    self.entries.move_to_end(key)
+    while len(self.entries) > self.max_size:
+      self.entries.popitem(last=False)
+
+
+  def stats(self):
+    total = self.hits + self.misses
+    return {"size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0}
+
+
+  def load(self, cache_file):
+    """
+    Adds the entries saved in <cache_file> (if it exists) to the cache. The
+    entries that are already in the cache count as more recently used.
+    """
+    if not check_if_file_exists(cache_file):
+      return
+    with np.load(cache_file) as saved:
+      keys = json.loads(str(saved["keys"]))
+      embeddings = saved["embeddings"]
+    entries = OrderedDict((tuple(key), embedding)
+                          for key, embedding in zip(keys, embeddings))
+    entries.update(self.entries)
+    self.entries = entries
+    while len(self.entries) > self.max_size:
+      self.entries.popitem(last=False)
+
+
+  def save(self, cache_file):
+    """
+    Saves the cache to <cache_file>, as a .npz file of the keys (as JSON)
+    and the matrix of the embeddings. What is already in the file (e.g., from
+    another simulation) is merged in first, so that saving never drops the
+    embeddings that others added.
+    """
+    create_folder_if_not_there(cache_file)
+    self.load(cache_file)
+    if not self.entries:
+      return
+    # The embeddings of different models may differ in size, so they are
+    # only saved if they fit in one matrix with the latest ones.
+    dim = len(next(reversed(self.entries.values())))
+    entries = [(key, embedding) for key, embedding in self.entries.items()
+               if len(embedding) == dim]
+    buffer = io.BytesIO()
+    np.savez(buffer,
+             keys=np.array(json.dumps([list(key) for key, e in entries])),
+             embeddings=np.array([e for key, e in entries],
+                                 dtype=np.float32))
+    with open(f"{cache_file}.{os.getpid()}.tmp", "wb") as outfile:
+      outfile.write(buffer.getvalue())
+    os.replace(f"{cache_file}.{os.getpid()}.tmp", cache_file)
+
+
+# <query_embedding_cache> is the cache that the whole process shares.
+query_embedding_cache = QueryEmbeddingCache()
+
+
+def get_cached_query_embeddings(texts, model, embed_func):
+  """
+  Returns the embeddings of <texts>, only calling <embed_func> for the ones
+  that are not in the cache yet.
+
+  INPUT:
+    texts: A list of query strings.
+    model: The name of the embedding model.
+    embed_func: A function that takes a list of texts and returns their
+                embeddings.
+  OUTPUT:
+    The list of the embeddings of <texts>.
+  """
+  keys = [(model, i) for i in texts]
+  embeddings = [query_embedding_cache.get(i) for i in keys]
+  missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+  if missing:
+    new_embeddings = embed_func([texts[i] for i in missing])
+    for i, embedding in zip(missing, new_embeddings):
+      query_embedding_cache.put(keys[i], embedding)
+      embeddings[i] = np.asarray(embedding, dtype=np.float32)
+  return embeddings
@@ -0,0 +1,362 @@
+"""
+Author: irrealis (irrealis.chomp@gmail.com)
+
+File: region_graph.py
+Description: Defines the RegionGraph class, an HPA*-style abstraction of a
+PathEngine's grid. The map is split into regions (the connected parts of each
+sector/arena), the entrances between neighboring regions become the nodes of
+a small graph, and long trips are planned on that graph before being refined
+into tiles with cached intra-region paths.
+"""
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import heapq
+from collections import deque
+
+import numpy
+
+
+class RegionGraph:
+  """
+  Portal graph over the regions of a grid.
+
+  Paths found here are near-shortest rather than shortest: a trip is routed
+  through a few fixed portal tiles per entrance, and a trip that starts and
+  ends in the same region stays inside it. In exchange, a query only 
+  searches the start and goal regions tile by tile, which keeps cross-town
+  trips cheap on maps far larger than the_ville.
+  """
+  def __init__(self, engine, region_maze, cluster_size=16):
+    """
+    INPUT:
+      engine: The PathEngine of the map.
+      region_maze: A row-major list of rows (accessed [y][x]) with the same
+                   dimensions as the engine's grid, holding a hashable region
+                   label for every tile. e.g., ("Hobbs Cafe", "cafe")
+                   It may also be a 2D int array of label ids (or anything
+                   numpy.asarray() takes, e.g., a Maze tile layer), which is
+                   read once per build().
+      cluster_size: Regions are also cut into square clusters of this many
+                    tiles per side, so that large open areas (e.g., the 
+                    streets) do not become one huge region. 
+    """
+    self.engine = engine
+    self.region_maze = region_maze
+    self.cluster_size = cluster_size
+    self.build()
+
+
+  def build(self):
+    """
+    (Re)builds the regions, portals and portal graph from the engine's
+    current collision grid.
+    """
+    engine = self.engine
+    width = engine.width
+    size = width * engine.height
+    passable = engine._passable
+    c = self.cluster_size
+    if hasattr(self.region_maze, "__array__"):
+      # Each (label id, cluster) pair is folded into one int. 
+      region_maze = numpy.asarray(self.region_maze).astype(numpy.int64)
+      ys, xs = numpy.indices(region_maze.shape)
+      clusters = (ys // c) * (-(-engine.width // c)) + xs // c
+      labels = (region_maze * (clusters.max() + 1) + clusters).ravel().tolist()
+    else:
+      labels = [(label, x // c, y // c) 
+                for y, row in enumerate(self.region_maze) 
+                for x, label in enumerate(row)]
+
+    # <region> gives the region id of every passable tile (-1 for collision
+    # blocks). A region is a connected set of tiles with the same label in
+    # the same cluster.
+    region = [-1] * size
+    self.region_tiles = []
+    for index in range(size):
+      if region[index] != -1 or not passable[index]:
+        continue
+      region_id = len(self.region_tiles)
+      region[index] = region_id
+      tiles = [index]
+      queue = deque([index])
+      while queue:
+        curr = queue.popleft()
+        for nxt in engine.neighbors(curr):
+          if (region[nxt] == -1 and passable[nxt]
+              and labels[nxt] == labels[index]):
+            region[nxt] = region_id
+            tiles += [nxt]
+            queue.append(nxt)
+      self.region_tiles += [tiles]
+    self.region = region
+
+    # Entrances are maximal runs of neighboring tile pairs along the border
+    # of two regions. Each one becomes a pair of portal tiles (one on each
+    # side of its middle), joined by a single step.
+    runs = dict()
+    for index in range(size):
+      a = region[index]
+      if a == -1:
+        continue
+      x = index % width
+      for nxt, axis in ((index + 1 if x < width - 1 else -1, "x"),
+                        (index + width if index + width < size else -1, "y")):
+        if nxt < 0 or region[nxt] == -1 or region[nxt] == a:
+          continue
+        # Pairs in one entrance share the border line and the two regions,
+        # and follow each other along that line.
+        line = x if axis == "x" else index // width
+        key = (axis, line, a, region[nxt])
+        runs.setdefault(key, []).append((index, nxt))
+
+    wide_entrance = 6
+    self.edges = dict()
+    for key, pairs in runs.items():
+      axis = key[0]
+      step = width if axis == "x" else 1
+      run = [pairs[0]]
+      for pair in pairs[1:] + [None]:
+        if pair is not None and pair[0] - run[-1][0] == step:
+          run += [pair]
+          continue
+        # Wide entrances get a portal near each end instead, so that trips
+        # along the border are not pulled to its middle.
+        if len(run) >= wide_entrance:
+          picks = [run[1], run[-2]]
+        else:
+          picks = [run[len(run)//2]]
+        for a, b in picks:
+          self.edges.setdefault(a, dict())[b] = 1
+          self.edges.setdefault(b, dict())[a] = 1
+        run = [pair]
+
+    # <region_portals> lists the portal tiles of each region. Portals of the
+    # same region are joined by the length of the shortest path between them
+    # inside the region.
+    self.region_portals = [[] for _ in self.region_tiles]
+    for portal in sorted(self.edges):
+      self.region_portals[region[portal]] += [portal]
+    for portals in self.region_portals:
+      for portal in portals:
+        dist = self.region_bfs([portal], portals)
+        for other in portals:
+          if other != portal and other in dist:
+            self.edges[portal][other] = dist[other]
+
+    # <segments> caches the refined tile paths between portals of the same
+    # region. They are only computed when a trip actually uses them.
+    self.segments = dict()
+    self.version = engine.version
+
+
+  def region_bfs(self, sources, targets=None):
+    """
+    Runs a BFS from <sources> that stays inside their region.
+
+    INPUT:
+      sources: A list of flat indices in the same region.
+      targets: Optional list of flat indices; the search stops once all of
+               them are labeled.
+    OUTPUT:
+      A dictionary that maps every reached flat index to its distance.
+    """
+    region = self.region
+    region_id = region[sources[0]]
+    neighbors = self.engine.neighbors
+    dist = dict((i, 0) for i in sources)
+    remaining = set(targets) - set(sources) if targets is not None else None
+    queue = deque(sources)
+    while queue and remaining != set():
+      curr = queue.popleft()
+      d = dist[curr] + 1
+      for nxt in neighbors(curr):
+        if region[nxt] != region_id or nxt in dist:
+          continue
+        dist[nxt] = d
+        if remaining is not None:
+          remaining.discard(nxt)
+        queue.append(nxt)
+    return dist
+
+
+  def region_backtrack(self, dist, end):
+    """
+    Walks back from <end> to a distance-0 source of a region_bfs() result,
+    with the same up, left, down, right tie-breaking as PathEngine.backtrack.
+
+    OUTPUT:
+      A list of flat indices from the source to <end>.
+    """
+    curr = end
+    k = dist[end]
+    the_path = [curr]
+    while k > 0:
+      for nxt in self.engine.neighbors(curr):
+        if dist.get(nxt) == k - 1:
+          curr = nxt
+          break
+      the_path += [curr]
+      k -= 1
+    the_path.reverse()
+    return the_path
+
+
+  def segment(self, a, b):
+    """
+    Returns the tile path (flat indices) between two portals <a> and <b>.
+    Portals of the same region are refined on first use and cached; portals
+    across an entrance are a single step apart.
+    """
+    if self.region[a] != self.region[b]:
+      return [a, b]
+    if (a, b) not in self.segments:
+      the_path = self.region_backtrack(self.region_bfs([a], [b]), b)
+      self.segments[(a, b)] = the_path
+      self.segments[(b, a)] = the_path[::-1]
+    return self.segments[(a, b)]
+
+
+  def find_abstract_path(self, start, goals):
+    """
+    Plans a trip on the portal graph, without refining it into tiles.
+
+    INPUT:
+      start: The (x, y) tile to start from. It must be passable.
+      goals: A list of (x, y) goal tiles.
+    OUTPUT:
+      A (start_dist, portals, goal_dist) triple. <portals> lists the flat
+      indices of the portals to walk through, in order. <start_dist> and
+      <goal_dist> are the region_bfs() results of the start tile and of the
+      goal tiles in the last region, which refine the first and last legs.
+      If a goal is in the start region, <portals> is [] and <goal_dist> is
+      None. (None, None, None) if no goal can be reached.
+    """
+    if self.version != self.engine.version:
+      self.build()
+    engine = self.engine
+    region = self.region
+    s = engine.to_index(start)
+    goal_indices = [engine.to_index(i) for i in goals
+                    if engine.in_bounds(i) and region[engine.to_index(i)] != -1]
+    if region[s] == -1 or not goal_indices:
+      return None, None, None
+
+    start_portals = self.region_portals[region[s]]
+    start_dist = self.region_bfs([s])
+    if any(i in start_dist for i in goal_indices):
+      return start_dist, [], None
+
+    # The goal side works like a virtual node that is joined to the portals
+    # of each goal region by their distance to the nearest goal tile.
+    goal_regions = dict()
+    for i in goal_indices:
+      goal_regions.setdefault(region[i], []).append(i)
+    goal_dists = dict()
+    for region_id, tiles in goal_regions.items():
+      goal_dists[region_id] = self.region_bfs(tiles)
+
+    goal_tiles = [engine.to_tile(i) for i in goal_indices]
+    def heuristic(index):
+      x, y = index % engine.width, index // engine.width
+      return min(abs(x - i[0]) + abs(y - i[1]) for i in goal_tiles)
+
+    # A* over the portal graph. The start is joined to the portals of its own
+    # region by the BFS distances above.
+    g = dict()
+    parent = dict()
+    heap = []
+    counter = 0
+    for portal in start_portals:
+      if portal in start_dist:
+        g[portal] = start_dist[portal]
+        parent[portal] = None
+        heapq.heappush(heap, (g[portal] + heuristic(portal), counter, portal))
+        counter += 1
+
+    best = None
+    best_cost = None
+    closed = set()
+    while heap:
+      f, _, curr = heapq.heappop(heap)
+      if best_cost is not None and f >= best_cost:
+        break
+      if curr in closed:
+        continue
+      closed.add(curr)
+      goal_dist = goal_dists.get(region[curr])
+      if goal_dist is not None and curr in goal_dist:
+        cost = g[curr] + goal_dist[curr]
+        if best_cost is None or cost < best_cost:
+          best, best_cost = curr, cost
+      for nxt, cost in self.edges[curr].items():
+        new_g = g[curr] + cost
+        if nxt not in g or new_g < g[nxt]:
+          g[nxt] = new_g
+          parent[nxt] = curr
+          heapq.heappush(heap, (new_g + heuristic(nxt), counter, nxt))
+          counter += 1
+
+    if best is None:
+      return None, None, None
+    portals = [best]
+    while parent[portals[-1]] is not None:
+      portals += [parent[portals[-1]]]
+    portals.reverse()
+    return start_dist, portals, goal_dists[region[best]]
+
+
+  def find_nearest_path(self, start, goals):
+    """
+    Finds a near-shortest path from <start> to the nearest of <goals>,
+    refining the whole trip into tiles.
+
+    INPUT:
+      start: The (x, y) tile to start from.
+      goals: A list of (x, y) goal tiles.
+    OUTPUT:
+      A (goal, path) pair, like PathEngine.find_nearest_path. (None, []) if
+      none of the goals can be reached.
+    """
+    engine = self.engine
+    goals = [tuple(i) for i in goals]
+    if not engine.is_passable(start):
+      # e.g., a persona standing on a collision block; the grid search knows
+      # how to step off it.
+      return engine.find_nearest_path(start, goals)
+    if goals and min(abs(start[0] - i[0]) + abs(start[1] - i[1]) 
+                     for i in goals) <= 2 * self.cluster_size:
+      # Short trips are cheap to search tile by tile, and that is where the
+      # detours through portals would show the most. 
+      return engine.find_nearest_path(start, goals)
+
+    start_dist, portals, goal_dist = self.find_abstract_path(start, goals)
+    if start_dist is None:
+      return None, []
+
+    goal_indices = [engine.to_index(i) for i in goals if engine.in_bounds(i)]
+    if not portals:
+      # The first goal in <goals> wins ties, like the grid search.
+      end = min((i for i in goal_indices if i in start_dist),
+                key=lambda i: start_dist[i])
+      the_path = self.region_backtrack(start_dist, end)
+    else:
+      the_path = self.region_backtrack(start_dist, portals[0])
+      for a, b in zip(portals, portals[1:]):
+        the_path += self.segment(a, b)[1:]
+      # Backtracking the goal side's BFS from the last portal walks down to
+      # the nearest goal tile.
+      the_path += self.region_backtrack(goal_dist, portals[-1])[::-1][1:]
+    return engine.to_tile(the_path[-1]), [engine.to_tile(i) for i in the_path]
+
+
+  def find_path(self, start, end):
+    """
+    Finds a near-shortest path from <start> to <end>.
+
+    OUTPUT:
+      A list of (x, y) tiles that includes both <start> and <end>, or [] if
+      <end> cannot be reached.
+    """
+    return self.find_nearest_path(start, [end])[1]
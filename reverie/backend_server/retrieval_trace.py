@@ -0,0 +1,92 @@
+"""
+Author: irrealis (irrealis.chomp@gmail.com)
+
+File: retrieval_trace.py
+Description: Defines the sinks that new_retrieve() can send a trace of each
+retrieval to: the focal points, how many nodes were scored for each, the time
+each phase took, and the score breakdown of the retrieved nodes. Tracing is
+off unless <retrieval_trace_sink> is set, either from the <retrieval_trace>
+setting or with set_retrieval_trace_sink().
+"""
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import json
+from collections import deque
+
+from global_methods import *
+from utils import *
+
+
+class JSONLTraceSink:
+  """
+  Appends each trace record to <trace_file> as a line of JSON.
+  """
+  def __init__(self, trace_file):
+    self.trace_file = trace_file
+    self.outfile = None
+
+
+  def write(self, record):
+    if self.outfile is None:
+      create_folder_if_not_there(self.trace_file)
+      self.outfile = open(self.trace_file, "a")
+    self.outfile.write(json.dumps(record) + "\n")
+    self.outfile.flush()
+
+
+  def close(self):
+    if self.outfile is not None:
+      self.outfile.close()
+      self.outfile = None
+
+
+class RingBufferTraceSink:
+  """
+  Keeps the last <size> trace records in memory.
+  """
+  def __init__(self, size):
+    self.records = deque(maxlen=size)
+
+
+  def write(self, record):
+    self.records.append(record)
+
+
+  def get_records(self):
+    return list(self.records)
+
+
+  def close(self):
+    pass
+
+
+def make_retrieval_trace_sink(kind):
+  """
+  Returns a new sink of the given kind: None (no tracing), "jsonl" (to
+  <retrieval_trace_file>), or "ring" (the last <retrieval_trace_ring_size>
+  records).
+  """
+  if kind is None:
+    return None
+  if kind == "jsonl":
+    return JSONLTraceSink(retrieval_trace_file)
+  if kind == "ring":
+    return RingBufferTraceSink(retrieval_trace_ring_size)
+  raise ValueError(f"Unknown retrieval trace sink: {kind}")
+
+
+# <retrieval_trace_sink> is the sink that new_retrieve() writes to, if any.
+retrieval_trace_sink = make_retrieval_trace_sink(retrieval_trace)
+
+
+def set_retrieval_trace_sink(sink):
+  """
+  Replaces the retrieval trace sink (None turns tracing off), and returns
+  the one it replaced.
+  """
+  global retrieval_trace_sink
+  old_sink = retrieval_trace_sink
+  retrieval_trace_sink = sink
+  return old_sink
@@ -45,6 +45,8 @@ from global_methods import *
 from utils import *
 from maze import *
 from persona.persona import *
+from poignancy_cache import *
+from query_embedding_cache import query_embedding_cache
 
 ##############################################################################
 #                                  REVERIE                                   #
@@ -146,11 +148,24 @@ class ReverieServer:
       p_x = init_env[persona_name]["x"]
       p_y = init_env[persona_name]["y"]
       curr_persona = Persona(persona_name, persona_folder)
+      curr_persona.scratch.sec_per_step = self.sec_per_step
 
       self.personas[persona_name] = curr_persona
       self.personas_tile[persona_name] = (p_x, p_y)
-      self.maze.tiles[p_y][p_x]["events"].add(curr_persona.scratch
-                                              .get_curr_event_and_desc())
+      self.maze.add_event_from_tile(curr_persona.scratch
+                                    .get_curr_event_and_desc(), (p_x, p_y))
+
+    # <path_pool> is the PathPool that batch path planning fans out to. It is
+    # only started when first needed (see get_path_pool). 
+    self.path_pool = None
+
+    # The poignancy scores that earlier runs of this simulation (or, if 
+    # <share_poignancy_cache> is set, of its sibling forks) asked for are 
+    # loaded into the shared poignancy cache. 
+    poignancy_cache.load(get_poignancy_cache_file(self.sim_code))
+    # The same goes for the embeddings of the retrieval focal points, which
+    # all simulations share. 
+    query_embedding_cache.load(query_embedding_cache_file)
 
     # REVERIE SETTINGS PARAMETERS:  
     # <server_sleep> denotes the amount of time that our while loop rests each
@@ -201,10 +216,37 @@ class ReverieServer:
     with open(reverie_meta_f, "w") as outfile: 
       outfile.write(json.dumps(reverie_meta, indent=2))
 
+    # Save the maze's distance fields so that later runs start warm. 
+    self.maze.save_distance_fields()
+    log.info(f'path cache: {self.maze.path_engine.path_cache_stats()}')
+
+    # Save the poignancy cache. 
+    poignancy_cache.save(get_poignancy_cache_file(self.sim_code))
+    log.info(f'poignancy cache: {poignancy_cache.stats()}')
+
+    # Save the query embedding cache. 
+    query_embedding_cache.save(query_embedding_cache_file)
+    log.info(f'query embedding cache: {query_embedding_cache.stats()}')
+
     # Save the personas.
     for persona_name, persona in self.personas.items(): 
       save_folder = f"{sim_folder}/personas/{persona_name}/bootstrap_memory"
       persona.save(save_folder)
+      log.info(f'{persona_name} retrieval: '
+               f'{persona.a_mem.get_retrieval_stats()}')
+
+
+  def get_path_pool(self): 
+    """
+    Returns the PathPool for batch path planning, or None if no worker 
+    processes are configured (see <path_planning_processes> in utils.py). 
+    """
+    if path_planning_processes <= 0: 
+      return None
+    if self.path_pool is None: 
+      self.path_pool = PathPool(self.maze.path_engine, 
+                                path_planning_processes)
+    return self.path_pool
 
 
   def start_path_tester_server(self): 
@@ -395,17 +437,47 @@ class ReverieServer:
           # This is where the core brains of the personas are invoked. 
           movements = {"persona": dict(), 
                        "meta": dict()}
+          # Before any persona perceives, the texts that all of their
+          # perceptions need embedded are embedded together in one batch
+          # (see EmbeddingCollector in embeddings.py), and the poignancy of
+          # all of their new events is scored together as well. 
+          embedding_collector.clear()
+          personas_new_events = []
+          for persona_name, persona in self.personas.items(): 
+            new_events = get_new_events(persona, self.maze, 
+                                        self.personas_tile[persona_name])
+            request_perceive_embeddings(persona, new_events)
+            personas_new_events += [(persona, new_events)]
+          embedding_collector.resolve()
+          score_perceive_poignancies(personas_new_events)
+          if batch_path_planning: 
+            # All personas plan their step first; the paths they need are 
+            # then found together in one batch. 
+            plans = dict()
+            for persona_name, persona in self.personas.items(): 
+              plans[persona_name] = persona.think(
+                self.maze, self.personas, self.personas_tile[persona_name], 
+                self.curr_time)
+            executions = execute_all(self.maze, self.personas, plans, 
+                                     self.get_path_pool())
           for persona_name, persona in self.personas.items(): 
             # <next_tile> is a x,y coordinate. e.g., (58, 9)
             # <pronunciatio> is an emoji. e.g., "\ud83d\udca4"
             # <description> is a string description of the movement. e.g., 
             #   writing her next novel (editing her novel) 
             #   @ double studio:double studio:common room:sofa
-            next_tile, pronunciatio, description = persona.move(
-              self.maze, self.personas, self.personas_tile[persona_name], 
-              self.curr_time)
+            if batch_path_planning: 
+              next_tile, pronunciatio, description = executions[persona_name]
+            else: 
+              next_tile, pronunciatio, description = persona.move(
+                self.maze, self.personas, self.personas_tile[persona_name], 
+                self.curr_time)
             movements["persona"][persona_name] = {}
             movements["persona"][persona_name]["movement"] = next_tile
+            # <path> lists every tile walked during this step, ending at 
+            # <next_tile>; it is longer than one tile for coarse steps. 
+            movements["persona"][persona_name]["path"] = (persona.scratch
+                                                          .step_path)
             movements["persona"][persona_name]["pronunciatio"] = pronunciatio
             movements["persona"][persona_name]["description"] = description
             movements["persona"][persona_name]["chat"] = (persona
@@ -427,6 +499,12 @@ class ReverieServer:
           with open(curr_move_file, "w") as outfile: 
             outfile.write(json.dumps(movements, indent=2))
 
+          # The chunks of the maze that no persona is near anymore are
+          # evicted, so that only the parts of a large map around the
+          # personas stay in memory.
+          self.maze.evict_tile_chunks([persona.scratch.curr_tile for persona
+                                       in self.personas.values()])
+
           # After this cycle, the world takes one step forward, and the 
           # current time moves by <sec_per_step> amount. 
           self.step += 1
@@ -19,8 +19,71 @@ env_visuals = f"{maze_assets_loc}/the_ville/visuals"
 
 fs_storage = f"{environment_loc}/frontend_server/storage"
 fs_temp_storage = f"{environment_loc}/frontend_server/temp_storage"
+maze_cache_loc = f"{fs_temp_storage}/maze_cache"
+poignancy_cache_loc = f"{fs_temp_storage}/poignancy_cache"
+query_embedding_cache_file = f"{fs_temp_storage}/query_embedding_cache.npz"
+retrieval_trace_file = f"{fs_temp_storage}/retrieval_trace.jsonl"
 
 collision_block_id = "32125"
+# Maps with at least this many tiles plan trips on the region graph (see 
+# region_graph.py) instead of searching the whole tile grid. 
+hierarchical_path_min_tiles = 40000
+# If True, the personas first all plan their step, and then the paths they
+# need are found together in one batch (see execute_all in execute.py). 
+# <path_planning_processes> worker processes are used for the batch if it 
+# is more than 0. 
+batch_path_planning = False
+path_planning_processes = 0
+# <sec_per_tile> is the number of game seconds a persona takes to walk one
+# tile. When a simulation's <sec_per_step> is larger, personas walk several
+# tiles of their planned path per step. 
+sec_per_tile = 10
+# The tile layers of a maze are kept as <maze_chunk_size> x <maze_chunk_size>
+# chunks that are loaded when first touched (see maze_chunks.py). Each step,
+# the chunks farther than <maze_chunk_keep_r> tiles from every persona are 
+# evicted again. 
+maze_chunk_size = 32
+maze_chunk_keep_r = 32
+# Poignancy scores are asked for in batches of at most 
+# <poignancy_batch_size> events per prompt, with up to 
+# <poignancy_batch_workers> prompts in flight at once (see 
+# run_gpt_prompt_event_poignancy_batch). 
+poignancy_batch_size = 20
+poignancy_batch_workers = 4
+# Poignancy scores are memoized in an LRU cache of up to 
+# <poignancy_cache_size> entries (see poignancy_cache.py). If 
+# <share_poignancy_cache> is True, all forks of the same base simulation 
+# share one cache file; otherwise, each simulation keeps its own. 
+poignancy_cache_size = 100000
+share_poignancy_cache = False
+# new_retrieve() scores the relevance of every node in a persona's memory, 
+# unless <retrieval_ann_index> is "ivf" (a pure numpy inverted file index) 
+# or "hnsw" (needs hnswlib); see ann_index.py. Then, once a memory has 
+# <retrieval_ann_min_nodes> nodes, only about <retrieval_ann_candidates> 
+# nodes that the index finds for a focal point (and as many with the 
+# highest recency and importance) are scored. 
+retrieval_ann_index = None
+retrieval_ann_min_nodes = 5000
+retrieval_ann_candidates = 1000
+# If <hybrid_retrieval> is True, new_retrieve() only scores the relevance of
+# the events and thoughts that share a keyword (kw_to_event, kw_to_thought)
+# with the focal point, and of the <hybrid_retrieval_recent> latest ones. 
+# Keywords of more than <hybrid_retrieval_max_kw_nodes> nodes are too 
+# common to count. If there are fewer than <hybrid_retrieval_min_candidates>
+# candidates, all nodes are scored after all (0 turns this off). 
+hybrid_retrieval = False
+hybrid_retrieval_recent = 200
+hybrid_retrieval_max_kw_nodes = 1000
+hybrid_retrieval_min_candidates = 50
+# The embeddings of the retrieval focal points are kept in an LRU cache of 
+# up to <query_embedding_cache_size> entries, which is saved to 
+# <query_embedding_cache_file> (see query_embedding_cache.py). 
+query_embedding_cache_size = 10000
+# If <retrieval_trace> is "jsonl" or "ring", new_retrieve() records a trace 
+# of each retrieval to <retrieval_trace_file>, or keeps the last 
+# <retrieval_trace_ring_size> of them in memory (see retrieval_trace.py). 
+retrieval_trace = None
+retrieval_trace_ring_size = 1000
 
 # Verbose 
 debug = True
@@ -0,0 +1,78 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+from address_registry import *
+
+import pytest
+
+import pickle
+
+
+@pytest.fixture
+def registry():
+  return AddressRegistry()
+
+
+def test__address_registry__intern(registry):
+  address = "the Ville:Hobbs Cafe:cafe"
+  address_id = registry.intern(address)
+  assert registry.intern("the Ville:Hobbs Cafe:" + "cafe") == address_id
+  assert registry.intern("the Ville:Hobbs Cafe") != address_id
+  other = ":".join(["the Ville", "Hobbs Cafe", "cafe"])
+  assert other is not address
+  assert registry.intern_address(other) is address
+  assert registry.intern_address(None) is None
+  assert registry.get_parts(address) == ("the Ville", "Hobbs Cafe", "cafe")
+
+
+def test__address_registry__kinds_and_targets(registry):
+  assert registry.get_kind("the Ville:Hobbs Cafe:cafe:counter") == ""
+  assert registry.get_target("the Ville:Hobbs Cafe:cafe:counter") == ""
+  assert registry.get_kind("<persona> Maria Lopez") == "<persona>"
+  assert registry.get_target("<persona> Maria Lopez") == "Maria Lopez"
+  assert registry.get_kind("<waiting> 58 9") == "<waiting>"
+  assert registry.get_target("<waiting> 58 9") == "58 9"
+  assert registry.get_kind("the Ville:Hobbs Cafe:cafe:<random>") == "<random>"
+
+
+def test__address_registry__get_level(registry):
+  address = "the Ville:Hobbs Cafe:cafe:<random>"
+  assert registry.get_level(address, "world") == "the Ville"
+  assert registry.get_level(address, "arena") == "the Ville:Hobbs Cafe:cafe"
+  assert (registry.get_level(address, "arena")
+          is registry.intern_address("the Ville:Hobbs Cafe:" + "cafe"))
+
+
+def test__address_registry__does_not_register_transient_addresses(registry):
+  count = len(registry.addresses)
+  assert registry.get_kind("<waiting> 58 9") == "<waiting>"
+  assert registry.get_target("<waiting> 58 9") == "58 9"
+  assert registry.intern_address("<waiting> 58 9") == "<waiting> 58 9"
+  assert registry.get_id("<waiting> 58 9") is None
+  assert len(registry.addresses) == count
+
+
+def test__address_dict():
+  address_dict = AddressDict()
+  address = ":".join(["the Ville", "Hobbs Cafe", "cafe"])
+  address_dict[address] = {(1, 2)}
+  assert address_dict["the Ville:Hobbs Cafe:cafe"] == {(1, 2)}
+  assert (address_dict.get_by_id(get_address_id(address)) 
+          is address_dict[address])
+  assert list(address_dict) == [intern_address(address)]
+  assert "the Ville:Hobbs Cafe:counter" not in address_dict
+  assert address_dict.get("the Ville:Hobbs Cafe:counter") is None
+  assert pickle.loads(pickle.dumps(address_dict)) == address_dict
+  del address_dict[address]
+  assert len(address_dict) == 0
@@ -0,0 +1,127 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+import persona.memory_structures.associative_memory as associative_memory
+from persona.memory_structures.associative_memory import *
+from persona.memory_structures.ann_index import *
+
+import numpy as np
+import pytest
+
+import datetime
+import json
+import time
+
+
+def make_memory(tmp_path, ann_index, n, n_topics=64, dim=64, seed=0):
+  for name, data in [("embeddings.json", {}), ("nodes.json", {}),
+                     ("kw_strength.json", {"kw_strength_event": None,
+                                           "kw_strength_thought": None})]:
+    with open(tmp_path / name, "w") as outfile:
+      json.dump(data, outfile)
+  a_mem = AssociativeMemory(str(tmp_path))
+  a_mem.node_matrix.ann_index = ann_index
+
+  # The embeddings are clustered by topic, like the embeddings of the
+  # recurring events of a persona's memory.
+  rng = np.random.default_rng(seed)
+  topics = rng.standard_normal((n_topics, dim))
+  start = datetime.datetime(2023, 2, 13)
+  for i in range(n):
+    embedding = topics[rng.integers(n_topics)] + 0.5*rng.standard_normal(dim)
+    a_mem.add_event(start + datetime.timedelta(minutes=i), None,
+                    "s", "p", "o", f"event {i}", set(["s"]),
+                    int(rng.integers(1, 10)), (f"event {i}", embedding.tolist()),
+                    None)
+  queries = topics + 0.5*rng.standard_normal(topics.shape)
+  return a_mem, queries
+
+
+def retrieve_top(a_mem, focal_embeddings, n_count, gw=[0.5, 3, 2]):
+  recency, importance, relevance = a_mem.get_retrieval_scores(
+    focal_embeddings, 0.99)
+  rows = a_mem.node_matrix.get_access_order()
+  return [set(rows[top_highest_x_indices(
+            recency*gw[0] + relevance[count][rows]*gw[1]
+            + importance[rows]*gw[2], n_count)].tolist())
+          for count in range(len(focal_embeddings))]
+
+
+def measure_recall_at_k(a_mem, queries, k, monkeypatch):
+  """
+  Returns the mean recall@k of the retrievals with the memory's index, and
+  the mean times (s) of exact and indexed scoring of one query.
+  """
+  monkeypatch.setattr(associative_memory, "retrieval_ann_min_nodes", 10**9)
+  start = time.time()
+  exact = [retrieve_top(a_mem, [i], k)[0] for i in queries]
+  exact_time = (time.time() - start) / len(queries)
+  monkeypatch.setattr(associative_memory, "retrieval_ann_min_nodes", 0)
+  start = time.time()
+  approx = [retrieve_top(a_mem, [i], k)[0] for i in queries]
+  approx_time = (time.time() - start) / len(queries)
+  recall = np.mean([len(i & j) / k for i, j in zip(exact, approx)])
+  return recall, exact_time, approx_time
+
+
+def test__ivf_index__search_finds_nearest_rows():
+  rng = np.random.default_rng(0)
+  embeddings = rng.standard_normal((2000, 16)).astype(np.float32)
+  index = IVFIndex(train_min=500)
+  for row in range(len(embeddings)):
+    index.set(row, embeddings[row], embeddings)
+  assert index.trained_count == 2000
+  assert sorted(sum(index.lists, [])) == list(range(2000))
+
+  for row in [0, 999, 1999]:
+    assert row in index.search(embeddings[row], 50)
+  # Updating an embedding moves its row to the cluster of the new one.
+  embeddings[5] = embeddings[1500]
+  index.set(5, embeddings[5], embeddings)
+  assert index.assignments[5] == index.assignments[1500]
+  assert sum(len(i) for i in index.lists) == 2000
+
+
+def test__ivf_index__untrained_search_returns_all_rows():
+  index = IVFIndex(train_min=100)
+  embeddings = np.eye(4, dtype=np.float32)
+  for row in range(4):
+    index.set(row, embeddings[row], embeddings)
+  assert index.search(embeddings[0], 2).tolist() == [0, 1, 2, 3]
+
+
+def test__make_ann_index():
+  assert make_ann_index(None) is None
+  assert isinstance(make_ann_index("ivf"), IVFIndex)
+  with pytest.raises(ValueError):
+    make_ann_index("lsh")
+
+
+def test__ivf_index__recall_at_k(tmp_path, monkeypatch):
+  monkeypatch.setattr(associative_memory, "retrieval_ann_candidates", 500)
+  a_mem, queries = make_memory(tmp_path, IVFIndex(train_min=1000), 10000)
+  recall, exact_time, approx_time = measure_recall_at_k(
+    a_mem, queries, 30, monkeypatch)
+  log.debug(f"IVF {recall=:.3f} {exact_time=:.4f} {approx_time=:.4f}")
+  assert recall >= 0.95
+
+
+def test__hnsw_index__recall_at_k(tmp_path, monkeypatch):
+  pytest.importorskip("hnswlib")
+  monkeypatch.setattr(associative_memory, "retrieval_ann_candidates", 500)
+  a_mem, queries = make_memory(tmp_path, HNSWIndex(), 10000)
+  recall, exact_time, approx_time = measure_recall_at_k(
+    a_mem, queries, 30, monkeypatch)
+  log.debug(f"HNSW {recall=:.3f} {exact_time=:.4f} {approx_time=:.4f}")
+  assert recall >= 0.95
@@ -0,0 +1,123 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+import persona.memory_structures.associative_memory as associative_memory
+from persona.memory_structures.associative_memory import *
+
+import numpy as np
+import pytest
+
+import datetime
+import json
+import random
+
+
+@pytest.fixture
+def a_mem(tmp_path):
+  for name, data in [("embeddings.json", {}), ("nodes.json", {}),
+                     ("kw_strength.json", {"kw_strength_event": None,
+                                           "kw_strength_thought": None})]:
+    with open(tmp_path / name, "w") as outfile:
+      json.dump(data, outfile)
+  return AssociativeMemory(str(tmp_path))
+
+
+def add_event(a_mem, s, p, o):
+  a_mem.add_event(datetime.datetime(2023, 2, 13), None, s, p, o,
+                  f"{s} {p} {o}", {s, o}, 1, (f"{s} {p} {o}", [0.0]), [])
+
+
+def test__recent_event_window__matches_latest_events(a_mem):
+  rng = random.Random(0)
+  window = a_mem.get_recent_event_window(5)
+  for i in range(200):
+    s = rng.choice(["bed", "desk", "Maria Lopez", "Klaus Mueller"])
+    o = rng.choice(["idle", "used"])
+    if i == 100:
+      late_window = a_mem.get_recent_event_window(7)
+    add_event(a_mem, s, "is", o)
+    for size in [5, 7] if i >= 100 else [5]:
+      latest = set(e.spo_summary() for e in a_mem.seq_event[:size])
+      curr_window = a_mem.get_recent_event_window(size)
+      assert set(curr_window.counts) == latest
+      assert len(curr_window) == min(size, i + 1)
+  assert window is a_mem.get_recent_event_window(5)
+  assert late_window is a_mem.get_recent_event_window(7)
+  assert a_mem.get_summarized_latest_events(5) == set(window.counts)
+
+
+def test__recent_event_window__is_saved(a_mem, tmp_path):
+  add_event(a_mem, "bed", "is", "idle")
+  add_event(a_mem, "desk", "is", "used")
+  a_mem.get_recent_event_window(5)
+  a_mem.save(str(tmp_path))
+  with open(tmp_path / "recent_events.json") as infile:
+    assert json.load(infile) == {"5": [["desk", "is", "used"],
+                                       ["bed", "is", "idle"]]}
+
+
+def add_embedded_event(a_mem, s, p, o, embedding):
+  a_mem.add_event(datetime.datetime(2023, 2, 13), None, s, p, o,
+                  f"{s} {p} {o}", {s, p, o}, 1, (f"{s} {p} {o}", embedding),
+                  [])
+
+
+def test__focal_keywords__match_keyword_phrases(a_mem):
+  add_event(a_mem, "Isabella Rodriguez", "is", "planning a party")
+  add_event(a_mem, "kitchen sink", "is", "used")
+  assert a_mem.get_focal_keywords(
+    "What is Isabella Rodriguez doing at the kitchen sink?") == set(
+      ["isabella rodriguez", "kitchen sink"])
+
+
+def test__hybrid_retrieval__scores_keyword_and_recent_candidates(
+    a_mem, monkeypatch):
+  monkeypatch.setattr(associative_memory, "hybrid_retrieval", True)
+  monkeypatch.setattr(associative_memory, "hybrid_retrieval_recent", 3)
+  monkeypatch.setattr(associative_memory, "hybrid_retrieval_max_kw_nodes", 5)
+  monkeypatch.setattr(associative_memory, "hybrid_retrieval_min_candidates",
+                      0)
+  rng = np.random.default_rng(0)
+  for i in range(20):
+    add_embedded_event(a_mem, f"object {i}", "is", "used",
+                       rng.standard_normal(4).tolist())
+
+  # "used" is a keyword of all 20 events, so it does not count; the
+  # candidates are the two events of "object 4" and the 3 latest events.
+  add_embedded_event(a_mem, "object 4", "is", "broken",
+                     rng.standard_normal(4).tolist())
+  focal_pt = "Why is object 4 used?"
+  rows = a_mem.get_relevance_candidates(None, focal_pt, None)
+  assert sorted(a_mem.node_matrix.nodes[i].subject for i in rows) == [
+    "object 18", "object 19", "object 4", "object 4"]
+
+  focal_embedding = rng.standard_normal(4).tolist()
+  recency, importance, relevance = a_mem.get_retrieval_scores(
+    [focal_embedding], 0.99, [focal_pt])
+  assert np.count_nonzero(relevance[0]) <= len(rows)
+  assert set(np.flatnonzero(relevance[0])) <= set(rows.tolist())
+  assert a_mem.get_retrieval_stats()["candidates"] == len(rows)
+
+  # Too few candidates fall back to scoring all nodes.
+  monkeypatch.setattr(associative_memory, "hybrid_retrieval_min_candidates",
+                      10)
+  recency, importance, full_relevance = a_mem.get_retrieval_scores(
+    [focal_embedding], 0.99, [focal_pt])
+  exact = normalize_floats(
+    a_mem.node_matrix.get_relevance([focal_embedding])[0], 0, 1)
+  assert np.allclose(full_relevance[0], exact)
+  stats = a_mem.get_retrieval_stats()
+  assert stats["retrievals"] == 2
+  assert stats["full_scans"] == 1
+  assert stats["candidates"] == len(rows) + len(a_mem.node_matrix)
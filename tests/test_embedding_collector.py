@@ -0,0 +1,52 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+from persona.prompt_template.embeddings import EmbeddingCollector
+
+import pytest
+
+
+@pytest.fixture
+def calls():
+  return []
+
+
+@pytest.fixture
+def collector(calls):
+  def embed_documents(texts, model):
+    calls.append((model, list(texts)))
+    return [[float(len(i))] for i in texts]
+  return EmbeddingCollector(embed_documents)
+
+
+def test__embedding_collector__batches_and_dedupes(collector, calls):
+  for text in ["bed is idle", "desk is used", "bed is idle"]:
+    collector.request(text, "ada")
+  collector.request("bed is idle", "other")
+  collector.resolve()
+  assert calls == [("ada", ["bed is idle", "desk is used"]),
+                   ("other", ["bed is idle"])]
+  assert collector.get("desk is used", "ada") == [12.0]
+  collector.request("bed is idle", "ada")
+  collector.resolve()
+  assert len(calls) == 2
+
+
+def test__embedding_collector__get_resolves_pending(collector, calls):
+  collector.request("a", "ada")
+  assert collector.get("bc", "ada") == [2.0]
+  assert calls == [("ada", ["a", "bc"])]
+  collector.clear()
+  assert collector.get("a", "ada") == [1.0]
+  assert calls[-1] == ("ada", ["a"])
@@ -0,0 +1,219 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+from maze import Maze
+
+import pytest
+
+import math
+import numpy
+import pickle
+import random
+
+
+@pytest.fixture
+def maze():
+  return Maze("the_ville")
+
+
+def test__maze__access_tile(maze):
+  tile_details = maze.access_tile((58, 9))
+  assert tile_details["world"] == "the Ville"
+  assert tile_details["collision"] is False
+  assert set(tile_details.keys()) == set(maze.tile_levels
+                                         + ["collision", "events"])
+  for level in maze.tile_levels:
+    assert tile_details[level] == maze.get_tile_string((58, 9), level)
+
+
+def test__maze__get_tile_path__matches_address_tiles(maze):
+  for address, tiles in maze.address_tiles.items():
+    if address.startswith("<spawn_loc>"):
+      continue
+    level = ["sector", "arena", "game_object"][address.count(":") - 1]
+    for tile in tiles:
+      assert maze.get_tile_path(tile, level) == address
+
+
+def test__maze__get_tile_path__joins_tile_strings(maze):
+  levels = ["world", "sector", "arena", "game_object"]
+  for x in range(0, maze.maze_width, 7):
+    for y in range(0, maze.maze_height, 5):
+      for i, level in enumerate(levels):
+        path = ":".join(maze.get_tile_string((x, y), j)
+                        for j in levels[:i + 1])
+        assert maze.get_tile_path((x, y), level) == path
+
+
+def test__maze__addresses_are_interned(maze):
+  for address, tiles in maze.address_tiles.items():
+    if address.startswith("<spawn_loc>"):
+      continue
+    level = ["sector", "arena", "game_object"][address.count(":") - 1]
+    for tile in tiles:
+      assert maze.get_tile_path(tile, level) is address
+  assert (Maze("the_ville").get_tile_path((58, 9), "arena")
+          is maze.get_tile_path((58, 9), "arena"))
+
+
+def test__maze__game_objects_have_idle_events(maze):
+  for address, tiles in maze.address_tiles.items():
+    if address.count(":") != 3:
+      continue
+    for tile in tiles:
+      assert (address, None, None, None) in maze.access_tile(tile)["events"]
+
+
+def test__maze__tile_events_are_sparse(maze):
+  tile = (20, 20)
+  event = ("Isabella Rodriguez", "is", "idle", "idle")
+  assert tile not in maze.tile_events
+  maze.add_event_from_tile(event, tile)
+  assert maze.access_tile(tile)["events"] == {event}
+  maze.remove_subject_events_from_tile("Isabella Rodriguez", tile)
+  assert maze.access_tile(tile)["events"] == set()
+  assert tile not in maze.tile_events
+
+
+def test__maze__get_nearby_layer(maze):
+  tile = (58, 9)
+  nearby_tiles = maze.get_nearby_tiles(tile, 4)
+  left_end, _, top_end, _ = maze.get_nearby_bounds(tile, 4)
+  layer = maze.get_nearby_layer(tile, 4, "arena")
+  assert layer.size == len(nearby_tiles)
+  for x, y in nearby_tiles:
+    assert (maze.tile_strings["arena"][layer[y - top_end, x - left_end]]
+            == maze.access_tile((x, y))["arena"])
+
+
+def test__maze__compiled_artifact_matches_csv_build(maze):
+  # The fixture saved (or loaded) the compiled artifact.
+  for i in maze.get_compiled_maze_files():
+    assert os.path.exists(i)
+  assert maze.load_compiled_maze()
+
+  compiled = Maze("the_ville")
+  compiled.compile_maze()
+  assert maze.tile_layers.keys() == compiled.tile_layers.keys()
+  for level in maze.tile_layers:
+    assert (numpy.asarray(maze.tile_layers[level])
+            == numpy.asarray(compiled.tile_layers[level])).all()
+  assert maze.tile_strings == compiled.tile_strings
+  assert maze.tile_addresses == compiled.tile_addresses
+  assert maze.tile_events == compiled.tile_events
+  assert maze.address_tiles == compiled.address_tiles
+  assert maze.collision_maze == compiled.collision_maze
+
+  # The legacy collision map is derived from the collision layer. 
+  with open(maze.get_compiled_maze_files()[1], "rb") as infile:
+    assert "collision_maze" not in pickle.load(infile)
+
+
+def test__maze__set_tile_collision__does_not_touch_artifact(maze):
+  tile = (58, 9)
+  maze.set_tile_collision(tile, True)
+  assert Maze("the_ville").access_tile(tile)["collision"] is False
+
+
+def test__maze__access_tile__follows_set_tile_collision(maze):
+  tile = (60, 20)
+  assert maze.access_tile(tile)["collision"] is False
+  maze.set_tile_collision(tile, True)
+  assert maze.access_tile(tile)["collision"] is True
+  maze.set_tile_collision(tile, False)
+  assert maze.access_tile(tile)["collision"] is False
+
+
+def test__maze__whole_map_reads_do_not_load_chunks():
+  maze = Maze("the_ville")
+  maze.evict_tile_chunks([])
+  maze.get_region_graph()
+  maze.collision_maze
+  assert maze.tile_chunks.chunks == dict()
+
+
+def legacy_nearby_events(maze, curr_tile, vision_r, att_bandwidth):
+  '''The tile walk that perceive() used to do.'''
+  curr_arena_path = maze.get_tile_path(curr_tile, "arena")
+  percept_events_set = set()
+  percept_events_list = []
+  for tile in maze.get_nearby_tiles(curr_tile, vision_r):
+    tile_details = maze.access_tile(tile)
+    if tile_details["events"]:
+      if maze.get_tile_path(tile, "arena") == curr_arena_path:
+        dist = math.dist([tile[0], tile[1]], [curr_tile[0], curr_tile[1]])
+        for event in tile_details["events"]:
+          if event not in percept_events_set:
+            percept_events_list += [[dist, event]]
+            percept_events_set.add(event)
+  percept_events_list = sorted(percept_events_list, key=lambda i: i[0])
+  return [event for dist, event in percept_events_list[:att_bandwidth]]
+
+
+def test__maze__get_nearby_events__matches_legacy_perceive(maze):
+  rng = random.Random(0)
+  tiles = [(x, y) for y in range(maze.maze_height)
+           for x in range(maze.maze_width)]
+  event_tiles = [rng.choice(tiles) for i in range(200)]
+  for i, tile in enumerate(event_tiles):
+    event = (f"Persona {i}", "is", "idle", "idle")
+    maze.add_event_from_tile(event, tile)
+  for i in range(0, 200, 3):
+    maze.remove_subject_events_from_tile(f"Persona {i}", event_tiles[i])
+
+  for _ in range(300):
+    tile = rng.choice(tiles)
+    vision_r = rng.choice([2, 4, 8])
+    att_bandwidth = rng.choice([3, 8, None])
+    assert (maze.get_nearby_events(tile, vision_r, att_bandwidth)
+            == legacy_nearby_events(maze, tile, vision_r, att_bandwidth))
+
+
+def test__maze__subject_index_stays_consistent(maze):
+  rng = random.Random(1)
+  tiles = [(x, y) for x in range(10, 20) for y in range(10, 20)]
+  subjects = [f"Persona {i}" for i in range(5)]
+  for _ in range(500):
+    subject, tile = rng.choice(subjects), rng.choice(tiles)
+    op = rng.random()
+    if op < 0.5:
+      maze.add_event_from_tile((subject, "is", "idle", "idle"), tile)
+    elif op < 0.7:
+      maze.turn_event_from_tile_idle((subject, "is", "idle", "idle"), tile)
+    elif op < 0.85:
+      maze.remove_event_from_tile((subject, None, None, None), tile)
+    else:
+      maze.remove_subject_events_from_tile(subject, tile)
+
+  for subject in subjects:
+    expected = dict()
+    for tile, events in maze.tile_events.items():
+      subject_events = set(i for i in events if i[0] == subject)
+      if subject_events:
+        expected[tile] = subject_events
+    assert maze.subject_events.get(subject, dict()) == expected
+    assert sorted(maze.get_subject_tiles(subject)) == sorted(expected)
+  assert all(maze.tile_events.values())
+
+
+def test__maze__evict_tile_chunks(maze):
+  tile = (58, 9)
+  details = maze.access_tile(tile)
+  maze.set_tile_collision((20, 20), True)
+  maze.get_nearby_layer((120, 80), 4, "arena")
+  maze.evict_tile_chunks([tile])
+  assert len(maze.tile_chunks.chunks) <= 9 + 1
+  assert maze.access_tile((20, 20))["collision"] is True
+  maze.evict_tile_chunks([])
+  assert maze.access_tile(tile) == details
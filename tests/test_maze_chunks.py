@@ -0,0 +1,75 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+from maze_chunks import *
+
+import pytest
+
+import numpy
+
+
+@pytest.fixture
+def layers():
+  rng = numpy.random.default_rng(0)
+  return rng.integers(0, 100, size=(3, 37, 53), dtype=numpy.int32)
+
+
+@pytest.fixture
+def store(layers):
+  return ChunkStore(ChunkStore.chunk_layers(layers, 8), ["a", "b", "c"],
+                    37, 53)
+
+
+def test__chunk_store__indexing_matches_numpy(layers, store):
+  chunked = store.get_layers()
+  for i, name in enumerate(["a", "b", "c"]):
+    assert (numpy.asarray(chunked[name]) == layers[i]).all()
+    assert chunked[name].tolist() == layers[i].tolist()
+    for y, x in [(0, 0), (7, 8), (36, 52), (20, 31)]:
+      assert chunked[name][y, x] == layers[i][y, x]
+    for key in [(slice(3, 20), slice(5, 40)), (slice(30, 40), slice(50, 60)),
+                (slice(0, 0), slice(0, 5)), (4, slice(2, 9)),
+                (slice(2, 9), 4)]:
+      assert (chunked[name][key] == layers[i][key]).all()
+
+
+def test__chunk_store__loads_lazily(store):
+  chunked = store.get_layers()
+  assert store.chunks == {}
+  chunked["b"][9, 17]
+  assert set(store.chunks) == {(1, 2)}
+  chunked["a"][2:10, 0:3]
+  assert set(store.chunks) == {(0, 0), (1, 0), (1, 2)}
+  assert store.chunk_loads == 3
+
+
+def test__chunk_store__evicts_all_but_nearby_and_dirty_chunks(layers, store):
+  chunked = store.get_layers()
+  chunked["a"][0:37, 0:53]
+  assert len(store.chunks) == 5 * 7
+  chunked["c"][36, 52] = -1
+  assert store.evict(store.get_chunks_near([(3, 3)], 2)) == 5 * 7 - 2
+  assert set(store.chunks) == {(0, 0), (4, 6)}
+  assert chunked["c"][36, 52] == -1
+  assert chunked["a"][20, 20] == layers[0][20, 20]
+
+
+def test__chunk_store__whole_layer_reads_do_not_load_chunks(layers, store):
+  chunked = store.get_layers()
+  chunked["b"][9, 17] = -1
+  expected = layers[1].copy()
+  expected[9, 17] = -1
+  assert (numpy.asarray(chunked["b"]) == expected).all()
+  assert set(store.chunks) == {(1, 2)}
+
@@ -0,0 +1,172 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+from persona.memory_structures.associative_memory import *
+from persona.memory_structures.node_matrix import *
+
+import numpy as np
+import pytest
+
+import datetime
+import json
+import random
+
+
+@pytest.fixture
+def a_mem(tmp_path):
+  for name, data in [("embeddings.json", {}), ("nodes.json", {}),
+                     ("kw_strength.json", {"kw_strength_event": None,
+                                           "kw_strength_thought": None})]:
+    with open(tmp_path / name, "w") as outfile:
+      json.dump(data, outfile)
+  return AssociativeMemory(str(tmp_path))
+
+
+def fill_memory(a_mem, n, seed=0):
+  rng = random.Random(seed)
+  start = datetime.datetime(2023, 2, 13)
+  for i in range(n):
+    # Few distinct times, keys and poignancies, so that there are ties.
+    created = start + datetime.timedelta(minutes=rng.randrange(5))
+    key = f"key {rng.randrange(n // 2 + 1)}"
+    if rng.random() < 0.1:
+      key += " is idle"
+    embedding = [rng.uniform(-1, 1) for _ in range(8)]
+    add = a_mem.add_event if rng.random() < 0.7 else a_mem.add_thought
+    add(created, None, "s", "p", "o", key, set(["s"]), rng.randrange(1, 4),
+        (key, embedding), None)
+
+
+def legacy_retrieve(a_mem, focal_embedding, n_count, time, decay=0.99,
+                    gw=[0.5, 3, 2]):
+  # The dictionary based scoring that new_retrieve() used to do.
+  def normalize(d):
+    min_val, max_val = min(d.values()), max(d.values())
+    for key, val in d.items():
+      d[key] = (0.5 if max_val == min_val
+                else (val - min_val) / (max_val - min_val))
+    return d
+
+  nodes = [[i.last_accessed, i] for i in a_mem.seq_event + a_mem.seq_thought
+           if "idle" not in i.embedding_key]
+  nodes = [i for created, i in sorted(nodes, key=lambda x: x[0])]
+  recency = normalize({node.node_id: decay ** (count + 1)
+                       for count, node in enumerate(nodes)})
+  importance = normalize({node.node_id: node.poignancy for node in nodes})
+  relevance = dict()
+  for node in nodes:
+    embedding = a_mem.embeddings[node.embedding_key]
+    relevance[node.node_id] = (np.dot(embedding, focal_embedding)
+                               / (np.linalg.norm(embedding)
+                                  * np.linalg.norm(focal_embedding)))
+  relevance = normalize(relevance)
+  master = {key: recency[key]*gw[0] + relevance[key]*gw[1]
+                 + importance[key]*gw[2] for key in recency}
+  top = sorted(master.items(), key=lambda x: x[1], reverse=True)[:n_count]
+  master_nodes = [a_mem.id_to_node[key] for key, val in top]
+  for node in master_nodes:
+    node.last_accessed = time
+  return master_nodes
+
+
+def vectorized_retrieve(a_mem, focal_embeddings, n_count, time, decay=0.99,
+                        gw=[0.5, 3, 2]):
+  recency, importance, relevance = a_mem.get_retrieval_scores(
+    focal_embeddings, decay)
+  retrieved = []
+  for count in range(len(focal_embeddings)):
+    rows = a_mem.node_matrix.get_access_order()
+    master = (recency*gw[0] + relevance[count][rows]*gw[1]
+              + importance[rows]*gw[2])
+    master_nodes = [a_mem.node_matrix.nodes[rows[i]]
+                    for i in top_highest_x_indices(master, n_count)]
+    a_mem.set_last_accessed(master_nodes, time)
+    retrieved += [master_nodes]
+  return retrieved
+
+
+def test__top_highest_x_indices__keeps_tie_order():
+  values = np.array([1.0, 3.0, 2.0, 3.0, 2.0, 0.0])
+  assert top_highest_x_indices(values, 3).tolist() == [1, 3, 2]
+  assert top_highest_x_indices(values, 10).tolist() == [1, 3, 2, 4, 0, 5]
+  assert top_highest_x_indices(values, 0).tolist() == []
+
+
+def test__normalize_floats__matches_dict_version():
+  assert normalize_floats(np.array([2.0, 4.0, 3.0]), 0, 1).tolist() == [
+    0.0, 1.0, 0.5]
+  assert normalize_floats(np.array([7.0, 7.0]), 0, 1).tolist() == [0.5, 0.5]
+
+
+def test__node_matrix__skips_idle_nodes_and_shares_embeddings(a_mem):
+  fill_memory(a_mem, 200)
+  nodes = [i for i in a_mem.seq_event + a_mem.seq_thought
+           if "idle" not in i.embedding_key]
+  assert len(a_mem.node_matrix) == len(nodes)
+  assert len(a_mem.node_matrix.embedding_rows) < len(nodes)
+  for node in nodes:
+    row = a_mem.node_matrix.embedding_rows[node.embedding_key]
+    assert np.allclose(a_mem.node_matrix.embeddings[row],
+                       a_mem.embeddings[node.embedding_key], atol=1e-6)
+
+
+def test__retrieval_scores__match_legacy_retrieve(tmp_path):
+  os.makedirs(tmp_path / "legacy")
+  os.makedirs(tmp_path / "vectorized")
+  memories = []
+  for name in ["legacy", "vectorized"]:
+    for file_name, data in [("embeddings.json", {}), ("nodes.json", {}),
+                            ("kw_strength.json",
+                             {"kw_strength_event": None,
+                              "kw_strength_thought": None})]:
+      with open(tmp_path / name / file_name, "w") as outfile:
+        json.dump(data, outfile)
+    memories += [AssociativeMemory(str(tmp_path / name))]
+    fill_memory(memories[-1], 300)
+
+  rng = random.Random(1)
+  time = datetime.datetime(2023, 2, 14)
+  # Retrieving updates the last access times, which changes the recency
+  # order of the following retrievals, also within one call with several
+  # focal points.
+  for count in range(10):
+    focal_embeddings = [[rng.uniform(-1, 1) for _ in range(8)]
+                        for _ in range(1 + count % 3)]
+    time += datetime.timedelta(minutes=rng.randrange(2))
+    legacy = [legacy_retrieve(memories[0], i, 30, time)
+              for i in focal_embeddings]
+    vectorized = vectorized_retrieve(memories[1], focal_embeddings, 30, time)
+    assert ([[i.node_id for i in nodes] for nodes in legacy]
+            == [[i.node_id for i in nodes] for nodes in vectorized])
+
+
+def test__retrieval_scores__empty_memory(a_mem):
+  recency, importance, relevance = a_mem.get_retrieval_scores(
+    [[1.0, 0.0], [0.0, 1.0]], 0.99)
+  assert len(recency) == len(importance) == 0
+  assert relevance.shape == (2, 0)
+
+
+def test__node_matrix__relevance_of_several_focal_points(a_mem):
+  fill_memory(a_mem, 50)
+  focal_embeddings = [[1.0] * 8, [(-1.0) ** i for i in range(8)]]
+  relevance = a_mem.node_matrix.get_relevance(focal_embeddings)
+  assert relevance.shape == (2, len(a_mem.node_matrix))
+  for count, focal_embedding in enumerate(focal_embeddings):
+    for row, node in enumerate(a_mem.node_matrix.nodes):
+      embedding = a_mem.embeddings[node.embedding_key]
+      assert relevance[count][row] == pytest.approx(
+        np.dot(embedding, focal_embedding)
+        / (np.linalg.norm(embedding) * np.linalg.norm(focal_embedding)),
+        abs=1e-6)
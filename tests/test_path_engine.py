@@ -0,0 +1,381 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+from maze import Maze
+from path_engine import (IncrementalPlanner, PathEngine, PathPool, 
+                         _path_engines, get_path_engine)
+from path_finder import path_finder, path_finder_v2
+from persona.cognitive_modules.execute import (get_path_targets, 
+                                               repair_planned_path)
+from utils import collision_block_id
+
+import pytest
+
+import gc
+import random
+from types import SimpleNamespace
+
+
+@pytest.fixture(scope="module")
+def maze():
+  return Maze("the_ville")
+
+
+@pytest.fixture
+def small_maze():
+  return [['#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#'],
+          [' ', ' ', '#', ' ', ' ', ' ', ' ', ' ', '#', ' ', ' ', ' ', '#'],
+          ['#', ' ', '#', ' ', ' ', '#', '#', ' ', ' ', ' ', '#', ' ', '#'],
+          ['#', ' ', '#', ' ', ' ', '#', '#', ' ', '#', ' ', '#', ' ', '#'],
+          ['#', ' ', ' ', ' ', ' ', ' ', ' ', ' ', '#', ' ', ' ', ' ', '#'],
+          ['#', '#', '#', ' ', '#', ' ', '#', '#', '#', ' ', '#', ' ', '#'],
+          ['#', ' ', ' ', ' ', ' ', ' ', ' ', ' ', ' ', ' ', '#', ' ', ' '],
+          ['#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#']]
+
+
+def legacy_path_finder(maze, start, end, collision_block_char):
+  '''The pre-PathEngine path_finder, in (x, y) coordinates.'''
+  path = path_finder_v2(maze, (start[1], start[0]), (end[1], end[0]),
+                        collision_block_char)
+  return [(i[1], i[0]) for i in path]
+
+
+def free_tiles(maze):
+  return [(x, y)
+          for y in range(maze.maze_height)
+          for x in range(maze.maze_width)
+          if maze.collision_maze[y][x] != collision_block_id]
+
+
+def test__path_engine__matches_legacy_path_finder__small_maze(small_maze):
+  engine = PathEngine(small_maze, "#")
+  tiles = [(x, y) for y in range(len(small_maze))
+           for x in range(len(small_maze[0])) if small_maze[y][x] != "#"]
+  for start in tiles:
+    for end in tiles:
+      expected = legacy_path_finder(small_maze, start, end, "#")
+      assert engine.find_path(start, end) == expected
+
+
+def test__path_finder__matches_legacy_path_finder__the_ville(maze):
+  rng = random.Random(0)
+  tiles = free_tiles(maze)
+  for _ in range(50):
+    start, end = rng.choice(tiles), rng.choice(tiles)
+    expected = legacy_path_finder(maze.collision_maze, start, end,
+                                  collision_block_id)
+    # The legacy wavefront gave up after 150 levels; only compare paths it
+    # actually found.
+    if len(expected) == 1 and start != end:
+      continue
+    path = path_finder(maze.collision_maze, start, end, collision_block_id)
+    assert path == expected
+
+
+def test__path_finder__is_not_capped(maze):
+  engine = maze.path_engine
+  tiles = free_tiles(maze)
+  dist = engine.bfs([tiles[0]])
+  far_index = max(range(len(dist)), key=lambda i: dist[i])
+  far_tile = engine.to_tile(far_index)
+  assert dist[far_index] > 150
+
+  path = path_finder(maze.collision_maze, tiles[0], far_tile,
+                     collision_block_id)
+  assert len(path) == dist[far_index] + 1
+  assert path[0] == tiles[0] and path[-1] == far_tile
+
+
+def test__path_finder__unreachable_returns_end_tile(small_maze):
+  # (0, 0) is a collision block, so it can never be reached.
+  assert path_finder(small_maze, (0, 1), (0, 0), "#") == [(0, 0)]
+
+
+def test__get_path_engine__is_shared_while_alive(small_maze):
+  engine = get_path_engine(small_maze, "#")
+  assert get_path_engine(small_maze, "#") is engine
+  assert get_path_engine([list(i) for i in small_maze], "#") is not engine
+
+  # Nothing keeps an engine alive but its users.
+  del engine
+  gc.collect()
+  assert (id(small_maze), "#") not in _path_engines
+
+
+def test__maze__get_path_to_address__matches_closest_target(maze):
+  rng = random.Random(2)
+  tiles = free_tiles(maze)
+  addresses = sorted(maze.address_tiles.keys())
+  for _ in range(20):
+    address, start = rng.choice(addresses), rng.choice(tiles)
+    paths = [maze.path_engine.find_path(start, i)
+             for i in maze.address_tiles[address]]
+    paths = [i for i in paths if i]
+
+    path = maze.get_path_to_address(start, address)
+    if not paths:
+      assert path == []
+      continue
+    assert len(path) == min(len(i) for i in paths)
+    assert path[0] == start
+    assert path[-1] in maze.address_tiles[address]
+
+
+def test__maze__precomputes_distance_fields(maze):
+  assert set(maze.distance_fields) == set(maze.address_tiles)
+
+
+def test__get_path_targets__follows_distance_field(maze):
+  rng = random.Random(3)
+  tiles = free_tiles(maze)
+  addresses = sorted(i for i in maze.address_tiles if not i.startswith("<"))
+  for _ in range(20):
+    address, start = rng.choice(addresses), rng.choice(tiles)
+    persona = SimpleNamespace(scratch=SimpleNamespace(curr_tile=start))
+    target_tiles, path = get_path_targets(persona, maze, dict(), address)
+    if path is None:
+      continue
+    assert path == maze.get_path_to_address(start, address)
+    assert target_tiles == [path[-1]]
+
+
+def legacy_closest_target(maze, curr_tile, target_tiles):
+  '''The per-target path_finder loop that execute() used to run.'''
+  closest_target_tile = None
+  path = None
+  for i in target_tiles:
+    curr_path = legacy_path_finder(maze.collision_maze, curr_tile, i,
+                                   collision_block_id)
+    if not closest_target_tile:
+      closest_target_tile = i
+      path = curr_path
+    elif len(curr_path) < len(path):
+      closest_target_tile = i
+      path = curr_path
+  return closest_target_tile, path
+
+
+def legacy_meeting_point(maze, curr_tile, target_p_tile):
+  '''The three path_finder calls that execute() used for <persona> plans.'''
+  potential_path = legacy_path_finder(maze.collision_maze, curr_tile,
+                                      target_p_tile, collision_block_id)
+  if len(potential_path) <= 2:
+    return potential_path[0]
+  mid = int(len(potential_path)/2)
+  potential_1 = legacy_path_finder(maze.collision_maze, curr_tile,
+                                   potential_path[mid], collision_block_id)
+  potential_2 = legacy_path_finder(maze.collision_maze, curr_tile,
+                                   potential_path[mid+1], collision_block_id)
+  if len(potential_1) <= len(potential_2):
+    return potential_path[mid]
+  return potential_path[mid+1]
+
+
+def test__path_engine__find_nearest_path__matches_legacy_execute(maze):
+  rng = random.Random(3)
+  tiles = free_tiles(maze)
+  addresses = sorted(i for i in maze.address_tiles.keys() if i.count(":") == 3)
+  compared = 0
+  while compared < 25:
+    start = rng.choice(tiles)
+    targets = list(maze.address_tiles[rng.choice(addresses)])
+    targets = rng.sample(targets, min(4, len(targets)))
+    # Only compare cases where every target is reachable within the old
+    # wavefront's 150-level cap; otherwise the legacy loop picks unreachable
+    # targets because their one-tile fallback path looks shortest.
+    paths = [maze.path_engine.find_path(start, i) for i in targets]
+    if not all(paths) or max(len(i) for i in paths) > 150:
+      continue
+    compared += 1
+    expected = legacy_closest_target(maze, start, targets)
+    assert maze.path_engine.find_nearest_path(start, targets) == expected
+
+
+def test__path_engine__find_meeting_point__matches_legacy_execute(maze):
+  rng = random.Random(4)
+  tiles = free_tiles(maze)
+  compared = 0
+  while compared < 25:
+    start, end = rng.choice(tiles), rng.choice(tiles)
+    if not 0 < len(maze.path_engine.find_path(start, end)) <= 150:
+      continue
+    compared += 1
+    expected_tile = legacy_meeting_point(maze, start, end)
+    expected_path = legacy_path_finder(maze.collision_maze, start,
+                                       expected_tile, collision_block_id)
+    meeting_tile, path = maze.path_engine.find_meeting_point(start, end)
+    assert meeting_tile == expected_tile
+    assert path == expected_path
+
+
+def check_planner_path(engine, planner, start, goal):
+  path = planner.find_path()
+  expected = engine.find_path(start, goal)
+  assert len(path) == len(expected)
+  if path:
+    assert path[0] == start and path[-1] == goal
+    for a, b in zip(path, path[1:]):
+      assert abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1
+      assert engine.is_passable(b)
+
+
+def test__incremental_planner__matches_bfs_under_changes(maze):
+  # Work on a copy, since the planner test changes collisions.
+  engine = PathEngine([list(i) for i in maze.collision_maze],
+                      collision_block_id)
+  rng = random.Random(5)
+  tiles = free_tiles(maze)
+  start, goal = rng.choice(tiles), rng.choice(tiles)
+  planner = IncrementalPlanner(engine, start, goal)
+  check_planner_path(engine, planner, start, goal)
+  for _ in range(40):
+    roll = rng.random()
+    if roll < 0.4:
+      path = engine.find_path(start, goal)
+      if len(path) > 1:
+        start = path[1]
+        planner.move_start(start)
+    elif roll < 0.6:
+      goal = rng.choice(tiles)
+      planner.move_goal(goal)
+    else:
+      path = engine.find_path(start, goal)
+      if len(path) > 3:
+        engine.set_collision(path[len(path) // 2], True)
+      else:
+        engine.set_collision(rng.choice(tiles), False)
+    check_planner_path(engine, planner, start, goal)
+
+
+def test__repair_planned_path__only_retargets_when_target_moves(maze):
+  tiles = free_tiles(maze)
+  start, target_tile = tiles[0], tiles[-1]
+  target = SimpleNamespace(scratch=SimpleNamespace(curr_tile=target_tile))
+  _, path = maze.path_engine.find_meeting_point(start, target_tile)
+  scratch = SimpleNamespace(curr_tile=start, planned_path=path[1:],
+                            path_planner=None, 
+                            planned_path_version=maze.path_engine.version,
+                            planned_path_goal=target_tile)
+  persona = SimpleNamespace(scratch=scratch)
+  personas = {"Target": target}
+  plan = "<persona> Target"
+
+  # The target has not moved, so the path is kept as it is.
+  repair_planned_path(persona, maze, personas, plan)
+  assert scratch.path_planner is None
+  assert scratch.planned_path == path[1:]
+
+  target.scratch.curr_tile = tiles[-2]
+  repair_planned_path(persona, maze, personas, plan)
+  _, expected = maze.path_engine.find_meeting_point(start, tiles[-2])
+  assert scratch.path_planner is not None
+  assert scratch.planned_path_goal == tiles[-2]
+  assert len(scratch.planned_path) == len(expected) - 1
+
+
+def test__maze__set_tile_collision__updates_engine():
+  maze = Maze("the_ville")
+  tile = free_tiles(maze)[0]
+  version = maze.path_engine.version
+  maze.set_tile_collision(tile, True)
+  assert not maze.path_engine.is_passable(tile)
+  assert maze.path_engine.version == version + 1
+  assert maze.distance_fields == dict()
+  maze.set_tile_collision(tile, False)
+  assert maze.path_engine.is_passable(tile)
+
+
+def test__path_engine__path_cache(small_maze):
+  engine = PathEngine(small_maze, "#", path_cache_size=2)
+  path = engine.find_path((0, 1), (12, 6))
+  assert engine.find_path((0, 1), (12, 6)) == path
+  assert engine.path_cache_hits == 1 and engine.path_cache_misses == 1
+
+  # A start on the cached path reuses the rest of it.
+  assert engine.find_path(path[5], (12, 6)) == path[5:]
+  assert engine.path_cache_subpath_hits == 1
+
+  # The least recently used entry is evicted once the cache is full.
+  engine.find_path((3, 1), (9, 1))
+  engine.find_path((1, 4), (9, 1))
+  assert engine.path_cache_stats()["size"] == 2
+  engine.find_path((0, 1), (12, 6))
+  assert engine.path_cache_misses == 4
+
+  # Changing the collision grid invalidates the cache.
+  engine.set_collision(path[3], True)
+  new_path = engine.find_path((0, 1), (12, 6))
+  assert path[3] not in new_path
+  assert engine.path_cache_misses == 5
+
+
+def test__path_engine__path_cache__returns_copies(small_maze):
+  engine = PathEngine(small_maze, "#")
+  path = engine.find_path((0, 1), (12, 6))
+  path.pop()
+  assert engine.find_path((0, 1), (12, 6))[-1] == (12, 6)
+
+
+def test__path_engine__find_nearest_path__uses_path_cache(small_maze):
+  engine = PathEngine(small_maze, "#")
+  goals = [(12, 6), (11, 1)]
+  goal, path = engine.find_nearest_path((0, 1), goals)
+  assert engine.find_nearest_path((0, 1), goals[::-1]) == (goal, path)
+  assert engine.path_cache_hits == 1 and engine.path_cache_misses == 1
+
+  # A start on the cached path reuses the rest of it, in batches too.
+  results = engine.find_nearest_paths([(path[3], goals), ((0, 1), goals)])
+  assert results == [(goal, path[3:]), (goal, path)]
+  assert engine.path_cache_subpath_hits == 1 and engine.path_cache_hits == 2
+
+  # Batched paths are cached for later queries.
+  engine = PathEngine(small_maze, "#")
+  results = engine.find_nearest_paths([((3, 1), goals), ((1, 4), goals)])
+  assert engine.path_cache_misses == 2
+  assert engine.find_nearest_path((1, 4), goals) == results[1]
+  assert engine.path_cache_hits == 1
+
+
+def batch_requests(maze, seed):
+  rng = random.Random(seed)
+  tiles = free_tiles(maze)
+  addresses = sorted(i for i in maze.address_tiles.keys() if i.count(":") == 3)
+  goal_sets = [list(maze.address_tiles[rng.choice(addresses)])
+               for _ in range(3)]
+  return [(rng.choice(tiles), rng.choice(goal_sets)) for _ in range(12)]
+
+
+def check_batch_results(maze, requests, results):
+  assert len(results) == len(requests)
+  for (start, goals), (goal, path) in zip(requests, results):
+    expected_goal, expected = maze.path_engine.find_nearest_path(start, goals)
+    assert len(path) == len(expected)
+    if path:
+      assert goal in goals and path[0] == start and path[-1] == goal
+
+
+def test__path_engine__find_nearest_paths(maze):
+  requests = batch_requests(maze, 6)
+  results = maze.path_engine.find_nearest_paths(requests)
+  check_batch_results(maze, requests, results)
+
+
+def test__path_engine__find_nearest_paths__pool(maze):
+  requests = batch_requests(maze, 7)
+  pool = PathPool(maze.path_engine, 2)
+  try:
+    results = maze.path_engine.find_nearest_paths(requests, pool)
+  finally:
+    pool.close()
+  check_batch_results(maze, requests, results)
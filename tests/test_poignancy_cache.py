@@ -0,0 +1,95 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+import poignancy_cache as pc
+
+import pytest
+
+from types import SimpleNamespace
+
+
+def make_persona(iss):
+  return SimpleNamespace(scratch=SimpleNamespace(get_str_iss=lambda: iss))
+
+
+def test__poignancy_cache__make_key():
+  key = pc.PoignancyCache.make_key("event", "Name: A", "bed is  being used")
+  assert key == pc.PoignancyCache.make_key("event", "Name: A",
+                                           "Bed is being used ")
+  assert key != pc.PoignancyCache.make_key("chat", "Name: A",
+                                           "bed is being used")
+  assert key != pc.PoignancyCache.make_key("event", "Name: B",
+                                           "bed is being used")
+
+
+def test__poignancy_cache__lru_and_stats():
+  cache = pc.PoignancyCache(max_size=2)
+  cache.put("a", 1)
+  cache.put("b", 2)
+  assert cache.get("a") == 1
+  cache.put("c", 3)
+  assert cache.get("b") is None
+  assert cache.get("a") == 1 and cache.get("c") == 3
+  assert cache.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 1,
+                           "hit_rate": 0.75}
+
+
+def test__poignancy_cache__save_merges(tmp_path):
+  cache_file = str(tmp_path / "cache.json")
+  first = pc.PoignancyCache()
+  first.put("a", 1)
+  first.save(cache_file)
+  second = pc.PoignancyCache()
+  second.put("b", 2)
+  second.save(cache_file)
+  third = pc.PoignancyCache()
+  third.load(cache_file)
+  assert dict(third.entries) == {"a": 1, "b": 2}
+
+
+def test__get_cached_poignancies(monkeypatch):
+  monkeypatch.setattr(pc, "poignancy_cache", pc.PoignancyCache())
+  calls = []
+  def score_func(descriptions):
+    calls.append(list(descriptions))
+    return [len(i) for i in descriptions]
+  persona = make_persona("Name: A")
+  assert pc.get_cached_poignancies(persona, "event", ["ab", "abc"],
+                                   score_func) == [2, 3]
+  assert pc.get_cached_poignancies(persona, "event", ["abc", "abcd"],
+                                   score_func) == [3, 4]
+  assert calls == [["ab", "abc"], ["abcd"]]
+  assert pc.get_cached_poignancy(make_persona("Name: B"), "event", "ab",
+                                 lambda i: 7) == 7
+
+
+def test__prefetch_poignancies(monkeypatch):
+  monkeypatch.setattr(pc, "poignancy_cache", pc.PoignancyCache())
+  calls = []
+  def score_func(items):
+    calls.append([description for persona, description in items])
+    return [len(description) for persona, description in items]
+  a, b = make_persona("Name: A"), make_persona("Name: B")
+  assert pc.prefetch_poignancies("event", [(a, "ab"), (b, "ab"), (a, "ab")],
+                                 score_func) == 2
+  assert pc.prefetch_poignancies("event", [(a, "ab"), (b, "abc")],
+                                 score_func) == 1
+  assert calls == [["ab", "ab"], ["abc"]]
+
+  # The scores are then read from the cache.
+  assert pc.get_cached_poignancies(a, "event", ["ab"], score_func) == [2]
+  assert pc.get_cached_poignancies(b, "event", ["ab", "abc"],
+                                   score_func) == [2, 3]
+  assert len(calls) == 2
+  assert pc.poignancy_cache.stats()["misses"] == 0
@@ -0,0 +1,61 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+import query_embedding_cache as qec
+
+import numpy as np
+import pytest
+
+
+def test__query_embedding_cache__lru_and_stats():
+  cache = qec.QueryEmbeddingCache(max_size=2)
+  cache.put(("ada", "a"), [1.0])
+  cache.put(("ada", "b"), [2.0])
+  assert cache.get(("ada", "a")).tolist() == [1.0]
+  cache.put(("ada", "c"), [3.0])
+  assert cache.get(("ada", "b")) is None
+  assert cache.get(("other", "a")) is None
+  assert cache.stats() == {"size": 2, "max_size": 2, "hits": 1, "misses": 2,
+                           "hit_rate": 1 / 3}
+
+
+def test__query_embedding_cache__save_merges(tmp_path):
+  cache_file = str(tmp_path / "cache.npz")
+  first = qec.QueryEmbeddingCache()
+  first.put(("ada", "a"), [1.0, 0.0])
+  first.save(cache_file)
+  second = qec.QueryEmbeddingCache()
+  second.put(("ada", "b"), [0.0, 1.0])
+  second.save(cache_file)
+  third = qec.QueryEmbeddingCache()
+  third.load(cache_file)
+  assert list(third.entries.keys()) == [("ada", "a"), ("ada", "b")]
+  assert third.get(("ada", "b")).tolist() == [0.0, 1.0]
+  assert not os.path.exists(f"{cache_file}.{os.getpid()}.tmp")
+
+
+def test__get_cached_query_embeddings(monkeypatch):
+  monkeypatch.setattr(qec, "query_embedding_cache", qec.QueryEmbeddingCache())
+  calls = []
+  def embed_func(texts):
+    calls.append(list(texts))
+    return [[float(len(i))] for i in texts]
+  embeddings = qec.get_cached_query_embeddings(["Maria", "Isabella"], "ada",
+                                               embed_func)
+  assert [i.tolist() for i in embeddings] == [[5.0], [8.0]]
+  embeddings = qec.get_cached_query_embeddings(["Isabella", "Klaus"], "ada",
+                                               embed_func)
+  assert [i.tolist() for i in embeddings] == [[8.0], [5.0]]
+  qec.get_cached_query_embeddings(["Klaus"], "other", embed_func)
+  assert calls == [["Maria", "Isabella"], ["Klaus"], ["Klaus"]]
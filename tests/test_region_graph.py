@@ -0,0 +1,92 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+from maze import Maze
+from path_engine import PathEngine
+from region_graph import RegionGraph
+from utils import collision_block_id
+
+import pytest
+
+import random
+
+
+@pytest.fixture(scope="module")
+def maze():
+  return Maze("the_ville")
+
+
+def free_tiles(maze):
+  return [(x, y)
+          for y in range(maze.maze_height)
+          for x in range(maze.maze_width)
+          if maze.collision_maze[y][x] != collision_block_id]
+
+
+def check_path(engine, path, start, end):
+  assert path[0] == start and path[-1] == end
+  for a, b in zip(path, path[1:]):
+    assert abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1
+    assert engine.is_passable(b)
+
+
+def test__region_graph__finds_near_shortest_paths(maze):
+  graph = maze.get_region_graph()
+  rng = random.Random(0)
+  tiles = free_tiles(maze)
+  for _ in range(100):
+    start, end = rng.choice(tiles), rng.choice(tiles)
+    expected = maze.path_engine.find_path(start, end)
+    path = graph.find_path(start, end)
+    assert bool(path) == bool(expected)
+    if path:
+      check_path(maze.path_engine, path, start, end)
+      assert len(expected) <= len(path) <= 1.5 * len(expected)
+
+
+def test__region_graph__find_nearest_path(maze):
+  graph = maze.get_region_graph()
+  rng = random.Random(1)
+  tiles = free_tiles(maze)
+  for _ in range(25):
+    start = rng.choice(tiles)
+    goals = rng.sample(tiles, 3)
+    goal, path = graph.find_nearest_path(start, goals)
+    expected_goal, expected = maze.path_engine.find_nearest_path(start, goals)
+    assert bool(path) == bool(expected)
+    if path:
+      assert goal in goals
+      check_path(maze.path_engine, path, start, goal)
+
+
+def test__region_graph__follows_collision_changes(maze):
+  engine = PathEngine([list(i) for i in maze.collision_maze],
+                      collision_block_id)
+  graph = RegionGraph(engine, maze.get_region_graph().region_maze)
+  start, end = (60, 20), (100, 70)
+  path = graph.find_path(start, end)
+  blocked = path[len(path) // 2]
+  engine.set_collision(blocked, True)
+  path = graph.find_path(start, end)
+  assert blocked not in path
+  check_path(engine, path, start, end)
+
+
+def test__maze__find_nearest_path__small_maps_are_exact(maze):
+  rng = random.Random(2)
+  tiles = free_tiles(maze)
+  for _ in range(10):
+    start, goals = rng.choice(tiles), rng.sample(tiles, 3)
+    assert (maze.find_nearest_path(start, goals)
+            == maze.path_engine.find_nearest_path(start, goals))
@@ -0,0 +1,50 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+import retrieval_trace as rt
+
+import json
+import pytest
+
+
+def test__ring_buffer_trace_sink__keeps_last_records():
+  sink = rt.RingBufferTraceSink(2)
+  for i in range(3):
+    sink.write({"focal_pt": str(i)})
+  assert sink.get_records() == [{"focal_pt": "1"}, {"focal_pt": "2"}]
+
+
+def test__jsonl_trace_sink__appends_lines(tmp_path):
+  trace_file = str(tmp_path / "traces" / "trace.jsonl")
+  sink = rt.JSONLTraceSink(trace_file)
+  sink.write({"focal_pt": "a", "timings": {"score": 0.5}})
+  sink.write({"focal_pt": "b"})
+  sink.close()
+  with open(trace_file) as infile:
+    assert [json.loads(i) for i in infile] == [
+      {"focal_pt": "a", "timings": {"score": 0.5}}, {"focal_pt": "b"}]
+
+
+def test__make_and_set_retrieval_trace_sink(monkeypatch):
+  assert rt.make_retrieval_trace_sink(None) is None
+  assert isinstance(rt.make_retrieval_trace_sink("ring"),
+                    rt.RingBufferTraceSink)
+  with pytest.raises(ValueError):
+    rt.make_retrieval_trace_sink("stdout")
+
+  monkeypatch.setattr(rt, "retrieval_trace_sink", None)
+  sink = rt.RingBufferTraceSink(1)
+  assert rt.set_retrieval_trace_sink(sink) is None
+  assert rt.retrieval_trace_sink is sink
+  assert rt.set_retrieval_trace_sink(None) is sink
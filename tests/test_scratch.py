@@ -0,0 +1,43 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+from persona.memory_structures.scratch import Scratch
+
+import datetime
+
+
+def make_scratch(curr_time):
+  scratch = Scratch("/nonexistent/scratch.json")
+  scratch.act_address = "the Ville:Hobbs Cafe:cafe:cafe customer seating"
+  scratch.act_start_time = datetime.datetime(2023, 2, 13, 9, 0, 0)
+  scratch.act_duration = 30
+  scratch.curr_time = curr_time
+  return scratch
+
+
+def test__act_check_finished__at_end_time():
+  scratch = make_scratch(datetime.datetime(2023, 2, 13, 9, 30, 0))
+  assert scratch.act_check_finished()
+
+
+def test__act_check_finished__before_end_time():
+  scratch = make_scratch(datetime.datetime(2023, 2, 13, 9, 29, 50))
+  assert not scratch.act_check_finished()
+
+
+def test__act_check_finished__coarse_step_past_end_time():
+  # With a 60 second step, 9:29:50 is followed by 9:30:50; the action must
+  # still be seen as finished.
+  scratch = make_scratch(datetime.datetime(2023, 2, 13, 9, 30, 50))
+  assert scratch.act_check_finished()
@@ -0,0 +1,79 @@
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+import os
+import sys
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+log.debug(f'{project_dir=}')
+
+backend_server_loc = os.path.abspath(f"{project_dir}/reverie/backend_server")
+sys.path.insert(0, backend_server_loc)
+
+
+from maze import Maze
+from persona.memory_structures.spatial_memory import MemoryTree
+
+import pytest
+
+import json
+import random
+
+
+@pytest.fixture(scope="module")
+def maze():
+  return Maze("the_ville")
+
+
+def legacy_learn(tree, maze, curr_tile, vision_r):
+  '''The tile walk that perceive() used to do.'''
+  for i in maze.get_nearby_tiles(curr_tile, vision_r):
+    i = maze.access_tile(i)
+    if i["world"]:
+      if (i["world"] not in tree):
+        tree[i["world"]] = {}
+    if i["sector"]:
+      if (i["sector"] not in tree[i["world"]]):
+        tree[i["world"]][i["sector"]] = {}
+    if i["arena"]:
+      if (i["arena"] not in tree[i["world"]][i["sector"]]):
+        tree[i["world"]][i["sector"]][i["arena"]] = []
+    if i["game_object"]:
+      if (i["game_object"] not in tree[i["world"]][i["sector"]]
+                                                  [i["arena"]]):
+        tree[i["world"]][i["sector"]][i["arena"]] += [i["game_object"]]
+
+
+def test__memory_tree__learn_nearby_tiles__matches_legacy_walk(maze, tmp_path):
+  rng = random.Random(0)
+  s_mem = MemoryTree(str(tmp_path / "missing.json"))
+  legacy_tree = dict()
+  x, y = 72, 14
+  for step in range(400):
+    if step % 50 == 0:
+      # A jump, like a persona placed somewhere else.
+      x = rng.randrange(maze.maze_width)
+      y = rng.randrange(maze.maze_height)
+    else:
+      dx, dy = rng.choice([(0, 1), (1, 0), (0, -1), (-1, 0), (2, 0)])
+      x = min(max(x + dx, 0), maze.maze_width - 1)
+      y = min(max(y + dy, 0), maze.maze_height - 1)
+    s_mem.learn_nearby_tiles(maze, (x, y), 4)
+    legacy_learn(legacy_tree, maze, (x, y), 4)
+    assert s_mem.tree == legacy_tree
+
+  s_mem.save(str(tmp_path / "spatial_memory.json"))
+  with open(tmp_path / "spatial_memory.json") as infile:
+    assert json.dumps(json.load(infile)) == json.dumps(legacy_tree)
+
+
+def test__memory_tree__learn_tile__keeps_loaded_objects(tmp_path):
+  saved = {"the Ville": {"Hobbs Cafe": {"cafe": ["counter", "piano"]}}}
+  with open(tmp_path / "spatial_memory.json", "w") as outfile:
+    json.dump(saved, outfile)
+  s_mem = MemoryTree(str(tmp_path / "spatial_memory.json"))
+  s_mem.learn_tile("the Ville", "Hobbs Cafe", "cafe", "piano")
+  s_mem.learn_tile("the Ville", "Hobbs Cafe", "cafe", "sofa")
+  assert s_mem.tree["the Ville"]["Hobbs Cafe"]["cafe"] == ["counter", "piano",
+                                                           "sofa"]